@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Compares the time to fit and transform, and the LRs, of
+`BinnedKDECalibrator` and `lir.KDECalibrator` for growing numbers of
+(simulated) scores. The exact KDE is skipped for more than --max-exact
+scores, since it takes too long.
+"""
+import argparse
+import time
+
+import numpy as np
+from lir import KDECalibrator
+
+from lr_face.calibrators import BinnedKDECalibrator
+
+
+def simulate_scores(n: int, rng: np.random.Generator):
+    y = (rng.random(n) < .3).astype(int)
+    X = np.clip(rng.normal(.35 + .3 * y, .15), 0, 1)
+    return X, y
+
+
+def time_calibrator(calibrator, X, y, scores):
+    start = time.perf_counter()
+    calibrator.fit(X, y)
+    fit_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    lrs = calibrator.transform(scores.copy())
+    return fit_seconds, time.perf_counter() - start, lrs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument('--max-exact', type=int, default=10 ** 4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{"scores":>10} {"binned fit":>12} {"transform":>12} '
+          f'{"exact fit":>12} {"transform":>12} {"max |dlog10 LR|":>16}')
+    for n in args.sizes:
+        X, y = simulate_scores(n, rng)
+        # Transform as many scores as there are calibration scores.
+        scores, _ = simulate_scores(n, rng)
+        binned = time_calibrator(BinnedKDECalibrator(), X, y, scores)
+        exact = (np.nan, np.nan, None)
+        error = np.nan
+        if n <= args.max_exact:
+            exact = time_calibrator(KDECalibrator(), X, y, scores)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                difference = np.abs(np.log10(binned[2]) - np.log10(exact[2]))
+            error = np.nanmax(difference)
+        print(f'{n:>10} {binned[0]:>12.4f} {binned[1]:>12.4f} '
+              f'{exact[0]:>12.4f} {exact[1]:>12.4f} {error:>16.2e}')
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Callable
+
+from lr_face.data import FaceImage
+from lr_face.utils import get_file_key, get_tmp_path
+
+ATTRIBUTES_DIR = 'attributes'
+
+
+def _quality_scores(images: List[FaceImage]) -> List[float]:
+    from lr_face.quality import get_quality_scorer
+    return get_quality_scorer().score(images).tolist()
+
+
+def _quality_score_version() -> str:
+    from lr_face.quality import get_quality_scorer_id
+    return get_quality_scorer_id()
+
+
+# Attributes for which a faster implementation exists that computes them for
+# a whole batch of images at once.
+BATCH_ATTRIBUTES: Dict[str, Callable[[List[FaceImage]], List[Any]]] = {
+    'quality_score': _quality_scores,
+}
+
+# Attributes that depend on more than the image itself, e.g. on a model. Their
+# values are persisted per version, which changes whenever any of that does.
+ATTRIBUTE_VERSIONS: Dict[str, Callable[[], str]] = {
+    'quality_score': _quality_score_version,
+}
+
+
+def is_derived(prop: str) -> bool:
+    """
+    Returns whether `prop` is computed from the image rather than stored as
+    an annotation on the `FaceImage`.
+
+    :param prop: str
+    :return: bool
+    """
+    return isinstance(getattr(FaceImage, prop, None), property)
+
+
+def get_category_inputs_id(images: Iterable[FaceImage],
+                           properties: List[str]) -> str:
+    """
+    Returns a hash of everything the values of the `properties` of `images`
+    depend on, and therefore the categories the images are assigned to: the
+    annotations, and for derived properties the file of each image (see
+    `get_file_key()`) and the version of the property, if it has one (see
+    `ATTRIBUTE_VERSIONS`). The order of the images does not matter.
+
+    :param images: Iterable[FaceImage]
+    :param properties: List[str]
+    :return: str
+    """
+    derived = [prop for prop in properties if is_derived(prop)]
+    annotations = [prop for prop in properties if prop not in derived]
+    versions = [f'{prop}={ATTRIBUTE_VERSIONS[prop]()}'
+                for prop in derived if prop in ATTRIBUTE_VERSIONS]
+    digest = hashlib.md5(';'.join([*properties, *versions]).encode())
+    lines = set()
+    for image in images:
+        inputs = [get_file_key(image.path) if derived else image.path]
+        inputs += [repr(getattr(image, prop)) for prop in annotations]
+        lines.add(';'.join(inputs))
+    for line in sorted(lines):
+        digest.update(f'{line}\n'.encode())
+    return digest.hexdigest()
+
+
+class AttributeTable:
+    """
+    A table with the values of the `properties` of `FaceImage`s that are used
+    to assign images to calibration categories (see the `calibration_filters`
+    in `PARAMS`).
+
+    Annotations that are stored directly on a `FaceImage` (e.g. `yaw`) are
+    simply read from the image. Derived attributes (e.g. `resolution_bin` or
+    `quality_score`) require decoding the image or running a model, so they
+    are computed once per image by `compute()`, in parallel, and persisted to
+    disk per attribute (and per version, see `ATTRIBUTE_VERSIONS`). After
+    that, looking up an attribute is a dictionary lookup. Values are keyed by
+    the path, size and modification time of the image (see `get_file_key()`),
+    so an image that is edited or replaced is computed again.
+
+    If `compute_missing` is False, derived properties that have not been
+    computed before are None rather than computed on the fly, so that the
+    table can be used without decoding any image or loading any model.
+    """
+
+    def __init__(self,
+                 properties: Iterable[str],
+                 cache_dir: Optional[str] = ATTRIBUTES_DIR,
+                 compute_missing: bool = True):
+        self.properties = sorted(set(properties))
+        self.cache_dir = cache_dir
+        self.compute_missing = compute_missing
+        self._values: Dict[str, Dict[str, Any]] = dict()
+        self._keys: Dict[str, str] = dict()
+
+        # The properties that are computed from the image rather than stored
+        # as an annotation on the `FaceImage`.
+        self.derived_properties = [
+            prop for prop in self.properties if is_derived(prop)]
+
+    def compute(self,
+                images: Iterable[FaceImage],
+                n_jobs: Optional[int] = None):
+        """
+        Computes all derived properties for all `images` that have not been
+        computed before and persists the results. Attributes are computed on a
+        pool of `n_jobs` threads, or in batches if a batch implementation is
+        available in `BATCH_ATTRIBUTES`.
+
+        :param images: Iterable[FaceImage]
+        :param n_jobs: Optional[int], defaults to the number of processors
+        """
+        images = list({image.path: image for image in images}.values())
+        for prop in self.derived_properties:
+            values = self._load(prop)
+            missing = [image for image in images
+                       if self._key(image) not in values]
+            if not missing:
+                continue
+            if prop in BATCH_ATTRIBUTES:
+                results = BATCH_ATTRIBUTES[prop](missing)
+            else:
+                with ThreadPoolExecutor(n_jobs) as executor:
+                    results = list(executor.map(
+                        lambda image: getattr(image, prop), missing))
+            values.update(zip(map(self._key, missing), results))
+            self._save(prop)
+
+    def get(self, image: FaceImage, prop: str) -> Any:
+        """
+        Returns the value of `prop` for `image`. Derived properties that have
+        not been computed yet are computed on the fly.
+
+        :param image: FaceImage
+        :param prop: str
+        :return: Any
+        """
+        if prop not in self.derived_properties:
+            return getattr(image, prop)
+        values = self._load(prop)
+        key = self._key(image)
+        if key not in values:
+            if not self.compute_missing:
+                return None
+            values[key] = getattr(image, prop)
+        return values[key]
+
+    def get_values_for_categories(self,
+                                  image: FaceImage,
+                                  properties: List[str]) -> Tuple:
+        return tuple(self.get(image, prop) for prop in properties)
+
+    def _key(self, image: FaceImage) -> str:
+        # The file is only looked at once per table.
+        if image.path not in self._keys:
+            self._keys[image.path] = get_file_key(image.path)
+        return self._keys[image.path]
+
+    def _cache_path(self, prop: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        if prop in ATTRIBUTE_VERSIONS:
+            version = ATTRIBUTE_VERSIONS[prop]()
+            return os.path.join(self.cache_dir, f'{prop}_{version}.obj')
+        return os.path.join(self.cache_dir, f'{prop}.obj')
+
+    def _load(self, prop: str) -> Dict[str, Any]:
+        if prop not in self._values:
+            self._values[prop] = dict()
+            path = self._cache_path(prop)
+            if path and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    self._values[prop] = pickle.load(f)
+        return self._values[prop]
+
+    def _save(self, prop: str):
+        path = self._cache_path(prop)
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = get_tmp_path(path)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self._values[prop], f)
+        os.replace(tmp_path, path)
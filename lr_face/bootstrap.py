@@ -0,0 +1,157 @@
+"""
+Bootstrap estimates of the run-to-run variation of the metrics of an
+experiment. Rather than repeating the whole experiment, the pairs are scored
+once, after which the calibration and test scores are resampled (with
+replacement, within each category) and the calibrators are refitted on each
+resample. The spread of the metrics over the resamples gives a confidence
+interval per metric.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Tuple, List, Optional
+
+import numpy as np
+from sklearn.base import BaseEstimator, clone
+from sklearn.metrics import roc_auc_score, accuracy_score
+
+BOOTSTRAP_METRICS = ['cllr', 'auc', 'accuracy']
+
+# The valid scores and corresponding labels per category.
+ScoresAndLabels = Dict[Tuple, Tuple[np.ndarray, np.ndarray]]
+
+
+def fit_and_evaluate(calibrator: BaseEstimator,
+                     calibration_data: ScoresAndLabels,
+                     test_data: ScoresAndLabels,
+                     rng: Optional[np.random.Generator] = None) \
+        -> Dict[str, float]:
+    """
+    Fits a copy of `calibrator` per category on the calibration scores and
+    returns the metrics of the resulting LRs on the test scores. If an `rng`
+    is given, the scores of each category are first resampled with
+    replacement. Categories whose calibration scores contain only one class
+    are skipped, like in a normal experiment.
+
+    :param calibrator: BaseEstimator
+    :param calibration_data: ScoresAndLabels
+    :param test_data: ScoresAndLabels
+    :param rng: Optional[np.random.Generator]
+    :return: Dict[str, float]
+    """
+    scores, lrs, y = [], [], []
+    for category, (X_cal, y_cal) in calibration_data.items():
+        if category not in test_data:
+            continue
+        X_test, y_test = test_data[category]
+        if rng is not None:
+            X_cal, y_cal = _resample(X_cal, y_cal, rng)
+            X_test, y_test = _resample(X_test, y_test, rng)
+        if not 0 < np.sum(y_cal) < len(y_cal):
+            continue
+        fitted = clone(calibrator).fit(X=X_cal, y=y_cal)
+        scores.append(X_test)
+        lrs.append(fitted.transform(X_test))
+        y.append(y_test)
+    if not scores:
+        return {metric: np.nan for metric in BOOTSTRAP_METRICS}
+    return _calculate_metrics(np.concatenate(scores),
+                              np.concatenate(lrs),
+                              np.concatenate(y))
+
+
+def confidence_intervals(samples: List[Dict[str, float]],
+                         alpha: float = .05) -> Dict[str, float]:
+    """
+    Returns the percentile bootstrap confidence interval of each metric, as
+    `<metric>_bootstrap_low` and `<metric>_bootstrap_high`. Resamples for
+    which a metric could not be calculated are left out.
+
+    :param samples: List[Dict[str, float]], the metrics of each resample
+    :param alpha: float
+    :return: Dict[str, float]
+    """
+    intervals = {}
+    for metric in BOOTSTRAP_METRICS:
+        values = np.array([sample[metric] for sample in samples], dtype=float)
+        values = values[~np.isnan(values)]
+        low, high = np.percentile(values, [100 * alpha / 2,
+                                           100 * (1 - alpha / 2)]) \
+            if len(values) else (np.nan, np.nan)
+        intervals[f'{metric}_bootstrap_low'] = low
+        intervals[f'{metric}_bootstrap_high'] = high
+    return intervals
+
+
+def bootstrap(calibrator: BaseEstimator,
+              calibration_data: ScoresAndLabels,
+              test_data: ScoresAndLabels,
+              num_samples: int,
+              n_jobs: Optional[int] = None,
+              seed: int = 0) -> Dict[str, float]:
+    """
+    Refits `calibrator` on `num_samples` resamples of the data on a pool of
+    `n_jobs` processes (or in this process if `n_jobs` is 1) and returns the
+    confidence interval of each metric. Each resample gets its own seed that
+    is derived from `seed`, so the result does not depend on `n_jobs`.
+
+    :param calibrator: BaseEstimator
+    :param calibration_data: ScoresAndLabels
+    :param test_data: ScoresAndLabels
+    :param num_samples: int
+    :param n_jobs: Optional[int], defaults to the number of processors
+    :param seed: int
+    :return: Dict[str, float]
+    """
+    seeds = np.random.SeedSequence(seed).spawn(num_samples)
+    data = (calibrator, calibration_data, test_data)
+    if n_jobs == 1:
+        _set_data(*data)
+        samples = list(map(_evaluate_sample, seeds))
+    else:
+        with ProcessPoolExecutor(
+                n_jobs,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_set_data,
+                initargs=data) as executor:
+            samples = list(executor.map(_evaluate_sample, seeds,
+                                        chunksize=max(1, num_samples // 64)))
+    return {**confidence_intervals(samples), 'bootstrap_samples': num_samples}
+
+
+# The data that is shared by all resamples, set once per worker process.
+_data: Tuple = ()
+
+
+def _set_data(calibrator: BaseEstimator,
+              calibration_data: ScoresAndLabels,
+              test_data: ScoresAndLabels):
+    global _data
+    _data = (calibrator, calibration_data, test_data)
+
+
+def _evaluate_sample(seed: np.random.SeedSequence) -> Dict[str, float]:
+    return fit_and_evaluate(*_data, rng=np.random.default_rng(seed))
+
+
+def _resample(X: np.ndarray,
+              y: np.ndarray,
+              rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    indices = rng.integers(0, len(X), len(X))
+    return X[indices], y[indices]
+
+
+def _calculate_metrics(scores: np.ndarray,
+                       lrs: np.ndarray,
+                       y: np.ndarray) -> Dict[str, float]:
+    from lir import calculate_cllr
+
+    # The same post-processing as in `lr_face.evaluators.evaluate()`.
+    lrs = np.nan_to_num(lrs, posinf=10e5)
+    if len(set(y)) < 2:
+        return {metric: np.nan for metric in BOOTSTRAP_METRICS}
+    return {'cllr': round(calculate_cllr(lrs[y == 0], lrs[y == 1]).cllr, 4),
+            'auc': roc_auc_score(y, scores),
+            'accuracy': accuracy_score(y, scores > .5)}
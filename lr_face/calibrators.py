@@ -0,0 +1,368 @@
+"""
+Calibrators that can be used instead of those in `lir`, with the same
+sklearn-style interface.
+
+`BinnedKDECalibrator` is a drop-in replacement for `lir.KDECalibrator` for
+large calibration sets. The exact KDE sums a kernel over every calibration
+score for every score it transforms, so its cost grows with the product of
+both. Instead, the calibration scores are binned on a fixed grid (linear
+binning, which splits each score over its two nearest grid points) and the
+density on the grid is computed by convolving the bins with the Gaussian
+kernel through an FFT. Transforming is then a linear interpolation on the
+grid, whatever the number of calibration scores.
+
+Far in the tails the relative error of the FFT convolution grows, so scores
+where the density on the grid is tiny, or which lie outside the grid, are
+evaluated directly from the bins instead (in the log domain, which is still
+independent of the number of calibration scores).
+
+`IncrementalKDECalibrator` and `IncrementalLogitCalibrator` can be updated
+with new calibration scores through `partial_fit(X, y)`, without the scores
+they were fitted on before. Both keep a histogram of all scores per label on
+a grid with a fixed spacing, which is extended when new scores fall outside
+it. The KDE convolves the histogram as above, with the bandwidths of
+Silverman's rule computed from the count, mean and variance of all scores
+per label, which are updated as well. The logistic regression is refitted on
+the grid points, weighted by the histogram.
+"""
+
+from __future__ import annotations
+
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from lir import KDECalibrator
+from scipy.special import logsumexp
+from sklearn.linear_model import LogisticRegression
+from sklearn.base import BaseEstimator, TransformerMixin
+
+# The grid extends this many bandwidths beyond the calibration scores.
+GRID_MARGIN = 8
+# The grid has at least this many points per bandwidth.
+POINTS_PER_BANDWIDTH = 8
+MAX_GRID_SIZE = 2 ** 20
+# Relative to its maximum, densities below this are evaluated directly.
+TAIL_DENSITY = 1e-8
+
+
+class BinnedKDECalibrator(BaseEstimator, TransformerMixin):
+    """
+    Calculates a likelihood ratio of a score value, provided it is from one
+    of two distributions, like `lir.KDECalibrator`: the densities of both are
+    estimated with a Gaussian KDE, with the same bandwidths, but these are
+    evaluated on a grid of `grid_size` points (more if needed for small
+    bandwidths).
+    """
+
+    def __init__(self,
+                 bandwidth: Optional[Union[float, Tuple[Optional[float],
+                                                        Optional[float]]]]
+                 = None,
+                 grid_size: int = 2 ** 12):
+        """
+        :param bandwidth: as in `lir.KDECalibrator`: None for Silverman's
+            rule of thumb, a float for both distributions or a tuple with
+            (optional) bandwidths for the distributions of label 0 and 1
+        :param grid_size: int
+        """
+        self.bandwidth = bandwidth
+        self.grid_size = grid_size
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=float).ravel()
+        y = np.asarray(y)
+        X0, X1 = X[y == 0], X[y == 1]
+        bandwidths = [b or KDECalibrator.bandwidth_silverman(x) for b, x
+                      in zip(_parse_bandwidth(self.bandwidth), [X0, X1])]
+
+        margin = GRID_MARGIN * max(bandwidths)
+        low, high = np.min(X) - margin, np.max(X) + margin
+        size = int(np.ceil(
+            (high - low) / min(bandwidths) * POINTS_PER_BANDWIDTH)) + 1
+        size = min(max(self.grid_size, size), MAX_GRID_SIZE)
+        self.grid_ = np.linspace(low, high, size)
+        self.bandwidths_ = bandwidths
+        self.bins_ = [_bin(x, self.grid_) for x in [X0, X1]]
+        self.densities_ = [_convolve(bins, self.grid_, bandwidth) / len(x)
+                           for bins, x, bandwidth
+                           in zip(self.bins_, [X0, X1], bandwidths)]
+        return self
+
+    def transform(self, X):
+        assert hasattr(self, 'grid_'), \
+            "BinnedKDECalibrator.transform() called before fit"
+
+        X = np.asarray(X, dtype=float).ravel()
+        self.p0, self.p1 = (
+            self._density(X, bins, densities, bandwidth)
+            for bins, densities, bandwidth
+            in zip(self.bins_, self.densities_, self.bandwidths_))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.p1 / self.p0
+
+    def _density(self,
+                 X: np.ndarray,
+                 bins: np.ndarray,
+                 densities: np.ndarray,
+                 bandwidth: float) -> np.ndarray:
+        density = np.interp(X, self.grid_, densities, left=0., right=0.)
+        tail = density < TAIL_DENSITY * np.max(densities)
+        if np.any(tail):
+            density[tail] = np.exp(
+                _log_density(X[tail], self.grid_, bins, bandwidth))
+        return density
+
+
+class IncrementalKDECalibrator(BinnedKDECalibrator):
+    """
+    A `BinnedKDECalibrator` that can be updated with new calibration scores
+    through `partial_fit()`. The spacing of the grid is fixed by the first
+    fit, at most the smallest bandwidth divided by `POINTS_PER_BANDWIDTH`.
+    """
+
+    def fit(self, X, y):
+        self.histogram_ = None
+        return self.partial_fit(X, y)
+
+    def partial_fit(self, X, y):
+        X, y = _check_scores(X, y)
+        if getattr(self, 'histogram_', None) is None:
+            _check_labels(y)
+            bandwidths = [b or KDECalibrator.bandwidth_silverman(X[y == label])
+                          for label, b
+                          in enumerate(_parse_bandwidth(self.bandwidth))]
+            spacing = min(np.ptp(X) / (self.grid_size - 1) or np.inf,
+                          min(bandwidths) / POINTS_PER_BANDWIDTH)
+            self.histogram_ = _Histogram(np.min(X), spacing)
+            self.moments_ = np.zeros((2, 3))
+        else:
+            _check_labels(y, self.moments_[:, 0])
+        self.histogram_.add(X, y)
+        for label in [0, 1]:
+            self.moments_[label] = _merge_moments(self.moments_[label],
+                                                  X[y == label])
+
+        self.bandwidths_ = [b or _bandwidth_silverman(*moments)
+                            for b, moments in zip(
+                                _parse_bandwidth(self.bandwidth),
+                                self.moments_)]
+        # The grid of the histogram, extended with the margin of the kernel.
+        padding = int(np.ceil(
+            GRID_MARGIN * max(self.bandwidths_) / self.histogram_.spacing))
+        counts = np.pad(self.histogram_.counts, ((0, 0), (padding, padding)))
+        if counts.shape[1] > MAX_GRID_SIZE:
+            raise ValueError(f'The calibration scores need a grid of more '
+                             f'than {MAX_GRID_SIZE} points')
+        self.grid_ = self.histogram_.get_grid(-padding, counts.shape[1])
+        self.bins_ = list(counts)
+        self.densities_ = [
+            _convolve(bins, self.grid_, bandwidth) / moments[0]
+            for bins, bandwidth, moments
+            in zip(self.bins_, self.bandwidths_, self.moments_)]
+        return self
+
+
+class IncrementalLogitCalibrator(BaseEstimator, TransformerMixin):
+    """
+    Calculates a likelihood ratio of a score value, provided it is from one
+    of two distributions, like `lir.LogitCalibrator`, with a logistic
+    regression that is fitted on a histogram of `grid_size` points over the
+    scores of the first fit (more if later scores fall outside it), so that
+    it can be updated with new calibration scores through `partial_fit()`.
+    """
+
+    def __init__(self, grid_size: int = 2 ** 12):
+        """
+        :param grid_size: int
+        """
+        self.grid_size = grid_size
+
+    def fit(self, X, y):
+        self.histogram_ = None
+        return self.partial_fit(X, y)
+
+    def partial_fit(self, X, y):
+        X, y = _check_scores(X, y)
+        if getattr(self, 'histogram_', None) is None:
+            _check_labels(y)
+            spacing = (np.ptp(X) or 1.) / (self.grid_size - 1)
+            self.histogram_ = _Histogram(np.min(X), spacing)
+        else:
+            _check_labels(y, np.sum(self.histogram_.counts, axis=1))
+        self.histogram_.add(X, y)
+
+        # Like `class_weight='balanced'`, but over the counts of the scores
+        # rather than the number of grid points with a nonzero count.
+        counts = self.histogram_.counts
+        totals = np.sum(counts, axis=1)
+        weights = counts * (np.sum(totals) / (2 * totals))[:, None]
+        labels, indices = np.nonzero(counts)
+        grid = self.histogram_.get_grid(0, counts.shape[1])
+        self._logit = LogisticRegression()
+        self._logit.fit(grid[indices, None], labels,
+                        sample_weight=weights[labels, indices])
+        return self
+
+    def transform(self, X):
+        assert hasattr(self, '_logit'), \
+            "IncrementalLogitCalibrator.transform() called before fit"
+
+        X = np.asarray(X, dtype=float).reshape(-1, 1)
+        # The probability of label 1.
+        X = self._logit.predict_proba(X)[:, 1]
+        self.p0 = 1 - X
+        self.p1 = X
+        with np.errstate(divide='ignore'):
+            return self.p1 / self.p0
+
+
+class _Histogram:
+    """
+    The linearly binned counts of scores per label (see `_bin()`), on a grid
+    that starts at `origin` with a fixed `spacing` and is extended as needed.
+    """
+
+    def __init__(self, origin: float, spacing: float):
+        self.origin = origin
+        self.spacing = spacing
+        self.counts = np.zeros((2, 2))
+
+    def get_grid(self, start: int, size: int) -> np.ndarray:
+        """
+        Returns `size` points of the grid, from point `start` on (relative to
+        the origin).
+        """
+        return self.origin + (start + np.arange(size)) * self.spacing
+
+    def add(self, X: np.ndarray, y: np.ndarray):
+        size = self.counts.shape[1]
+        # The number of grid points to add on either side.
+        before = max(0, int(np.ceil(
+            (self.origin - np.min(X)) / self.spacing)))
+        after = max(0, int(np.ceil(
+            (np.max(X) - self.origin) / self.spacing)) + 1 - size)
+        if before or after:
+            if size + before + after > MAX_GRID_SIZE:
+                raise ValueError(f'The calibration scores need a grid of '
+                                 f'more than {MAX_GRID_SIZE} points')
+            self.counts = np.pad(self.counts, ((0, 0), (before, after)))
+            self.origin -= before * self.spacing
+        grid = self.get_grid(0, self.counts.shape[1])
+        for label in [0, 1]:
+            self.counts[label] += _bin(X[y == label], grid)
+
+
+def _parse_bandwidth(bandwidth) -> Tuple[Optional[float], Optional[float]]:
+    if bandwidth is None:
+        return None, None
+    if isinstance(bandwidth, (int, float)):
+        return bandwidth, bandwidth
+    if len(bandwidth) == 2:
+        return tuple(bandwidth)
+    raise ValueError('Invalid input for bandwidth')
+
+
+def _bin(X: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """
+    Returns the weight of the values `X` per point of the evenly spaced
+    `grid`, each value being split over its two nearest grid points.
+    """
+    position = (X - grid[0]) / (grid[1] - grid[0])
+    index = np.clip(np.floor(position).astype(int), 0, len(grid) - 2)
+    # Values on the edge of the grid may lie just beyond it by rounding.
+    fraction = np.clip(position - index, 0., 1.)
+    return np.bincount(index, 1 - fraction, len(grid)) \
+        + np.bincount(index + 1, fraction, len(grid))
+
+
+def _convolve(bins: np.ndarray,
+              grid: np.ndarray,
+              bandwidth: float) -> np.ndarray:
+    """
+    Returns the sum of the Gaussian kernels of all `bins` at each point of
+    the `grid`, computed as a convolution through an FFT.
+    """
+    spacing = grid[1] - grid[0]
+    # Beyond this, the kernel is negligible.
+    half_width = min(len(grid) - 1,
+                     int(np.ceil(GRID_MARGIN * bandwidth / spacing)))
+    offsets = np.arange(-half_width, half_width + 1) * spacing
+    kernel = np.exp(-.5 * (offsets / bandwidth) ** 2) \
+        / (bandwidth * np.sqrt(2 * np.pi))
+    size = len(bins) + len(kernel) - 1
+    fft_size = 1 << (size - 1).bit_length()
+    convolved = np.fft.irfft(np.fft.rfft(bins, fft_size)
+                             * np.fft.rfft(kernel, fft_size), fft_size)
+    # The FFT leaves some negative rounding errors.
+    return np.maximum(convolved[half_width:half_width + len(bins)], 0.)
+
+
+def _log_density(X: np.ndarray,
+                 grid: np.ndarray,
+                 bins: np.ndarray,
+                 bandwidth: float) -> np.ndarray:
+    """
+    Returns the log of the density of the binned KDE at `X`, evaluated
+    directly, so that it is accurate far in the tails.
+    """
+    nonzero = bins > 0
+    centers, log_weights = grid[nonzero], np.log(bins[nonzero])
+    log_norm = np.log(np.sum(bins) * bandwidth * np.sqrt(2 * np.pi))
+    # Bound the size of the (chunk, centers) arrays.
+    chunk_size = max(1, 2 ** 22 // len(centers))
+    log_density = np.empty(len(X))
+    for start in range(0, len(X), chunk_size):
+        x = X[start:start + chunk_size, None]
+        log_density[start:start + chunk_size] = logsumexp(
+            log_weights - .5 * ((x - centers) / bandwidth) ** 2, axis=1)
+    return log_density - log_norm
+
+
+def _check_scores(X, y) -> Tuple[np.ndarray, np.ndarray]:
+    X = np.asarray(X, dtype=float).ravel()
+    y = np.asarray(y).ravel()
+    if len(X) != len(y):
+        raise ValueError(f'Got {len(X)} scores, but {len(y)} labels')
+    if not np.all(np.isfinite(X)):
+        raise ValueError('The calibration scores should be finite')
+    return X, y
+
+
+def _check_labels(y: np.ndarray, previous_counts=(0, 0)):
+    """
+    Raises a `ValueError` unless there are scores of both labels, including
+    the `previous_counts` of either label.
+    """
+    for label, previous_count in zip([0, 1], previous_counts):
+        if previous_count + np.sum(y == label) == 0:
+            raise ValueError(f'There are no calibration scores of label '
+                             f'{label}')
+
+
+def _merge_moments(moments: np.ndarray, X: np.ndarray) -> np.ndarray:
+    """
+    Returns the count, mean and sum of squared deviations from the mean of
+    the values described by `moments` together with those in `X`, merged as
+    by Chan et al., which is numerically stable.
+    """
+    if len(X) == 0:
+        return moments
+    count, mean, squares = moments
+    batch_count, batch_mean = len(X), np.mean(X)
+    batch_squares = np.sum((X - batch_mean) ** 2)
+    total = count + batch_count
+    delta = batch_mean - mean
+    return np.array([
+        total,
+        mean + delta * batch_count / total,
+        squares + batch_squares + delta ** 2 * count * batch_count / total])
+
+
+def _bandwidth_silverman(count: float, mean: float, squares: float) -> float:
+    """
+    Returns the same bandwidth as `KDECalibrator.bandwidth_silverman()`, from
+    the count, mean and sum of squared deviations of the values.
+    """
+    std = np.sqrt(squares / count) or 1.
+    return (std ** 5 / count * 4. / 3) ** .2
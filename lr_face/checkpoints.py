@@ -0,0 +1,53 @@
+import os
+import pickle
+from typing import Dict, Optional
+
+from lr_face.utils import get_tmp_path
+
+CHECKPOINTS_DIR = 'checkpoints'
+
+
+class CheckpointStore:
+    """
+    Persists the results of individual experiments as soon as they are known,
+    so that an interrupted run can be resumed without redoing the experiments
+    that already finished. Results are keyed by `Experiment.fingerprint`.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def load(self, fingerprint: str) -> Optional[Dict[str, float]]:
+        """
+        Returns the stored result of the experiment with `fingerprint`, or
+        None if it has not finished yet.
+
+        :param fingerprint: str
+        :return: Optional[Dict[str, float]]
+        """
+        path = self._path(fingerprint)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, fingerprint: str, result: Dict[str, float]):
+        """
+        Stores the `result` of the experiment with `fingerprint`. The file is
+        replaced atomically, so a crash never leaves a partial checkpoint.
+
+        :param fingerprint: str
+        :param result: Dict[str, float]
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(fingerprint)
+        tmp_path = get_tmp_path(path)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f)
+        os.replace(tmp_path, path)
+
+    def __contains__(self, fingerprint: str) -> bool:
+        return os.path.exists(self._path(fingerprint))
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, f'{fingerprint}.obj')
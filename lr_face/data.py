@@ -9,7 +9,8 @@ from collections import defaultdict
 from dataclasses import dataclass
 from enum import Enum
 from itertools import islice
-from typing import Dict, Any, Tuple, List, Optional, Union, Iterator, Callable
+from typing import Dict, Any, Tuple, List, Optional, Union, Iterator, Callable, \
+    Iterable
 
 import cv2
 import numpy as np
@@ -19,6 +20,9 @@ from lr_face.utils import cache
 
 Augmenter = Callable[[np.ndarray], np.ndarray]
 
+# The maximum number of pairs in each chunk yielded by the pair generators.
+PAIRS_CHUNK_SIZE = 100000
+
 
 class Yaw(Enum):
     FRONTAL = "straight"
@@ -120,13 +124,10 @@ class FaceImage:
     @property
     def quality_score(self):
         """ returns a 'quality score', as the average of the top ten score
-        against a fixed set of 100 different source images"""
-        from lr_face.models import Architecture
-        # TODO Open question: should we use the model we are calibrating?
-        model = Architecture.FACERECOGNITION.get_scorer_model(None)
-        scores = model.predict_proba(
-            [FacePair(self, image) for image in BENCHMARK_IMAGES])[:, 1]
-        return np.ceil(10 * np.mean(sorted(scores, reverse=True)[:10]))
+        against a fixed set of 100 different source images. See
+        `lr_face.quality.QualityScorer` to score many images at once."""
+        from lr_face.quality import get_quality_scorer
+        return get_quality_scorer().score([self])[0]
 
     def __post_init__(self):
         if not self.meta:
@@ -202,6 +203,100 @@ class FaceTriplet:
                 'Anchor and negative image have the same identity')
 
 
+@dataclass(eq=False)
+class IndexedPairs:
+    """
+    A compact representation of a list of pairs. Instead of one `FacePair`
+    instance per pair, the pairs are stored as two int32 arrays `first` and
+    `second` with indices into a table of `images`, which can be shared by
+    many `IndexedPairs` instances. Whether the two images of each pair share
+    the same identity is stored as a bitmask (see `np.packbits`).
+
+    `FacePair` instances are only created on the fly when an `IndexedPairs`
+    instance is indexed or iterated over, i.e.
+
+    ```python
+    pairs: IndexedPairs = ...
+    for first, second in pairs:
+        ...
+    ```
+    """
+    images: List[FaceImage]
+    first: np.ndarray
+    second: np.ndarray
+    same_identity_mask: np.ndarray
+
+    @classmethod
+    def from_indices(cls,
+                     images: List[FaceImage],
+                     first: np.ndarray,
+                     second: np.ndarray,
+                     identity_codes: Optional[np.ndarray] = None) \
+            -> IndexedPairs:
+        """
+        Creates an `IndexedPairs` instance from the indices of the `first` and
+        `second` images of each pair in `images`. The `identity_codes` of the
+        images can be passed along if they have already been computed by
+        `get_identity_codes()`.
+        """
+        if identity_codes is None:
+            identity_codes = get_identity_codes(images)
+        first = np.asarray(first, dtype=np.int32)
+        second = np.asarray(second, dtype=np.int32)
+        same_identity = identity_codes[first] == identity_codes[second]
+        return cls(images, first, second, np.packbits(same_identity))
+
+    @classmethod
+    def from_pairs(cls, pairs: List[FacePair]) -> IndexedPairs:
+        """
+        Converts a list of `FacePair` instances to an `IndexedPairs` instance.
+        """
+        indices = dict()
+        images = []
+        for image in (image for pair in pairs for image in pair):
+            if id(image) not in indices:
+                indices[id(image)] = len(images)
+                images.append(image)
+        first = [indices[id(pair.first)] for pair in pairs]
+        second = [indices[id(pair.second)] for pair in pairs]
+        return cls.from_indices(images, first, second)
+
+    @property
+    def same_identity(self) -> np.ndarray:
+        """
+        Returns a boolean array that is True for all pairs of which both
+        images depict the same person.
+
+        :return: np.ndarray
+        """
+        return np.unpackbits(self.same_identity_mask,
+                             count=len(self)).astype(bool)
+
+    def to_pairs(self) -> List[FacePair]:
+        return list(self)
+
+    def __getitem__(self, item) -> Union[FacePair, IndexedPairs]:
+        """
+        Returns a `FacePair` if `item` is an integer, or a new `IndexedPairs`
+        instance with the same image table if `item` is a slice, boolean mask
+        or an array of indices.
+        """
+        if isinstance(item, (int, np.integer)):
+            return FacePair(self.images[self.first[item]],
+                            self.images[self.second[item]])
+        return IndexedPairs(self.images,
+                            self.first[item],
+                            self.second[item],
+                            np.packbits(self.same_identity[item]))
+
+    def __iter__(self) -> Iterator[FacePair]:
+        for i, j in zip(self.first, self.second):
+            yield FacePair(self.images[i], self.images[j])
+
+    def __len__(self) -> int:
+        return len(self.first)
+
+
 class DummyFaceImage(FaceImage):
     """
     A dummy class that can be used in place of a real `FaceImage` for testing.
@@ -307,6 +402,19 @@ class Dataset:
     def __str__(self) -> str:
         return self.__class__.__name__
 
+    def __repr__(self) -> str:
+        """
+        Unlike `__str__()`, includes all constructor arguments, so that it
+        tells apart datasets that only differ in those (e.g. when hashing the
+        configuration of an experiment).
+
+        :return: str
+        """
+        arguments = ', '.join(f'{name}={value!r}'
+                              for name, value in sorted(vars(self).items())
+                              if not name.startswith('_'))
+        return f'{self.__class__.__name__}({arguments})'
+
 
 class TestDataset(Dataset):
     @property
@@ -840,45 +948,25 @@ def make_pairs(data: Union[Dataset, List[FaceImage]],
 def make_pairs_from_two_lists(
         data_first: List[FaceImage],
         data_second: List[FaceImage],
-        n: Optional[int] = None) -> List[FacePair]:
+        n: Optional[int] = None,
+        seed: Optional[int] = None) -> List[FacePair]:
     """
     Takes two list of `FaceImage` instances and pairs them up, each pair
-    having one image from the first, one from the seconds
+    having one image from the first, one from the seconds. All positive pairs
+    are returned, plus one negative pair for each positive pair, consisting of
+    the first image of the positive pair and a random image from the second
+    list of a (uniformly chosen) different identity.
+
+    Optionally, a `seed` can be given to make the random negative pairs (and
+    the selection of `n` pairs) reproducible.
 
     Returns:
         A list of `FacePair` instances.
     """
-    images_first_by_identity = defaultdict(list)
-    for x in data_first:
-        images_first_by_identity[x.identity].append(x)
-
-    images_second_by_identity = defaultdict(list)
-    for x in data_second:
-        images_second_by_identity[x.identity].append(x)
-
-    res = []
-    for identity in set(images_first_by_identity.keys()).intersection(
-            set(images_second_by_identity.keys())):
-        for image_a in images_first_by_identity[identity]:
-            for image_b in images_second_by_identity[identity]:
-                if image_a != image_b:
-                    res.append(FacePair(image_a, image_b))
-
-    # Loop over and unpack all positive pairs, then create matching
-    # negative pairs that contain at least one of the images from each
-    # positive pair and a randomly chosen other image with a different
-    # identity.
-    for first, second in res.copy():  # Copy, because we modify `res`.
-        identity = first.identity
-        options = set(images_second_by_identity.keys()) - {identity}
-        if len(options) > 0:
-            negative_id = random.choice(tuple(options))
-            negative = random.choice(images_second_by_identity[negative_id])
-            res.append(FacePair(first, negative))
-
-    if n:
-        res = random.sample(res, min(len(res), n))
-    return res
+    images = list(data_first) + list(data_second)
+    first, second = _pair_indices_from_two_lists(
+        data_first, data_second, n, np.random.default_rng(seed))
+    return [FacePair(images[i], images[j]) for i, j in zip(first, second)]
 
 
 def make_triplets(data: Union[Dataset, List[FaceImage]]) -> List[FaceTriplet]:
@@ -902,6 +990,272 @@ def make_triplets(data: Union[Dataset, List[FaceImage]]) -> List[FaceTriplet]:
     return triplets
 
 
+def get_identity_codes(data: Union[Dataset, List[FaceImage]]) -> np.ndarray:
+    """
+    Returns an int32 array with an integer code for the identity of each
+    image in `data`. Identities are numbered in order of first appearance.
+
+    :param data: Union[Dataset, List[FaceImage]]
+    :return: np.ndarray
+    """
+    return _to_codes(x.identity for x in data)
+
+
+def iter_pairs(data: Union[Dataset, List[FaceImage]],
+               same: Optional[bool] = None,
+               n: Optional[int] = None,
+               chunk_size: int = PAIRS_CHUNK_SIZE,
+               seed: Optional[int] = None) -> Iterator[IndexedPairs]:
+    """
+    A generator variant of `make_pairs()` that takes the same arguments, but
+    yields the pairs as `IndexedPairs` chunks of at most `chunk_size` pairs,
+    which all share the same image table. Optionally, a `seed` can be given to
+    make the random pairs reproducible.
+
+    When `same` is False and `n` is omitted, the (potentially huge number of)
+    negative pairs are generated lazily, chunk by chunk. In all other cases
+    the number of pairs is bounded by the number of positive pairs or by `n`,
+    so the indices of all pairs are computed up front.
+    """
+    images = list(data)
+    codes = get_identity_codes(images)
+    rng = np.random.default_rng(seed)
+    groups = _IdentityGroups(codes, rng)
+
+    def all_negative_pairs():
+        # All negative pairs of each image, generated one image at a time.
+        for i in groups.order:
+            negatives = groups.order[codes[groups.order] != codes[i]]
+            yield np.full(len(negatives), i), negatives
+
+    def random_negative_pairs():
+        for size in _chunk_sizes(n, chunk_size):
+            identities = groups.sample_identities(size)
+            yield groups.sample_images(identities), \
+                groups.sample_images(groups.sample_others(identities))
+
+    if same is False:
+        blocks = all_negative_pairs() if n is None else random_negative_pairs()
+    else:
+        first, second = groups.positive_pairs()
+
+        # If `same` is omitted (None), create a matching negative pair for
+        # each positive pair, consisting of one of its images and a random
+        # image of a different identity.
+        if same is None:
+            anchors = np.where(rng.random(len(first)) < .5, first, second)
+            negatives = groups.sample_images(
+                groups.sample_others(codes[anchors]))
+            first = np.concatenate([first, anchors])
+            second = np.concatenate([second, negatives])
+
+        if n:
+            selection = rng.choice(len(first), min(len(first), n),
+                                   replace=False)
+            first, second = first[selection], second[selection]
+        blocks = [(first, second)]
+
+    for first, second in _rechunk(blocks, chunk_size):
+        yield IndexedPairs.from_indices(images, first, second, codes)
+
+
+def iter_pairs_from_two_lists(
+        data_first: List[FaceImage],
+        data_second: List[FaceImage],
+        n: Optional[int] = None,
+        chunk_size: int = PAIRS_CHUNK_SIZE,
+        seed: Optional[int] = None) -> Iterator[IndexedPairs]:
+    """
+    A generator variant of `make_pairs_from_two_lists()` that yields the
+    pairs as `IndexedPairs` chunks of at most `chunk_size` pairs. The image
+    table of the chunks is `data_first + data_second`.
+    """
+    images = list(data_first) + list(data_second)
+    first, second = _pair_indices_from_two_lists(
+        data_first, data_second, n, np.random.default_rng(seed))
+    codes = get_identity_codes(images)
+    for first, second in _rechunk([(first, second)], chunk_size):
+        yield IndexedPairs.from_indices(images, first, second, codes)
+
+
+def iter_triplets(data: Union[Dataset, List[FaceImage]],
+                  chunk_size: int = PAIRS_CHUNK_SIZE) \
+        -> Iterator[List[FaceTriplet]]:
+    """
+    A generator variant of `make_triplets()` that lazily yields the triplets
+    in lists of at most `chunk_size` triplets.
+    """
+    images_by_identity = defaultdict(list)
+    for x in data:
+        images_by_identity[x.identity].append(x)
+
+    identities = list(images_by_identity.keys())
+    if len(identities) < 2:
+        raise ValueError(
+            "Can't make triplets if there are fewer than 2 unique identities.")
+
+    triplets = []
+    for identity, images in images_by_identity.items():
+        negative_ids = [x for x in identities if x != identity]
+        for i, anchor in enumerate(images):
+            for positive in images[i + 1:]:
+                negative_id = random.choice(negative_ids)
+                negative = random.choice(images_by_identity[negative_id])
+                triplets.append(FaceTriplet(anchor, positive, negative))
+                if len(triplets) == chunk_size:
+                    yield triplets
+                    triplets = []
+    if triplets:
+        yield triplets
+
+
+class _IdentityGroups:
+    """
+    Helper for the vectorised pair generators: groups the indices of images by
+    their identity codes (see `get_identity_codes()`), so that random images
+    of a given identity can be sampled with a few array operations. Random
+    numbers are drawn from the `rng` generator.
+    """
+
+    def __init__(self,
+                 codes: np.ndarray,
+                 rng: np.random.Generator,
+                 num_codes: int = 0):
+        self.rng = rng
+        # The indices of all images, grouped by identity.
+        self.order = np.argsort(codes, kind='stable').astype(np.int32)
+        # The number of images and the position of the first image in `order`
+        # for each identity code.
+        self.counts = np.bincount(codes, minlength=num_codes)
+        self.starts = np.cumsum(self.counts) - self.counts
+        # The codes of the identities that have at least one image.
+        self.identities = np.flatnonzero(self.counts)
+
+    def positive_pairs(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the indices of all pairs of different images that share the
+        same identity, grouped by identity.
+        """
+        first, second = [np.array([], dtype=np.int32)], \
+            [np.array([], dtype=np.int32)]
+        for start, count in zip(self.starts, self.counts):
+            i, j = np.triu_indices(count, 1)
+            first.append(self.order[start + i])
+            second.append(self.order[start + j])
+        return np.concatenate(first), np.concatenate(second)
+
+    def members(self, identities: np.ndarray) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        """
+        For each of the `identities`, finds all images with that identity.
+        Returns the position of the identity in `identities` and the index of
+        the image for every such combination.
+        """
+        repeats = self.counts[identities]
+        positions = np.repeat(np.arange(len(identities)), repeats)
+        offsets = np.arange(len(positions)) \
+            - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        return positions, self.order[self.starts[identities][positions]
+                                     + offsets]
+
+    def sample_identities(self, size: int) -> np.ndarray:
+        return self.rng.choice(self.identities, size)
+
+    def sample_others(self, identities: np.ndarray) -> np.ndarray:
+        """
+        Returns a random identity for each of the `identities`, chosen
+        uniformly from all identities that have images, except that identity
+        itself. All `identities` should have at least one image.
+        """
+        position = np.searchsorted(self.identities, identities)
+        others = self.rng.integers(len(self.identities) - 1,
+                                   size=len(identities))
+        return self.identities[others + (others >= position)]
+
+    def sample_images(self, identities: np.ndarray) -> np.ndarray:
+        """
+        Returns the index of a random image for each of the `identities`.
+        """
+        offsets = self.rng.random(len(identities)) * self.counts[identities]
+        return self.order[self.starts[identities] + offsets.astype(int)]
+
+
+def _pair_indices_from_two_lists(
+        data_first: List[FaceImage],
+        data_second: List[FaceImage],
+        n: Optional[int],
+        rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the indices of the pairs made by `make_pairs_from_two_lists()` in
+    the table `data_first + data_second` as two int32 arrays. Identities are
+    converted to integer codes, so that all pairs can be made with array
+    operations instead of loops over the identities.
+    """
+    num_first = len(data_first)
+    images = list(data_first) + list(data_second)
+    codes = get_identity_codes(images)
+    paths = _to_codes(x.path for x in images)
+    codes_first = codes[:num_first]
+    second_groups = _IdentityGroups(codes[num_first:], rng, len(codes))
+
+    # All combinations of an image from the first list with an image with the
+    # same identity from the second list, except for the same image.
+    first, second = second_groups.members(codes_first)
+    second = second + num_first
+    different_image = paths[first] != paths[second]
+    first, second = first[different_image], second[different_image]
+
+    # Add a matching negative pair for each positive pair, consisting of the
+    # first image of the positive pair and a random image of a different
+    # identity from the second list (if there is one).
+    if len(second_groups.identities) > 1:
+        negative_ids = second_groups.sample_others(codes[first])
+        negatives = second_groups.sample_images(negative_ids) + num_first
+        first = np.concatenate([first, first])
+        second = np.concatenate([second, negatives])
+
+    if n:
+        selection = rng.choice(len(first), min(len(first), n), replace=False)
+        first, second = first[selection], second[selection]
+    return first.astype(np.int32), second.astype(np.int32)
+
+
+def _to_codes(values: Iterable[str]) -> np.ndarray:
+    """
+    Converts `values` to an int32 array of integer codes, numbered in order of
+    first appearance.
+    """
+    codes = dict()
+    return np.array([codes.setdefault(x, len(codes)) for x in values],
+                    dtype=np.int32)
+
+
+def _chunk_sizes(n: int, chunk_size: int) -> Iterator[int]:
+    for start in range(0, n, chunk_size):
+        yield min(chunk_size, n - start)
+
+
+def _rechunk(blocks: Iterable[Tuple[np.ndarray, np.ndarray]],
+             chunk_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Takes an iterable of `(first, second)` index arrays of arbitrary length
+    and yields them as chunks of exactly `chunk_size` indices (except for the
+    last chunk, which may be smaller).
+    """
+    buffer, size = [], 0
+    for first, second in blocks:
+        while len(first):
+            take = chunk_size - size
+            buffer.append((first[:take], second[:take]))
+            size += len(first[:take])
+            first, second = first[take:], second[take:]
+            if size == chunk_size:
+                yield tuple(map(np.concatenate, zip(*buffer)))
+                buffer, size = [], 0
+    if size:
+        yield tuple(map(np.concatenate, zip(*buffer)))
+
+
 def to_array(
         data: Union[Dataset,
                     List[FaceImage],
@@ -1020,16 +1374,16 @@ def split_by_identity(
     return [data[idx] for idx in train_idx], [data[idx] for idx in test_idx]
 
 
-def get_benchmark_images():
+@cache
+def get_benchmark_images() -> List[FaceImage]:
     """creates a fixed set of images to compute quality scores against.
 
-    The images are taken from LFW and increasingle reduced in resolution"""
+    The images are taken from LFW and increasingle reduced in resolution. The
+    set is only loaded on first use and cached afterwards, so importing this
+    module does not touch the file system."""
 
     # TODO save this as standalone set when we settle on what images to use?
     data = LfwDevDataset(True)
     # TODO resolution reduction? somewhat involved for FaceImages
     images = data.images
     return images[:100]
-
-
-BENCHMARK_IMAGES: List[FaceImage] = get_benchmark_images()
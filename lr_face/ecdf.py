@@ -0,0 +1,144 @@
+"""
+Empirical distributions of LRs, computed with array operations: values are
+sorted once, after which the proportion of values below or above any number
+of thresholds is found with a binary search (`np.searchsorted`).
+
+The curves that are plotted in `lr_face.evaluators` are computed here, apart
+from the plotting itself, so that they can be cached or reused in reports.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+# The bound on the 10log LRs that are plotted: `evaluate()` caps infinite LRs
+# at 10e5, and LRs of 0 (which give -inf) are capped at its inverse.
+MAX_LOG_LR = np.log10(10e5)
+
+
+class EmpiricalCDF:
+    """
+    The empirical cumulative distribution function of `values`.
+    """
+
+    def __init__(self, values: np.ndarray):
+        self.values = np.sort(np.asarray(values, dtype=float))
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        """
+        Returns the proportion of values that are at most `x`, or NaN if
+        there are no values.
+
+        :param x: np.ndarray
+        :return: np.ndarray
+        """
+        if not len(self.values):
+            return np.full(np.shape(x), np.nan)
+        return np.searchsorted(self.values, x, side='right') \
+            / len(self.values)
+
+    def exceedance(self, x: np.ndarray) -> np.ndarray:
+        """
+        Returns the proportion of values that are greater than `x`.
+
+        :param x: np.ndarray
+        :return: np.ndarray
+        """
+        return 1 - self(x)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+@dataclass
+class TippettCurve:
+    log_lrs: np.ndarray
+    # The percentage of LRs greater than each of the `log_lrs`, given that
+    # H1 or H2 is true.
+    h1_percentages: np.ndarray
+    h2_percentages: np.ndarray
+
+
+@dataclass
+class Histogram:
+    edges: np.ndarray
+    densities: np.ndarray
+
+
+@dataclass
+class LRDistributions:
+    h1: Histogram
+    h2: Histogram
+
+
+def tippett_curve(log_lrs: np.ndarray,
+                  y: np.ndarray,
+                  num: int = 100) -> TippettCurve:
+    """
+    Computes the data of a Tippett plot of the 10log LRs `log_lrs` with
+    labels `y` at `num` points between the smallest and largest LR. Infinite
+    10log LRs count as +/-`MAX_LOG_LR`.
+
+    :param log_lrs: np.ndarray
+    :param y: np.ndarray
+    :param num: int
+    :return: TippettCurve
+    """
+    log_lrs, y = _bound_log_lrs(log_lrs, y)
+    h2, h1 = split_by_label(log_lrs, y)
+    x = np.linspace(np.min(log_lrs), np.max(log_lrs), num)
+    return TippettCurve(log_lrs=x,
+                        h1_percentages=EmpiricalCDF(h1).exceedance(x) * 100,
+                        h2_percentages=EmpiricalCDF(h2).exceedance(x) * 100)
+
+
+def lr_distributions(log_lrs: np.ndarray,
+                     y: np.ndarray,
+                     bins: int = 20) -> LRDistributions:
+    """
+    Computes the density histograms of the 10log LRs `log_lrs` under each
+    hypothesis, with `bins` bins over the range of each. Infinite 10log LRs
+    count as +/-`MAX_LOG_LR`.
+
+    :param log_lrs: np.ndarray
+    :param y: np.ndarray
+    :param bins: int
+    :return: LRDistributions
+    """
+    log_lrs, y = _bound_log_lrs(log_lrs, y)
+    h2, h1 = split_by_label(log_lrs, y)
+    return LRDistributions(h1=Histogram(*_histogram(h1, bins)),
+                           h2=Histogram(*_histogram(h2, bins)))
+
+
+def split_by_label(X: np.ndarray, y: np.ndarray) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the values of `X` with label 0 and those with label 1.
+
+    :param X: np.ndarray
+    :param y: np.ndarray
+    :return: Tuple[np.ndarray, np.ndarray]
+    """
+    X = np.asarray(X)
+    y = np.asarray(y)
+    return X[y == 0], X[y == 1]
+
+
+def _bound_log_lrs(log_lrs: np.ndarray, y: np.ndarray) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    # Infinite values have no place on an axis or in a bin, so they are
+    # clipped to `MAX_LOG_LR`, and NaN values are left out.
+    log_lrs = np.asarray(log_lrs, dtype=float)
+    y = np.asarray(y)
+    defined = ~np.isnan(log_lrs)
+    return np.clip(log_lrs[defined], -MAX_LOG_LR, MAX_LOG_LR), y[defined]
+
+
+def _histogram(values: np.ndarray, bins: int) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    densities, edges = np.histogram(values, bins=bins, density=True)
+    return edges, densities
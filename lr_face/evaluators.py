@@ -8,18 +8,71 @@ from lir import Xy_to_Xn, calculate_cllr, CalibratedScorer, ELUBbounder
 from sklearn.metrics import accuracy_score, roc_auc_score
 
 from lr_face.data import FacePair
+from lr_face.ecdf import tippett_curve, lr_distributions
 from lr_face.experiments import Experiment
-from lr_face.utils import save_predicted_lrs, get_valid_scores
+from lr_face.intervals import confidence_intervals
+from lr_face.plotting import PlotSink
+from lr_face.profiling import span
+from lr_face.utils import save_predicted_lrs, get_predicted_lrs, \
+    get_valid_scores
 
 
-def plot_lr_distributions(predicted_log_lrs, y, savefig=None, show=None):
+def make_pair_table(test_pairs: List[FacePair],
+                    y_test: List[int],
+                    scores: np.ndarray,
+                    lr_predicted: np.ndarray,
+                    categories: List[Tuple]) -> pd.DataFrame:
+    """
+    Returns a table with a row per test pair, with its label, score, LR and
+    category, and the yaw, pitch and resolution (in pixels) of both images.
+    The resolution of each image is only read once, however many pairs it is
+    in.
+    """
+    pixels = {}
+    for pair in test_pairs:
+        for image in pair:
+            if image.path not in pixels:
+                pixels[image.path] = np.prod(image.get_image().shape[:2])
+
+    def values(attribute: str, side: str) -> List:
+        return [_get_value(getattr(getattr(pair, side), attribute))
+                for pair in test_pairs]
+
+    return pd.DataFrame({
+        'pair_id': np.arange(len(test_pairs)),
+        'first_path': [pair.first.path for pair in test_pairs],
+        'second_path': [pair.second.path for pair in test_pairs],
+        'category': [str(category) for category in categories],
+        'y': np.asarray(y_test, dtype=int),
+        'score': scores,
+        'lr': lr_predicted,
+        'log_lr': np.log10(lr_predicted),
+        'yaw_first': values('yaw', 'first'),
+        'yaw_second': values('yaw', 'second'),
+        'pitch_first': values('pitch', 'first'),
+        'pitch_second': values('pitch', 'second'),
+        'pixels_first': [pixels[pair.first.path] for pair in test_pairs],
+        'pixels_second': [pixels[pair.second.path] for pair in test_pairs],
+    })
+
+
+def _get_value(annotation):
+    # Annotations are enums, or None if the image is not annotated.
+    return getattr(annotation, 'value', annotation)
+
+
+def plot_lr_distributions(pairs: pd.DataFrame, savefig=None, show=None):
     """
     Plots the 10log LRs generated for the two hypotheses by the fitted system.
+    `pairs` is a table as made by `make_pair_table()`.
     """
+    distributions = lr_distributions(pairs['log_lr'], pairs['y'], bins=20)
     plt.figure(figsize=(10, 10), dpi=100)
-    points0, points1 = Xy_to_Xn(predicted_log_lrs, y)
-    plt.hist(points0, bins=20, alpha=.25, density=True)
-    plt.hist(points1, bins=20, alpha=.25, density=True)
+    for histogram in [distributions.h2, distributions.h1]:
+        # The densities are computed already, so each bin gets its density
+        # as its weight.
+        plt.hist(histogram.edges[:-1], bins=histogram.edges,
+                 weights=histogram.densities, alpha=.25)
     plt.xlabel('10log LR')
     if savefig is not None:
         plt.savefig(savefig)
@@ -28,25 +81,15 @@ def plot_lr_distributions(predicted_log_lrs, y, savefig=None, show=None):
         plt.show()
 
 
-def plot_performance_as_function_of_yaw(scores,
-                                        test_pairs: List[FacePair],
-                                        y_test,
+def plot_performance_as_function_of_yaw(pairs: pd.DataFrame,
                                         savefig: Optional[str] = None,
                                         show: Optional[bool] = None):
     """
     plots the scores as a function of the maximum yaw (=looking sideways) on
     the images, coloured by ground truth. calls plt.show() if show is True.
+    `pairs` is a table as made by `make_pair_table()`.
     """
-    df_yaws = pd.DataFrame(columns=['pair_id', 'y_test', 'yaw_first', 'yaw_second', 'score'])
-    for i, test_pair in enumerate(test_pairs):
-        df_yaws = df_yaws.append(dict(pair_id=i,
-                                      y_test=y_test[i],
-                                      yaw_first=test_pair.first.yaw.value,
-                                      yaw_second=test_pair.second.yaw.value,
-                                      score=scores[i]),
-                                 ignore_index=True)
-
-    sns.catplot(x="yaw_second_image", y="score", row='yaw_first_image', hue='y_test', kind="swarm", data=df_yaws)
+    sns.catplot(x="yaw_second", y="score", row='yaw_first', hue='y', kind="swarm", data=pairs)
     if savefig is not None:
         plt.savefig(savefig)
         plt.close()
@@ -54,33 +97,28 @@ def plot_performance_as_function_of_yaw(scores,
         plt.show()
 
 
-def plot_performance_as_function_of_resolution(scores,
-                                               test_pairs: List[FacePair],
-                                               y_test,
+def plot_performance_as_function_of_resolution(pairs: pd.DataFrame,
                                                show_ratio: bool = False,
                                                savefig: Optional[str] = None,
                                                show: Optional[bool] = None):
     """
     plots the scores as a function of the minimum resolution found on the
-    two images of the pair, coloured by ground truth
+    two images of the pair, coloured by ground truth. `pairs` is a table as
+    made by `make_pair_table()`.
     """
 
     if show_ratio:
-        resolutions = [np.prod(pair.first.get_image().shape[:2]) /
-                       np.prod(pair.second.get_image().shape[:2]) for
-                       pair in test_pairs]
+        resolutions = pairs['pixels_first'] / pairs['pixels_second']
         label = 'ratio pixels'
     else:
-        resolutions = [min(np.prod(pair.first.get_image().shape[:2]),
-                           np.prod(
-                               pair.second.get_image().shape[:2])) / 10 ** 6
-                       for pair in test_pairs]
+        resolutions = np.minimum(pairs['pixels_first'],
+                                 pairs['pixels_second']) / 10 ** 6
         label = 'Mpixels (smallest image)'
 
     plot_performance_as_a_function_of_x(
         properties=resolutions,
-        scores=scores,
-        y_test=y_test,
+        scores=pairs['score'],
+        y_test=pairs['y'],
         x_label=label,
         savefig=savefig,
         show=show)
@@ -118,22 +156,18 @@ def plot_performance_as_a_function_of_x(
         plt.show()
 
 
-def plot_tippett(predicted_log_lrs, y, savefig=None, show=None):
+def plot_tippett(pairs: pd.DataFrame, savefig=None, show=None):
     """
-    Plots the 10log LRs in a Tippett plot.
+    Plots the 10log LRs in a Tippett plot. `pairs` is a table as made by
+    `make_pair_table()`.
     """
-    xplot = np.linspace(
-        start=np.min(predicted_log_lrs),
-        stop=np.max(predicted_log_lrs),
-        num=100
-    )
-    lr_0, lr_1 = Xy_to_Xn(predicted_log_lrs, y)
-    perc0 = (sum(i > xplot for i in lr_0) / len(lr_0)) * 100
-    perc1 = (sum(i > xplot for i in lr_1) / len(lr_1)) * 100
+    curve = tippett_curve(pairs['log_lr'], pairs['y'], num=100)
 
     plt.figure(figsize=(10, 10), dpi=100)
-    plt.plot(xplot, perc1, color='b', label=r'LRs given $\mathregular{H_1}$')
-    plt.plot(xplot, perc0, color='r', label=r'LRs given $\mathregular{H_2}$')
+    plt.plot(curve.log_lrs, curve.h1_percentages, color='b',
+             label=r'LRs given $\mathregular{H_1}$')
+    plt.plot(curve.log_lrs, curve.h2_percentages, color='r',
+             label=r'LRs given $\mathregular{H_2}$')
     plt.axvline(x=0, color='k', linestyle='--')
     plt.xlabel('Log likelihood ratio')
     plt.ylabel('Cumulative proportion')
@@ -192,87 +226,139 @@ def evaluate(experiment: Experiment,
              lr_systems: Dict[Tuple, CalibratedScorer],
              test_pairs_per_category: Dict[Tuple, List[FacePair]],
              make_plots_and_save_as: Optional[str],
-             cal_fraction_valid: Dict[Tuple, float]) -> Dict[str, float]:
+             cal_fraction_valid: Dict[Tuple, float],
+             test_scores_per_category: Optional[Dict[Tuple, np.ndarray]]
+             = None,
+             plot_sink: Optional[PlotSink] = None,
+             intervals: int = 0,
+             intervals_jobs: Optional[int] = 1,
+             predicted_lrs: Optional[List[List]] = None) -> Dict[str, float]:
     """
     Calculates a variety of evaluation metrics and plots data if
-    `make_plots_and_save_as` is not None.
+    `make_plots_and_save_as` is not None. The test pairs are scored by the
+    scorers of the `lr_systems`, unless their scores are given in
+    `test_scores_per_category`. Plots are handed to the `plot_sink`, which
+    renders them right away by default. If `intervals` is positive, the
+    metrics get confidence intervals from that many resamples of the test
+    pairs, on `intervals_jobs` processes (see `lr_face.intervals`).
+    The LRs of the ENFSI pairs are saved to `lr_results.csv` with the plots,
+    unless a `predicted_lrs` list is given, to which their rows are added
+    instead (see `lr_face.utils.get_predicted_lrs()`).
     """
+    plot_sink = plot_sink or PlotSink()
 
-    number_of_scores = 0
-    scores = np.array([])
-    lr_predicted = np.array([])
-    y_test = []
-    test_pairs = []
+    evaluated = []
     for category, pairs in test_pairs_per_category.items():
         if category not in lr_systems:
             print(f'skipping {pairs} for category {category}')
             continue
-        if lr_systems[category].scorer.embedding_model.name == 'Facevacs':
-            category_scores = np.array(experiment.get_scores_from_file('results_test_pairs.txt',
-                                                                       ((pair.first.path, pair.second.path) for pair in
-                                                                        pairs)))
+        evaluated.append(category)
+
+    # The valid scores of all categories are gathered into arrays that are
+    # allocated once, with room for all pairs, and trimmed afterwards.
+    capacity = sum(len(test_pairs_per_category[c]) for c in evaluated)
+    scores = np.empty(capacity)
+    y_test = np.empty(capacity, dtype=int)
+    test_pairs = np.empty(capacity, dtype=object)
+    slices = {}
+    number_of_scores = 0
+    end = 0
+    for category in evaluated:
+        pairs = test_pairs_per_category[category]
+        if test_scores_per_category is not None:
+            category_scores = test_scores_per_category[category]
         else:
             category_scores = lr_systems[category].scorer.predict_proba(pairs)
         category_scores_valid, pairs_valid = get_valid_scores(category_scores[:, 1], pairs)
-        scores = np.append(scores, category_scores_valid)
         number_of_scores += len(category_scores)
-        lr_predicted = np.append(
-            lr_predicted,
-            lr_systems[category].calibrator.transform(category_scores_valid))
-        category_y_test = [int(pair.same_identity) for pair in pairs_valid]
-        y_test += category_y_test
-        test_pairs += list(pairs_valid)
+        start, end = end, end + len(pairs_valid)
+        slices[category] = slice(start, end)
+        scores[slices[category]] = category_scores_valid
+        test_pairs[slices[category]] = pairs_valid
+        y_test[slices[category]] = [pair.same_identity for pair in pairs_valid]
+        calibrator = lr_systems[category].calibrator
+        if type(calibrator) == ELUBbounder:
+            calibrator = calibrator.first_step_calibrator
+        # save last one (type should all be the same)
+        scorer = lr_systems[category].scorer
         if make_plots_and_save_as:
-            calibrator = lr_systems[category].calibrator
-            if type(calibrator) == ELUBbounder:
-                calibrator = calibrator.first_step_calibrator
-            plot_score_distribution_and_calibrator_fit(
-                calibrator,
-                category_scores_valid,
-                category_y_test,
+            plot_sink.submit(
+                'plot_score_distribution_and_calibrator_fit',
+                calibrator=calibrator,
+                scores=scores[slices[category]],
+                y=y_test[slices[category]],
                 savefig=f'{make_plots_and_save_as} {[str(c).split(":")[0] for cat in category for c in cat]} '
                         f'calibration' + '.png'
             )
-            # save last one (type should all be the same)
-            scorer = lr_systems[category].scorer
+    scores, y_test, test_pairs = scores[:end], y_test[:end], test_pairs[:end]
+
+    # The scores of each category are transformed by its own calibrator, in
+    # one pass once all scores are known.
+    lr_predicted = np.empty(end)
+    with span('evaluate.transform'):
+        for category, category_slice in slices.items():
+            lr_predicted[category_slice] = \
+                lr_systems[category].calibrator.transform(scores[category_slice])
+    categories = [category for category, category_slice in slices.items()
+                  for _ in range(category_slice.stop - category_slice.start)]
 
     lr_predicted = np.nan_to_num(lr_predicted, posinf=10e5)
     if make_plots_and_save_as:
-        plot_performance_as_function_of_yaw(
-            scores,
-            test_pairs,
-            y_test,
+        # All per-pair plots are made from the same table, which is saved
+        # for later analysis too.
+        with span('evaluate.pair_table'):
+            pair_table = make_pair_table(test_pairs, y_test, scores,
+                                         lr_predicted, categories)
+            pair_table.to_csv(f'{make_plots_and_save_as} pairs.csv',
+                              index=False)
+
+        plot_sink.submit(
+            'plot_performance_as_function_of_yaw',
+            pairs=pair_table,
             savefig=f'{make_plots_and_save_as} scores against yaw.png')
 
-        plot_performance_as_function_of_resolution(
-            scores,
-            test_pairs,
-            y_test,
+        plot_sink.submit(
+            'plot_performance_as_function_of_resolution',
+            pairs=pair_table,
             show_ratio=False,
             savefig=f'{make_plots_and_save_as} scores against resolution.png')
 
-        plot_lr_distributions(
-            np.log10(lr_predicted),
-            y_test,
+        plot_sink.submit(
+            'plot_lr_distributions',
+            pairs=pair_table,
             savefig=f'{make_plots_and_save_as} lr distribution.png'
         )
 
-        plot_tippett(
-            np.log10(lr_predicted),
-            y_test,
+        plot_sink.submit(
+            'plot_tippett',
+            pairs=pair_table,
             savefig=f'{make_plots_and_save_as} tippett.png'
         )
 
-        save_predicted_lrs(
-            scorer, calibrator, test_pairs, lr_predicted,
-            make_plots_and_save_as)
-
-    return calculate_metrics_dict(
-        number_of_scores=number_of_scores,
-        scores=scores,
-        y=y_test,
-        lr_predicted=lr_predicted,
-        cal_fraction_valid=cal_fraction_valid,
-        label=''
-    )
+    if evaluated and predicted_lrs is not None:
+        predicted_lrs.extend(get_predicted_lrs(
+            scorer, calibrator, test_pairs, lr_predicted))
+    elif evaluated and make_plots_and_save_as:
+        with span('evaluate.save_lrs'):
+            save_predicted_lrs(
+                scorer, calibrator, test_pairs, lr_predicted,
+                make_plots_and_save_as)
+
+    with span('evaluate.metrics'):
+        results = calculate_metrics_dict(
+            number_of_scores=number_of_scores,
+            scores=scores,
+            y=y_test,
+            lr_predicted=lr_predicted,
+            cal_fraction_valid=cal_fraction_valid,
+            label=''
+        )
+    if intervals:
+        with span('evaluate.intervals'):
+            results.update(confidence_intervals(scores,
+                                                lr_predicted,
+                                                y_test,
+                                                num_replicates=intervals,
+                                                n_jobs=intervals_jobs))
+    return results
 
@@ -1,15 +1,21 @@
+import os
 from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
-from functools import lru_cache
-from typing import List, Dict, Any, Iterator, Tuple, Optional, Union
+from typing import List, Dict, Any, Iterator, Tuple, Optional, Union, \
+    Iterable
 
 import numpy as np
 from sklearn.base import BaseEstimator
 
+from lr_face.attributes import AttributeTable
 from lr_face.data import FacePair, \
     FaceImage, make_pairs_from_two_lists
 from lr_face.models import ScorerModel
+from lr_face.pair_lists import PairList, load_pair_list, get_pair_list_path, \
+    get_images_by_path, convert_text_pair_list, is_converted
+from lr_face.scores import ScoreCache
+from lr_face.utils import md5
 from lr_face.versioning import Tag
 from params import *
 
@@ -19,6 +25,11 @@ class Experiment:
     scorer: ScorerModel
     calibrator: BaseEstimator
     params: Dict[str, Any]
+    # The table from which the values of the `calibration_filters` are looked
+    # up. If omitted, they are read from the images directly.
+    attributes: Optional[AttributeTable] = None
+    # Which of the `num_repeats` repetitions of the setup this experiment is.
+    repeat: int = 0
 
     def __str__(self):
         """
@@ -39,62 +50,55 @@ class Experiment:
             params_str
         ])).replace(':', '-')  # Windows forbids ':'
 
-    @staticmethod
-    @lru_cache(maxsize=None)
-    def get_scores_from_file(filename, pair_paths):
-        with open(filename, 'r') as f:
-            pairs_from_file = f.read().splitlines()
-            pairs_from_file = [pair.split(';') for pair in pairs_from_file]
-
-        pairs_from_file_dict = dict()
-        for pair in pairs_from_file:
-            if len(pair) != 3:
-                print(f'some issue with results file: {pair}')
-                res = -1
-            else:
-                res = float(pair[2])
-            pairs_from_file_dict[
-                f'{pair[0]}_{pair[1]}'] = res
-            pairs_from_file_dict[
-                f'{pair[1]}_{pair[0]}'] = res
-
-        p = []
-        for pair_path in pair_paths:
-            match = pairs_from_file_dict.get(f'{pair_path[0]}_{pair_path[1]}')
-            if not match:
-                match = -1
-            p.append([1-match, match])
-        return p
+    @property
+    def fingerprint(self) -> str:
+        """
+        Returns a hash of the configuration of this experiment that is stable
+        across runs, so that results can be matched to experiments when a run
+        is resumed.
 
-    def get_pairs_from_file(self, filename, cal_or_test):
-        with open(filename, 'r') as f:
-            pairs_from_file = f.read().splitlines()
-            pairs_from_file = [pair.split(';') for pair in pairs_from_file]
+        :return: str
+        """
+        return md5(';'.join([str(self.scorer),
+                             str(self.calibrator),
+                             self.data_id,
+                             str(self.params),
+                             str(self.repeat)]))
 
-        # get all images
-        images = list()
-        image_path_dict = defaultdict(list)
-        for dataset in self.data_config[cal_or_test]:
-            images += dataset.images
-        for image in images:
-            image_path_dict[image.path] = image
-
-        pairs = []
-        for pair_in_file in pairs_from_file:
-            first = image_path_dict[pair_in_file[0]]
-            second = image_path_dict[pair_in_file[1]]
-            if isinstance(first, FaceImage) and isinstance(second, FaceImage):
-                pairs.append(FacePair(first, second))
-            else:
-                print(f'Could not find {pair_in_file[0]} and/or {pair_in_file[1]} image in dataset images.')
-        pair_categories = [(
-            self.get_values_for_categories(pair.first),
-            self.get_values_for_categories(pair.second))
-            for pair in pairs]
+    @property
+    def data_id(self) -> str:
+        """
+        Returns a description of the `data_config` that includes the
+        constructor arguments of the datasets (see `Dataset.__repr__()`), to
+        be hashed into keys.
+
+        :return: str
+        """
+        return ';'.join('|'.join(map(repr, v)) if isinstance(v, tuple)
+                        else repr(v) for v in self.data_config.values())
 
+    def get_pairs_from_file(self, filename, cal_or_test):
+        """
+        Reads the pairs from the binary pair list corresponding to the text
+        pair list `filename` and divides them into categories. Text pair lists
+        that have not been converted yet, or that changed since they were
+        converted, are converted first.
+        """
+        images_by_path = get_images_by_path(self.data_config[cal_or_test])
+        path = get_pair_list_path(filename)
+        if not is_converted(filename):
+            convert_text_pair_list(filename, images_by_path)
+        pairs = load_pair_list(path).to_indexed_pairs(images_by_path)
+
+        # Look up the categories per image in the image table, rather than
+        # twice for every pair.
+        self._compute_attributes(image for image in pairs.images if image)
+        image_categories = [self.get_values_for_categories(image)
+                            if image else None for image in pairs.images]
         pairs_per_category = defaultdict(list)
-        for category, pair in zip(pair_categories, pairs):
-            pairs_per_category[category].append(pair)
+        for pair, i, j in zip(pairs, pairs.first, pairs.second):
+            pairs_per_category[
+                (image_categories[i], image_categories[j])].append(pair)
 
         return pairs_per_category
 
@@ -115,6 +119,37 @@ class Experiment:
         Dict[Tuple, List[FacePair]],
         Dict[Tuple, List[FacePair]]
     ]:
+        calibration_pairs_per_category, test_pairs_per_category = \
+            self.make_calibration_and_test_pairs()
+
+        for pairs in calibration_pairs_per_category.values():
+            for pair in pairs:
+                all_calibration_pairs.add((pair.first.path, pair.second.path))
+        PairList.from_pairs(
+            [pair for pairs in calibration_pairs_per_category.values()
+             for pair in pairs]
+        ).save(get_pair_list_path(
+            f'cal_pairs_{self.params["calibration_filters"]}.txt'))
+
+        # Save the test pairs in the order of the datasets.
+        test_pairs = []
+        for dataset in self.data_config['test']:
+            test_pairs += dataset.pairs
+        for pair in test_pairs:
+            all_test_pairs.add((pair.first.path, pair.second.path))
+        PairList.from_pairs(test_pairs).save(get_pair_list_path(
+            f'test_pairs_{self.params["calibration_filters"]}.txt'))
+
+        return calibration_pairs_per_category, test_pairs_per_category
+
+    def make_calibration_and_test_pairs(self) -> Tuple[
+        Dict[Tuple, List[FacePair]],
+        Dict[Tuple, List[FacePair]]
+    ]:
+        """
+        Makes the calibration and test pairs per category, like
+        `get_calibration_and_test_pairs()`, but without saving them.
+        """
         assert isinstance(self.data_config['calibration'], tuple)
         assert isinstance(self.data_config['test'], tuple)
 
@@ -123,6 +158,13 @@ class Experiment:
         for dataset in self.data_config['calibration']:
             calibration_images += dataset.images
 
+        test_pairs = []
+        for dataset in self.data_config['test']:
+            test_pairs += dataset.pairs
+        self._compute_attributes(
+            calibration_images
+            + [image for pair in test_pairs for image in pair])
+
         # filter the images per category
         calibration_images_per_category = defaultdict(list)
         for image in calibration_images:
@@ -132,23 +174,16 @@ class Experiment:
 
         calibration_pairs_per_category = {}
 
-        with open(f'cal_pairs_{self.params["calibration_filters"]}.txt', 'w') as f:
-            for category_a, images_a in calibration_images_per_category.items():
-                for category_b, images_b in \
-                        calibration_images_per_category.items():
-                    pairs = make_pairs_from_two_lists(images_a, images_b)
-                    # only add if there are both same and different source pairs
-                    if 0 < np.sum([pair.same_identity for pair in pairs]) < \
-                            len(pairs):
-                        calibration_pairs_per_category[(category_a, category_b)] \
-                            = pairs
-                        for pair in pairs:
-                            all_calibration_pairs.add((pair.first.path, pair.second.path))
-                            f.write(pair.first.path + ';' + pair.second.path + '\n')
+        for category_a, images_a in calibration_images_per_category.items():
+            for category_b, images_b in \
+                    calibration_images_per_category.items():
+                pairs = make_pairs_from_two_lists(images_a, images_b)
+                # only add if there are both same and different source pairs
+                if 0 < np.sum([pair.same_identity for pair in pairs]) < \
+                        len(pairs):
+                    calibration_pairs_per_category[(category_a, category_b)] \
+                        = pairs
 
-        test_pairs = []
-        for dataset in self.data_config['test']:
-            test_pairs += dataset.pairs
         test_pair_categories = [(
             self.get_values_for_categories(pair.first),
             self.get_values_for_categories(pair.second))
@@ -158,14 +193,18 @@ class Experiment:
         for category, pair in zip(test_pair_categories, test_pairs):
             test_pairs_per_category[category].append(pair)
 
-        with open(f'test_pairs_{self.params["calibration_filters"]}.txt', 'w') as f:
-            for pair in test_pairs:
-                all_test_pairs.add((pair.first.path, pair.second.path))
-                f.write(pair.first.path + ';' + pair.second.path + '\n')
-
         return calibration_pairs_per_category, test_pairs_per_category
 
+    def _compute_attributes(self, images: Iterable[FaceImage]):
+        # Derived attributes such as quality scores are much cheaper to
+        # compute for all images at once than one image at a time.
+        if self.attributes and self.attributes.compute_missing:
+            self.attributes.compute(images)
+
     def get_values_for_categories(self, image: FaceImage):
+        if self.attributes:
+            return self.attributes.get_values_for_categories(
+                image, self.params['calibration_filters'])
         return tuple(getattr(image, prop)
                      for prop in self.params['calibration_filters'])
 
@@ -176,13 +215,21 @@ class ExperimentalSetup:
                  calibrator_names: List[str],
                  data_config_names: List[str],
                  param_names: List[str],
-                 num_repeats: int):
-        self.scorers = self._get_scorers(scorer_names)
+                 num_repeats: int,
+                 name: Optional[str] = None):
+        self.scorer_names = scorer_names or SCORERS['current_set_up']
+        self.scorers = self._get_scorers(self.scorer_names)
+        # Scores only depend on the scorer and the pair, so they are shared by
+        # all experiments, whatever their calibrator or params.
+        self.score_cache = ScoreCache()
+        for scorer in self.scorers:
+            scorer.score_cache = self.score_cache
         self.calibrators = self._get_calibrators(calibrator_names)
         self.data_config = self._get_data_config(data_config_names)
         self.params = self._get_params(param_names)
         self.num_repeats = num_repeats
-        self.name = datetime.now().strftime("%Y-%m-%d %H %M %S")
+        self.name = name or datetime.now().strftime("%Y-%m-%d %H %M %S")
+        self.attributes = AttributeTable(self.filter_properties)
         self.experiments = self.prepare_experiments()
 
     def prepare_experiments(self) -> List[Experiment]:
@@ -200,9 +247,40 @@ class ExperimentalSetup:
                             data_config,
                             scorer,
                             calibrator,
-                            params
+                            params,
+                            self.attributes
                         ))
-        return experiments * self.num_repeats
+        return [replace(experiment, repeat=repeat)
+                for repeat in range(self.num_repeats)
+                for experiment in experiments]
+
+    def get_scorer_name(self, experiment: Experiment) -> str:
+        """
+        Returns the SCORERS configuration name of the scorer of `experiment`.
+
+        :param experiment: Experiment
+        :return: str
+        """
+        for name, scorer in zip(self.scorer_names, self.scorers):
+            if scorer is experiment.scorer:
+                return name
+        raise ValueError(f'{experiment} is not part of this setup')
+
+    def precompute_attributes(self, n_jobs: Optional[int] = None):
+        """
+        Computes the values of all `filter_properties` for all images that are
+        used by any of the data configurations, so that assigning images to
+        categories in the experiments is a simple lookup.
+
+        :param n_jobs: Optional[int]
+        """
+        images = []
+        for data_config in self.data_config:
+            for dataset in data_config['calibration']:
+                images += dataset.images
+            for dataset in data_config['test']:
+                images += [image for pair in dataset.pairs for image in pair]
+        self.attributes.compute(images, n_jobs)
 
     def __iter__(self) -> Iterator[Experiment]:
         return iter(self.experiments)
@@ -288,6 +366,17 @@ class ExperimentalSetup:
         """
         return list(set(k for v in PARAMS['all'].values() for k in v.keys()))
 
+    @property
+    def filter_properties(self) -> List[str]:
+        """
+        Returns all image properties that are used as a calibration filter in
+        any of the PARAMS configurations.
+
+        :return: List[str]
+        """
+        return sorted(set(prop for v in PARAMS['all'].values()
+                          for prop in v.get('calibration_filters', [])))
+
     @property
     def data_keys(self) -> List[str]:
         """
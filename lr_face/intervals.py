@@ -0,0 +1,204 @@
+"""
+Bootstrap confidence intervals of the metrics of the LRs of the test pairs.
+Unlike `lr_face.bootstrap`, which refits the calibrators, the LR system is
+kept fixed and only the test pairs are resampled, which gives the
+uncertainty of the metrics due to the limited number of test pairs.
+
+Resampling with replacement is represented by the number of times each pair
+is drawn, so a replicate is a row of counts. The metrics of a block of
+replicates are then computed at once with array operations:
+
+- Cllr and accuracy are weighted means of a value per pair, i.e. a matrix
+  product of the counts with that value;
+- AUC is the Mann-Whitney statistic, computed from the cumulative counts of
+  the H2 pairs over the sorted scores (ties count for half, like
+  `sklearn.metrics.roc_auc_score`).
+
+The H1 and H2 pairs are resampled separately, so each replicate has as many
+of both as the test set. Blocks of replicates can be spread over processes;
+each block gets its own seed, so the result does not depend on the number
+of processes.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+INTERVAL_METRICS = ['cllr', 'auc', 'accuracy']
+# The maximum number of counts in a block of replicates, to bound memory use.
+MAX_BLOCK_SIZE = 2 ** 22
+
+
+def resample_counts(num_replicates: int,
+                    n: int,
+                    rng: np.random.Generator) -> np.ndarray:
+    """
+    Returns how often each of `n` items is drawn in each of `num_replicates`
+    resamples of size `n` with replacement, as a (num_replicates, n) array.
+
+    :param num_replicates: int
+    :param n: int
+    :param rng: np.random.Generator
+    :return: np.ndarray
+    """
+    indices = rng.integers(0, n, (num_replicates, n))
+    # Give each replicate its own range of bins, so a single `bincount`
+    # counts all of them.
+    offsets = np.arange(num_replicates)[:, None] * n
+    return np.bincount((indices + offsets).ravel(),
+                       minlength=num_replicates * n) \
+        .reshape(num_replicates, n)
+
+
+def replicate_metrics(scores: np.ndarray,
+                      lrs: np.ndarray,
+                      y: np.ndarray,
+                      counts_h1: np.ndarray,
+                      counts_h2: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Returns the Cllr, AUC and accuracy of each replicate, given how often
+    each H1 and H2 pair is drawn in it (`counts_h1` and `counts_h2`, one row
+    per replicate). Cllr is not rounded.
+
+    :param scores: np.ndarray
+    :param lrs: np.ndarray
+    :param y: np.ndarray
+    :param counts_h1: np.ndarray
+    :param counts_h2: np.ndarray
+    :return: Dict[str, np.ndarray]
+    """
+    h1, h2 = y == 1, y == 0
+    n1, n2 = np.sum(h1), np.sum(h2)
+    with np.errstate(divide='ignore', over='ignore'):
+        cost_h1 = np.log2(1 + 1 / lrs[h1])
+        cost_h2 = np.log2(1 + lrs[h2])
+    cllr = (_weighted_sum(counts_h1, cost_h1) / n1
+            + _weighted_sum(counts_h2, cost_h2) / n2) / 2
+    correct_h1 = (scores[h1] > .5).astype(float)
+    correct_h2 = (scores[h2] <= .5).astype(float)
+    accuracy = (counts_h1 @ correct_h1 + counts_h2 @ correct_h2) / (n1 + n2)
+    return {'cllr': cllr,
+            'auc': _auc(scores[h1], scores[h2], counts_h1, counts_h2),
+            'accuracy': accuracy}
+
+
+def confidence_intervals(scores: np.ndarray,
+                         lrs: np.ndarray,
+                         y: np.ndarray,
+                         num_replicates: int,
+                         alpha: float = .05,
+                         n_jobs: Optional[int] = 1,
+                         seed: int = 0) -> Dict[str, float]:
+    """
+    Returns the percentile bootstrap confidence interval of each metric in
+    `INTERVAL_METRICS` over `num_replicates` resamples of the test pairs, as
+    `<metric>_ci_low` and `<metric>_ci_high`. The replicates are computed in
+    blocks, on a pool of `n_jobs` processes if it is not 1.
+
+    :param scores: np.ndarray
+    :param lrs: np.ndarray, post-processed like in `evaluate()`
+    :param y: np.ndarray
+    :param num_replicates: int
+    :param alpha: float
+    :param n_jobs: Optional[int], None for the number of processors
+    :param seed: int
+    :return: Dict[str, float]
+    """
+    scores, lrs, y = (np.asarray(a, dtype=float) for a in (scores, lrs, y))
+    if not 0 < np.sum(y) < len(y):
+        return {f'{metric}_ci_{bound}': np.nan
+                for metric in INTERVAL_METRICS for bound in ['low', 'high']}
+    block_size = max(1, min(num_replicates, MAX_BLOCK_SIZE // len(y)))
+    sizes = [min(block_size, num_replicates - start)
+             for start in range(0, num_replicates, block_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    data = (scores, lrs, y)
+    if n_jobs == 1 or len(sizes) == 1:
+        _set_data(*data)
+        blocks = list(map(_evaluate_block, sizes, seeds))
+    else:
+        with ProcessPoolExecutor(
+                n_jobs,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_set_data,
+                initargs=data) as executor:
+            blocks = list(executor.map(_evaluate_block, sizes, seeds))
+
+    intervals = {}
+    for metric in INTERVAL_METRICS:
+        values = np.concatenate([block[metric] for block in blocks])
+        values = values[~np.isnan(values)]
+        with np.errstate(invalid='ignore'):
+            low, high = np.percentile(values, [100 * alpha / 2,
+                                               100 * (1 - alpha / 2)]) \
+                if len(values) else (np.nan, np.nan)
+        # Interpolating between two infinite values, which an LR of 0 for
+        # an H1 pair gives, yields nan rather than inf.
+        if np.isinf(values).any():
+            low, high = np.nan_to_num([low, high], nan=np.inf, posinf=np.inf)
+        intervals[f'{metric}_ci_low'] = low
+        intervals[f'{metric}_ci_high'] = high
+    return intervals
+
+
+# The test data that is shared by all blocks, set once per worker process.
+_data: Tuple = ()
+
+
+def _set_data(scores: np.ndarray, lrs: np.ndarray, y: np.ndarray):
+    global _data
+    _data = (scores, lrs, y)
+
+
+def _evaluate_block(num_replicates: int,
+                    seed: np.random.SeedSequence) -> Dict[str, np.ndarray]:
+    scores, lrs, y = _data
+    rng = np.random.default_rng(seed)
+    counts_h1 = resample_counts(num_replicates, int(np.sum(y == 1)), rng)
+    counts_h2 = resample_counts(num_replicates, int(np.sum(y == 0)), rng)
+    return replicate_metrics(scores, lrs, y, counts_h1, counts_h2)
+
+
+def _weighted_sum(counts: np.ndarray, values: np.ndarray) -> np.ndarray:
+    # Infinite values are left out of the product, since 0 * inf is nan for
+    # the replicates in which they are not drawn.
+    finite = np.isfinite(values)
+    total = counts[:, finite] @ values[finite]
+    if not np.all(finite):
+        drawn = counts[:, ~finite] @ np.ones(np.sum(~finite))
+        total = np.where(drawn > 0, np.inf, total)
+    return total
+
+
+def _auc(scores_h1: np.ndarray,
+         scores_h2: np.ndarray,
+         counts_h1: np.ndarray,
+         counts_h2: np.ndarray) -> np.ndarray:
+    # The counts of both classes per distinct score, in ascending order.
+    values, inverse = np.unique(np.concatenate([scores_h1, scores_h2]),
+                                return_inverse=True)
+    inverse_h1, inverse_h2 = inverse[:len(scores_h1)], inverse[len(scores_h1):]
+    per_value_h1 = _sum_columns(counts_h1, inverse_h1, len(values))
+    per_value_h2 = _sum_columns(counts_h2, inverse_h2, len(values))
+    # For each score, the number of H2 pairs with a lower score, plus half
+    # of those with the same score.
+    below_h2 = np.cumsum(per_value_h2, axis=1) - per_value_h2 / 2
+    return np.sum(per_value_h1 * below_h2, axis=1) \
+        / (len(scores_h1) * len(scores_h2))
+
+
+def _sum_columns(counts: np.ndarray,
+                 columns: np.ndarray,
+                 num_columns: int) -> np.ndarray:
+    order = np.argsort(columns, kind='stable')
+    sorted_columns = columns[order]
+    starts = np.flatnonzero(
+        np.r_[True, sorted_columns[1:] != sorted_columns[:-1]])
+    summed = np.zeros((len(counts), num_columns))
+    summed[:, sorted_columns[starts]] = np.add.reduceat(counts[:, order],
+                                                        starts, axis=1)
+    return summed
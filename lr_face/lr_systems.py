@@ -0,0 +1,237 @@
+"""
+Fitted calibrators, and the LR systems they make up with a scorer, on disk.
+
+Fitting a calibrator only depends on its configuration and on the calibration
+scores and labels of its category. `fit_calibrator()` therefore stores each
+fitted calibrator in the `ArtifactStore` under a hash of exactly those, and
+restores it instead of refitting whenever the same scores come along again:
+in a later run, but also in another experiment or data configuration that
+happens to have the same calibration scores for a category. Since the
+categories are independent, `fit_calibrators()` fits them on a pool of
+threads; the time it takes per category is recorded as a span.
+
+The calibrators of all categories of an experiment, together with the scorer
+they calibrate, form its LR system. `run.py` saves the LR system of every
+experiment as `output/<run>/lr_systems/<index>.obj` (see `save_lr_system()`),
+where the index is that of the experiment in the results. `load_lr_system()`
+turns it back into a `CalibratedScorer` per category, e.g. to compute LRs in
+casework without rerunning any experiment. If its calibrators are
+incremental (see `lr_face.calibrators`), `update_lr_system()` updates them
+with the scores of new calibration pairs, without the scores they were
+fitted on before (see `update_lr_system.py`).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Tuple, Optional
+
+import numpy as np
+from lir import CalibratedScorer
+from sklearn.base import BaseEstimator, clone
+
+from lr_face.models import Architecture, ScorerModel
+from lr_face.profiling import span
+from lr_face.stages import ArtifactStore
+from lr_face.utils import md5, get_tmp_path
+
+FITTED_CALIBRATORS_STAGE = 'fitted_calibrators'
+LR_SYSTEMS_DIR = 'lr_systems'
+
+
+@dataclass
+class LRSystem:
+    # The name and tag of the architecture of the scorer, from which the
+    # scorer can be loaded again.
+    architecture: str
+    tag: Optional[str]
+    calibrators: Dict[Tuple, BaseEstimator]
+
+
+def get_calibrator_key(calibrator: BaseEstimator,
+                       category: Tuple,
+                       X: np.ndarray,
+                       y: np.ndarray) -> str:
+    """
+    Returns a hash of the configuration of `calibrator`, the `category` and
+    the content of the scores `X` and labels `y` it is fitted on.
+
+    :param calibrator: BaseEstimator
+    :param category: Tuple
+    :param X: np.ndarray
+    :param y: np.ndarray
+    :return: str
+    """
+    data_hash = hashlib.md5()
+    for array in [X, y]:
+        array = np.ascontiguousarray(array)
+        data_hash.update(f'{array.dtype}{array.shape}'.encode())
+        data_hash.update(array.tobytes())
+    return md5(';'.join(['calibrator', str(calibrator), str(category),
+                         data_hash.hexdigest()]))
+
+
+def fit_calibrator(calibrator: BaseEstimator,
+                   category: Tuple,
+                   X: np.ndarray,
+                   y: np.ndarray,
+                   artifacts: Optional[ArtifactStore] = None) -> BaseEstimator:
+    """
+    Returns a copy of `calibrator` that is fitted on the scores `X` and
+    labels `y` of `category`, restoring it from `artifacts` if it was fitted
+    on the same scores and labels before.
+
+    :param calibrator: BaseEstimator
+    :param category: Tuple
+    :param X: np.ndarray
+    :param y: np.ndarray
+    :param artifacts: Optional[ArtifactStore]
+    :return: BaseEstimator
+    """
+    artifacts = artifacts or ArtifactStore(None)
+    X, y = np.asarray(X), np.asarray(y)
+
+    def fit():
+        fitted = clone(calibrator)
+        fitted.fit(X=X, y=y)
+        return fitted
+
+    return artifacts.get_or_compute(
+        FITTED_CALIBRATORS_STAGE,
+        get_calibrator_key(calibrator, category, X, y),
+        fit)
+
+
+def fit_calibrators(calibrator: BaseEstimator,
+                    data: Dict[Tuple, Tuple[np.ndarray, np.ndarray]],
+                    artifacts: Optional[ArtifactStore] = None,
+                    n_jobs: Optional[int] = 1) -> Dict[Tuple, BaseEstimator]:
+    """
+    Fits a copy of `calibrator` per category on the scores and labels of
+    that category in `data` (see `fit_calibrator()`), on a pool of `n_jobs`
+    threads, or in this thread if `n_jobs` is 1. Each category is fitted on
+    its own data only, so the result does not depend on `n_jobs`. The time
+    per category is recorded as a span `calibration.fit <category>`.
+
+    :param calibrator: BaseEstimator
+    :param data: Dict[Tuple, Tuple[np.ndarray, np.ndarray]]
+    :param artifacts: Optional[ArtifactStore]
+    :param n_jobs: Optional[int], None for the number of processors
+    :return: Dict[Tuple, BaseEstimator]
+    """
+    def fit(category: Tuple) -> BaseEstimator:
+        with span(f'calibration.fit {category}'):
+            return fit_calibrator(calibrator, category, *data[category],
+                                  artifacts)
+
+    if n_jobs == 1:
+        fitted = list(map(fit, data))
+    else:
+        with ThreadPoolExecutor(n_jobs) as executor:
+            fitted = list(executor.map(fit, data))
+    return dict(zip(data, fitted))
+
+
+def get_lr_system_path(lr_systems_dir: str, index: int) -> str:
+    """
+    Returns the path of the LR system of the experiment with `index` in the
+    results of a run, given the `lr_systems_dir` of that run.
+
+    :param lr_systems_dir: str
+    :param index: int
+    :return: str
+    """
+    return os.path.join(lr_systems_dir, f'{index}.obj')
+
+
+def save_lr_system(path: str,
+                   scorer: ScorerModel,
+                   calibrators: Dict[Tuple, BaseEstimator]):
+    """
+    Saves the LR system made up of `scorer` and the fitted `calibrators` per
+    category to `path`. Only the architecture and tag of the scorer are
+    saved, not its weights.
+
+    :param path: str
+    :param scorer: ScorerModel
+    :param calibrators: Dict[Tuple, BaseEstimator]
+    """
+    embedding_model = scorer.embedding_model
+    tag = embedding_model.tag
+    _write_lr_system(path, LRSystem(architecture=embedding_model.name,
+                                    tag=str(tag) if tag else None,
+                                    calibrators=calibrators))
+
+
+def load_lr_system(path: str, scorer: Optional[ScorerModel] = None) \
+        -> Dict[Tuple, CalibratedScorer]:
+    """
+    Loads the LR system saved at `path` as a `CalibratedScorer` per
+    category. The scorer is loaded from its architecture and tag, unless it
+    is given (e.g. because it was loaded already).
+
+    :param path: str
+    :param scorer: Optional[ScorerModel]
+    :return: Dict[Tuple, CalibratedScorer]
+    """
+    lr_system = _read_lr_system(path)
+    if scorer is None:
+        scorer = Architecture(lr_system.architecture).get_scorer_model(
+            lr_system.tag)
+    return {category: CalibratedScorer(scorer, calibrator)
+            for category, calibrator in lr_system.calibrators.items()}
+
+
+def update_lr_system(path: str,
+                     data: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                     output_path: Optional[str] = None) \
+        -> Dict[Tuple, BaseEstimator]:
+    """
+    Updates the calibrators of the LR system saved at `path` with the new
+    scores and labels per category in `data`, through their `partial_fit()`,
+    and saves the result to `output_path` (or `path` itself). Categories are
+    given as strings, as in the pair tables of the evaluation. Nothing is
+    updated if there is a category in `data` without a calibrator in the LR
+    system, or whose calibrator cannot be updated.
+
+    :param path: str
+    :param data: Dict[str, Tuple[np.ndarray, np.ndarray]]
+    :param output_path: Optional[str]
+    :return: Dict[Tuple, BaseEstimator], the updated calibrators
+    """
+    lr_system = _read_lr_system(path)
+    categories = {str(category): category
+                  for category in lr_system.calibrators}
+    unknown = [category for category in data if category not in categories]
+    if unknown:
+        raise ValueError(f'The LR system at {path} has no calibrators for '
+                         f'the categories {unknown}')
+    for category in data:
+        calibrator = lr_system.calibrators[categories[category]]
+        if not hasattr(calibrator, 'partial_fit'):
+            raise ValueError(f'The calibrator {calibrator} of category '
+                             f'{category} cannot be updated')
+
+    for category, (X, y) in data.items():
+        with span(f'calibration.partial_fit {category}'):
+            lr_system.calibrators[categories[category]].partial_fit(
+                np.asarray(X), np.asarray(y))
+    _write_lr_system(output_path or path, lr_system)
+    return lr_system.calibrators
+
+
+def _read_lr_system(path: str) -> LRSystem:
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _write_lr_system(path: str, lr_system: LRSystem):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = get_tmp_path(path)
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(lr_system, f)
+    os.replace(tmp_path, path)
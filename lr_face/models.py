@@ -1,8 +1,5 @@
 from __future__ import annotations
 
-import face_recognition
-import dlib
-
 import hashlib
 import importlib
 import math
@@ -11,35 +8,43 @@ import pickle
 import random
 import re
 from enum import Enum
-from typing import Tuple, List, Optional, Union, Dict
+from typing import Tuple, List, Optional, Union, Dict, TYPE_CHECKING
 
 import numpy as np
-import tensorflow as tf
-from scipy import spatial
-from tensorflow.python.keras.layers import Flatten, Dense, Input, Lambda
 
 from lr_face.data import FaceImage, FacePair, FaceTriplet, to_array, Augmenter
-from lr_face.losses import TripletLoss
+from lr_face.profiling import span
+from lr_face.scores import ScoreProvider, ScoreFileProvider, ScoreCache
 from lr_face.utils import cache
 from lr_face.versioning import Tag
 
+if TYPE_CHECKING:
+    # Tensorflow (and everything that depends on it) is only imported when a
+    # model is actually built, so that importing this module stays cheap.
+    import tensorflow as tf
+    from lr_face.losses import TripletLoss
+
 EMBEDDINGS_DIR = 'embeddings'
 WEIGHTS_DIR = 'weights'
+# The files with the scores that Facevacs computed for our calibration and
+# test pairs.
+FACEVACS_SCORE_FILES = ('results_cal_pairs.txt', 'results_test_pairs.txt')
 
 
-class DummyModel(tf.keras.Sequential):
+def build_dummy_model() -> tf.keras.Model:
     """
-    A dummy model that takes RGB images with dimensions 100x100 as input and
-    outputs random embeddings with dimensionality 100.
+    Builds a dummy model that takes RGB images with dimensions 100x100 as input
+    and outputs random embeddings with dimensionality 100.
     """
+    import tensorflow as tf
+    from tensorflow.python.keras.layers import Flatten, Dense, Input, Lambda
 
-    def __init__(self):
-        super().__init__([
-            Input(shape=(100, 100, 3)),
-            Flatten(),
-            Dense(100),
-            Lambda(lambda x: tf.math.l2_normalize(x, axis=1))
-        ])
+    return tf.keras.Sequential([
+        Input(shape=(100, 100, 3)),
+        Flatten(),
+        Dense(100),
+        Lambda(lambda x: tf.math.l2_normalize(x, axis=1))
+    ])
 
 
 class FaceRecognition():
@@ -52,6 +57,8 @@ class FaceRecognition():
         self.input_shape = (None, None)  # face_recognition accepts any size
 
     def predict(self, x):
+        import face_recognition
+
         embed = None
         # embed = np.ones(128)
         # Compulsory to process already cropped faces.
@@ -67,11 +74,19 @@ class FaceRecognition():
 class ScorerModel:
     """
     A wrapper around an `EmbeddingModel` that converts the embeddings of image
-    pairs into (dis)similarity scores.
+    pairs into (dis)similarity scores. If a `score_provider` is given, the
+    scores are taken from there instead (e.g. for Facevacs, whose scores are
+    read from file). If a `score_cache` is set, every pair is only scored
+    once.
     """
 
-    def __init__(self, embedding_model: EmbeddingModel):
+    def __init__(self,
+                 embedding_model: EmbeddingModel,
+                 score_provider: Optional[ScoreProvider] = None,
+                 score_cache: Optional[ScoreCache] = None):
         self.embedding_model = embedding_model
+        self.score_provider = score_provider
+        self.score_cache = score_cache
 
     def predict_proba_per_category(self,
                                    X_per_category: Dict[List[FacePair]]) \
@@ -93,6 +108,16 @@ class ScorerModel:
         :param X: List[FacePair]
         :return np.ndarray
         """
+        with span('predict_proba'):
+            if self.score_cache is not None:
+                return self.score_cache.get_scores(str(self), X, self._score)
+            return self._score(X)
+
+    def _score(self, X: List[FacePair]) -> np.ndarray:
+        if self.score_provider:
+            scores = self.score_provider.get_scores(X).astype(float)
+            return np.stack([1 - scores, scores], axis=1)
+
         scores = []
         rm_pair = []
         cache_dir = EMBEDDINGS_DIR
@@ -116,6 +141,33 @@ class ScorerModel:
         return name
 
 
+def get_embedding_path(model_name: str,
+                       image: FaceImage,
+                       cache_dir: str) -> str:
+    """
+    Returns the path where `EmbeddingModel.embed()` caches the embedding of
+    `image` by the embedding model named `model_name` (i.e. `str(model)`).
+    This does not require the model itself, so it can be used to check which
+    embeddings are cached without loading any model.
+
+    :param model_name: str
+    :param image: FaceImage
+    :param cache_dir: str
+    :return: str
+    """
+
+    def md5(text: str) -> str:
+        return hashlib.md5(text.encode()).hexdigest()
+
+    return os.path.join(
+        cache_dir,
+        model_name.replace(':', '-'),  # Windows compatibility
+        image.source or '_',
+        md5(image.path),
+        f'{md5(model_name + str(image) + str(cache_dir))}.obj'
+    )
+
+
 class EmbeddingModel:
     def __init__(self,
                  model: tf.keras.Model,
@@ -149,40 +201,33 @@ class EmbeddingModel:
         :return: np.ndarray
         """
         # For face_recognition model, RGB int32 image is required.
-        kwargs = locals()
-        if self.name == 'face_recognition':
-            x = image.get_image(RGB=True, normalize=False)
-        else:
-            x = image.get_image(self.resolution, normalize=True)
-            x = np.expand_dims(x, axis=0)
+        with span('embed.decode'):
+            if self.name == 'face_recognition':
+                x = image.get_image(RGB=True, normalize=False)
+            else:
+                x = image.get_image(self.resolution, normalize=True)
+                x = np.expand_dims(x, axis=0)
 
         if cache_dir:
-            def md5(text: str) -> str:
-                return hashlib.md5(text.encode()).hexdigest()
-
-            output_path = os.path.join(
-                cache_dir,
-                str(self).replace(':', '-'),  # Windows compatibility
-                image.source or '_',
-                md5(image.path),
-                f'{md5("".join(map(str, kwargs.values())))}.obj'
-            )
+            output_path = get_embedding_path(str(self), image, cache_dir)
 
             # If the embedding has been cached before, load and return it.
             if os.path.exists(output_path):
-                with open(output_path, 'rb') as f:
+                with span('embed.load'), open(output_path, 'rb') as f:
                     return pickle.load(f)
 
             # If the embedding has not been cached to disk yet: compute the
             # embedding, cache it afterwards and then return the result.
-            embedding = self.model.predict(x)[0]
+            with span('embed.inference'):
+                embedding = self.model.predict(x)[0]
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             with open(output_path, 'wb') as f:
                 pickle.dump(embedding, f)
             return embedding
 
         # If no `cache_dir` is specified, we simply compute the embedding.
-        return self.model.predict(x)[0]
+        with span('embed.inference'):
+            return self.model.predict(x)[0]
 
     def load_weights(self, tag: Tag):
         weights_path = self.get_weights_path(tag)
@@ -217,6 +262,39 @@ class EmbeddingModel:
         return self.name
 
 
+class LazyEmbeddingModel(EmbeddingModel):
+    """
+    An `EmbeddingModel` that only builds the base model of its `architecture`
+    (and loads the weights of its `tag`) the first time it is used. Its name,
+    tag and weights path are known without loading anything, so experiments
+    can be set up, keyed and queued without any network or tensorflow.
+    """
+
+    def __init__(self, architecture: Architecture, tag: Optional[Tag]):
+        self.architecture = architecture
+        self.tag = tag
+        self.model_dir = architecture.model_dir
+        self.name = architecture.value
+        self._model = None
+        # Fail as early as the eager model would.
+        if tag and not os.path.exists(self.get_weights_path(tag)):
+            raise ValueError(f"Unable to load weights for {tag}: "
+                             f"Could not find weights at "
+                             f"{self.get_weights_path(tag)}")
+
+    @property
+    def model(self) -> tf.keras.Model:
+        if self._model is None:
+            self._model = self.architecture.get_model()
+            if self.tag:
+                self.load_weights(self.tag)
+        return self._model
+
+    @property
+    def resolution(self) -> Tuple[int, int]:
+        return self.model.input_shape[1:3]
+
+
 class TripletEmbeddingModel(EmbeddingModel):
     """
     A subclass of EmbeddingModel that can be used to finetune an existing,
@@ -260,6 +338,8 @@ class TripletEmbeddingModel(EmbeddingModel):
         )
 
     def build_trainable_model(self) -> tf.keras.Model:
+        import tensorflow as tf
+
         input_shape = (*self.resolution, 3)
         anchors = tf.keras.layers.Input(input_shape)
         positives = tf.keras.layers.Input(input_shape)
@@ -331,7 +411,7 @@ class Architecture(Enum):
             return module.loadModel()
 
         if self == self.DUMMY or self == self.FACEVACS: # Facevacs scores come from file, so uses dummy
-            return DummyModel()
+            return build_dummy_model()
 
         if self == self.FACERECOGNITION:
             return FaceRecognition()
@@ -367,7 +447,14 @@ class Architecture(Enum):
             self,
             tag: Optional[Union[str, Tag]] = None
     ) -> ScorerModel:
-        embedding_model = self.get_embedding_model(tag, use_triplets=False)
+        # The network is only loaded once the scorer embeds an image, which
+        # the Facevacs scorer never does.
+        if isinstance(tag, str):
+            tag = Tag(tag)
+        embedding_model = LazyEmbeddingModel(self, tag)
+        if self == self.FACEVACS:
+            return ScorerModel(embedding_model,
+                               ScoreFileProvider(FACEVACS_SCORE_FILES))
         return ScorerModel(embedding_model)
 
     def get_latest_version(self, tag: Union[str, Tag]) -> int:
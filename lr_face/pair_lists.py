@@ -0,0 +1,217 @@
+"""
+A compact binary format for lists of image pairs, as a replacement for the
+`path;path` text files that are written for each experiment.
+
+A pair list file consists of four consecutive `.npy` records:
+
+1. The image table: the paths of all images in the pair list, encoded as one
+   newline separated utf-8 string (dtype uint8).
+2. The indices of the first image of each pair in the image table (int32).
+3. The indices of the second image of each pair in the image table (int32).
+4. A bitmap that tells whether the two images of each pair share the same
+   identity (see `np.packbits`).
+
+The index and label arrays are memory mapped when a pair list is loaded, and
+each file is only loaded once per process (as long as it is not modified).
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Union
+
+import numpy as np
+
+from lr_face.data import FaceImage, FacePair, IndexedPairs, Dataset
+from lr_face.utils import cache, get_tmp_path
+
+PAIR_LIST_EXTENSION = '.pairs'
+
+
+@dataclass(eq=False)
+class PairList:
+    paths: List[str]
+    first: np.ndarray
+    second: np.ndarray
+    same_identity_mask: np.ndarray
+
+    @classmethod
+    def from_pairs(cls,
+                   pairs: Union[IndexedPairs, List[FacePair]]) -> PairList:
+        if not isinstance(pairs, IndexedPairs):
+            pairs = IndexedPairs.from_pairs(pairs)
+        return cls([image.path for image in pairs.images],
+                   pairs.first,
+                   pairs.second,
+                   pairs.same_identity_mask)
+
+    @property
+    def same_identity(self) -> np.ndarray:
+        return np.unpackbits(self.same_identity_mask,
+                             count=len(self)).astype(bool)
+
+    def to_indexed_pairs(self,
+                         images_by_path: Dict[str, FaceImage]) -> IndexedPairs:
+        """
+        Resolves the paths in the image table to the `FaceImage` instances in
+        `images_by_path`. Pairs with an image that cannot be found are left
+        out.
+
+        :param images_by_path: Dict[str, FaceImage]
+        :return: IndexedPairs
+        """
+        images = [images_by_path.get(path) for path in self.paths]
+        missing = np.array([image is None for image in images], dtype=bool)
+        pairs = IndexedPairs(images,
+                             np.asarray(self.first),
+                             np.asarray(self.second),
+                             np.asarray(self.same_identity_mask))
+        if np.any(missing):
+            keep = ~(missing[pairs.first] | missing[pairs.second])
+            for i in np.flatnonzero(~keep):
+                print(f'Could not find {self.paths[pairs.first[i]]} and/or '
+                      f'{self.paths[pairs.second[i]]} image in dataset '
+                      f'images.')
+            pairs = pairs[keep]
+        return pairs
+
+    def save(self, path: str):
+        """
+        Writes the pair list to `path`. The file is replaced atomically, so
+        concurrent readers never see a partially written file.
+        """
+        table = np.frombuffer('\n'.join(self.paths).encode(), dtype=np.uint8)
+        tmp_path = get_tmp_path(path)
+        with open(tmp_path, 'wb') as f:
+            for array in [table,
+                          np.asarray(self.first, dtype=np.int32),
+                          np.asarray(self.second, dtype=np.int32),
+                          np.asarray(self.same_identity_mask, dtype=np.uint8)]:
+                np.save(f, array)
+        os.replace(tmp_path, path)
+
+    def __len__(self) -> int:
+        return len(self.first)
+
+
+def load_pair_list(path: str) -> PairList:
+    """
+    Loads the pair list stored at `path`. Each file is only read once per
+    process, unless it has been modified since it was last loaded.
+
+    :param path: str
+    :return: PairList
+    """
+    return _load_pair_list(path, os.path.getmtime(path))
+
+
+@cache
+def _load_pair_list(path: str, mtime: float) -> PairList:
+    arrays = []
+    with open(path, 'rb') as f:
+        for _ in range(4):
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(f)
+            else:
+                header = np.lib.format.read_array_header_2_0(f)
+            shape, _, dtype = header
+            offset = f.tell()
+            if np.prod(shape) == 0:
+                arrays.append(np.empty(shape, dtype=dtype))
+            else:
+                arrays.append(np.memmap(path, dtype=dtype, mode='r',
+                                        offset=offset, shape=shape))
+            f.seek(offset + int(np.prod(shape)) * dtype.itemsize)
+    table, first, second, same_identity_mask = arrays
+    paths = bytes(table).decode().split('\n') if len(table) else []
+    return PairList(paths, first, second, same_identity_mask)
+
+
+@cache
+def get_images_by_path(datasets: Tuple[Dataset, ...]) -> Dict[str, FaceImage]:
+    """
+    Returns a mapping from path to `FaceImage` for all images in `datasets`.
+    The mapping is only built once per combination of datasets.
+
+    :param datasets: Tuple[Dataset, ...]
+    :return: Dict[str, FaceImage]
+    """
+    return {image.path: image
+            for dataset in datasets for image in dataset.images}
+
+
+def get_pair_list_path(text_path: str) -> str:
+    """
+    Returns the path of the binary pair list corresponding to the text pair
+    list at `text_path`, e.g. 'cal_pairs_[].txt' -> 'cal_pairs_[].pairs'.
+    """
+    return os.path.splitext(text_path)[0] + PAIR_LIST_EXTENSION
+
+
+def is_converted(text_path: str) -> bool:
+    """
+    Returns whether the binary pair list of the text pair list at `text_path`
+    exists and is up to date, i.e. not older than the text file (if any).
+
+    :param text_path: str
+    :return: bool
+    """
+    path = get_pair_list_path(text_path)
+    if not os.path.exists(path):
+        return False
+    return not os.path.exists(text_path) \
+        or os.path.getmtime(text_path) <= os.path.getmtime(path)
+
+
+def convert_text_pair_list(text_path: str,
+                           images_by_path: Dict[str, FaceImage]) -> str:
+    """
+    Converts a text file with one `path;path` pair per line to a binary pair
+    list next to it and returns the path of the binary file. The images are
+    needed to determine whether the images of each pair share the same
+    identity; pairs with images that are not in `images_by_path` are left out.
+
+    :param text_path: str
+    :param images_by_path: Dict[str, FaceImage]
+    :return: str
+    """
+    with open(text_path, 'r') as f:
+        lines = [line.split(';') for line in f.read().splitlines()]
+
+    pairs = []
+    for line in lines:
+        first = images_by_path.get(line[0])
+        second = images_by_path.get(line[1])
+        if first and second:
+            pairs.append(FacePair(first, second))
+        else:
+            print(f'Could not find {line[0]} and/or {line[1]} image in '
+                  f'dataset images.')
+
+    path = get_pair_list_path(text_path)
+    PairList.from_pairs(pairs).save(path)
+    return path
+
+
+def main(text_paths: List[str], data: str, side: str):
+    from params import DATA
+    images_by_path = get_images_by_path(DATA['all'][data][side])
+    for text_path in text_paths:
+        path = convert_text_pair_list(text_path, images_by_path)
+        print(f'Converted {text_path} to {path}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Convert `path;path` text pair lists to binary pair '
+                    'lists')
+    parser.add_argument('text_paths', nargs='+')
+    parser.add_argument('--data', '-d', required=True,
+                        help='The DATA configuration in \'params.py\' that '
+                             'the images in the pair lists come from')
+    parser.add_argument('--side', choices=['calibration', 'test'],
+                        required=True)
+    main(**vars(parser.parse_args()))
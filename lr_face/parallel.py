@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import math
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import List, Any, Callable, Hashable, Tuple, Union, Dict, \
+    Optional
+
+import numpy as np
+
+
+@dataclass
+class TaskFailure:
+    """
+    Takes the place of the result of a task that raised an exception, or
+    whose worker process died.
+    """
+    index: int
+    traceback: str
+
+    def __str__(self) -> str:
+        return self.traceback
+
+
+def make_chunks(groups: List[Hashable], n_jobs: int) -> List[List[int]]:
+    """
+    Divides the indices of `groups` into chunks of indices that share the same
+    group, keeping the original order within each chunk. Each group is split
+    into just enough chunks to keep `n_jobs` workers busy, so that the
+    expensive state of a group (e.g. a network) is loaded by as few workers
+    as possible.
+
+    :param groups: List[Hashable], the group of each task
+    :param n_jobs: int
+    :return: List[List[int]]
+    """
+    indices_per_group: Dict[Hashable, List[int]] = dict()
+    for i, group in enumerate(groups):
+        indices_per_group.setdefault(group, []).append(i)
+    if not indices_per_group:
+        return []
+    num_chunks = math.ceil(n_jobs / len(indices_per_group))
+    return [chunk.tolist()
+            for indices in indices_per_group.values()
+            for chunk in np.array_split(indices, num_chunks) if len(chunk)]
+
+
+def _run_chunk(function: Callable[[Any], Any],
+               chunk: List[Tuple[int, Any]]) -> List[Any]:
+    results = []
+    for index, task in chunk:
+        try:
+            results.append(function(task))
+        except Exception:
+            results.append(TaskFailure(index, traceback.format_exc()))
+    return results
+
+
+def run_grouped(function: Callable[[Any], Any],
+                tasks: List[Any],
+                groups: List[Hashable],
+                n_jobs: int,
+                callback: Optional[Callable[[int, Any], None]] = None) \
+        -> List[Union[Any, TaskFailure]]:
+    """
+    Calls `function(task)` for all `tasks` on a pool of `n_jobs` processes
+    and returns the results in the order of `tasks`. Tasks with the same
+    group are run by the same worker where possible (see `make_chunks()`).
+
+    A task that raises an exception does not affect the other tasks: its
+    result is a `TaskFailure` with the traceback. If a worker process dies,
+    all tasks that did not finish get a `TaskFailure` instead.
+
+    If a `callback` is given, it is called with the index and the result of
+    each task as soon as the chunk of that task is done.
+
+    The processes are started with 'spawn', since forking a process that has
+    initialized Tensorflow is not safe. `function` and `tasks` therefore need
+    to be picklable.
+
+    :param function: Callable[[Any], Any]
+    :param tasks: List[Any]
+    :param groups: List[Hashable], the group of each task
+    :param n_jobs: int
+    :param callback: Optional[Callable[[int, Any], None]]
+    :return: List[Union[Any, TaskFailure]]
+    """
+    results: List[Any] = [None] * len(tasks)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(n_jobs, mp_context=context) as executor:
+        futures = {
+            executor.submit(_run_chunk,
+                            function,
+                            [(i, tasks[i]) for i in chunk]): chunk
+            for chunk in make_chunks(groups, n_jobs)}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                chunk_results = future.result()
+            except Exception:
+                message = traceback.format_exc()
+                chunk_results = [TaskFailure(i, message) for i in chunk]
+            for i, result in zip(chunk, chunk_results):
+                results[i] = result
+                if callback:
+                    callback(i, result)
+    return results
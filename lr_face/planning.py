@@ -0,0 +1,283 @@
+"""
+Estimates the size and duration of an experimental setup without loading any
+model (`run.py --plan`).
+
+The pairs of each combination of data configuration and params are made (or
+read from their pair lists) and counted per category. Since scores are shared
+by all experiments of a scorer (see `ScoreCache`) and embeddings are cached
+on disk, the cost of a scorer mostly depends on the number of distinct images
+it has to embed and on how many of those embeddings are cached already.
+
+The duration is estimated from the throughput measured in earlier runs, per
+architecture, which `run.py` records in `THROUGHPUT_FILE` after each run:
+the mean time to decode an image, to compute an embedding and to load a
+cached one, and the mean time an experiment spends on anything but scoring.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Dict, Tuple, Any
+
+from lr_face.attributes import AttributeTable
+from lr_face.data import FacePair
+from lr_face.experiments import ExperimentalSetup, Experiment
+from lr_face.models import Architecture, EMBEDDINGS_DIR, get_embedding_path
+from lr_face.profiling import Profiler
+from lr_face.utils import get_tmp_path
+from lr_face.versioning import Tag
+
+THROUGHPUT_FILE = 'throughput.json'
+EMBED_SPANS = ['embed.decode', 'embed.inference', 'embed.load']
+# Scorers of these architectures read their scores from a file, rather than
+# computing embeddings.
+SCORE_FILE_ARCHITECTURES = [Architecture.FACEVACS]
+
+
+@dataclass
+class ScorerPlan:
+    name: str
+    # The name of the embedding model, which also names its embeddings cache.
+    model_name: str
+    architecture: Architecture
+    num_experiments: int
+    num_pairs: int
+    num_images: int
+    # None if the scores are read from a file.
+    num_cached: Optional[int]
+    # None if the throughput of the architecture was never measured.
+    seconds: Optional[float]
+
+
+@dataclass
+class PairCounts:
+    data_config: str
+    params: str
+    # The number of calibration and test pairs per category.
+    calibration: Dict[Tuple, int]
+    test: Dict[Tuple, int]
+
+
+def make_plan(scorer_names: Optional[List[str]],
+              calibrator_names: Optional[List[str]],
+              data_config_names: Optional[List[str]],
+              param_names: Optional[List[str]],
+              num_repeats: int,
+              pairs_from_file: bool,
+              throughput_file: str = THROUGHPUT_FILE,
+              embeddings_dir: str = EMBEDDINGS_DIR) \
+        -> Tuple[List[PairCounts], List[ScorerPlan]]:
+    """
+    Expands the configuration names like `ExperimentalSetup` does and returns
+    the pair counts per data configuration and params, and the plan per
+    scorer. Derived attributes that were never computed put images in a
+    `None` category.
+
+    :return: Tuple[List[PairCounts], List[ScorerPlan]]
+    """
+    from params import SCORERS, DATA, PARAMS
+
+    scorer_names = scorer_names or SCORERS['current_set_up']
+    calibrators = ExperimentalSetup._get_calibrators(calibrator_names)
+    data_config_names = data_config_names or DATA['current_set_up']
+    param_names = param_names or PARAMS['current_set_up']
+    attributes = AttributeTable(
+        [prop for name in param_names
+         for prop in PARAMS['all'][name].get('calibration_filters', [])],
+        compute_missing=False)
+
+    pair_counts = []
+    pairs: Dict[Tuple[str, str], FacePair] = {}
+    for data_config_name in data_config_names:
+        data_config = DATA['all'][data_config_name]
+        for param_name in param_names:
+            experiment = Experiment(data_config, None, None,
+                                    PARAMS['all'][param_name], attributes)
+            calibration, test = _get_pairs(experiment, pairs_from_file)
+            pair_counts.append(PairCounts(
+                data_config_name, param_name,
+                {category: len(p) for category, p in calibration.items()},
+                {category: len(p) for category, p in test.items()}))
+            # Test pairs without a calibrated category are never scored.
+            for category, category_pairs in [
+                    *calibration.items(),
+                    *((c, p) for c, p in test.items() if c in calibration)]:
+                pairs.update(((pair.first.path, pair.second.path), pair)
+                             for pair in category_pairs)
+    images = list({image.path: image for pair in pairs.values()
+                   for image in pair}.values())
+
+    throughput = load_throughput(throughput_file)
+    num_experiments = len(calibrators) * len(data_config_names) \
+        * len(param_names) * num_repeats
+    scorer_plans = []
+    for name in scorer_names:
+        architecture, tag = SCORERS['all'][name]
+        model_name = _get_model_name(architecture, tag)
+        num_cached = None
+        if architecture not in SCORE_FILE_ARCHITECTURES:
+            num_cached = sum(os.path.exists(
+                get_embedding_path(model_name, image, embeddings_dir))
+                for image in images)
+        scorer_plans.append(ScorerPlan(
+            name=name,
+            model_name=model_name,
+            architecture=architecture,
+            num_experiments=num_experiments,
+            num_pairs=len(pairs),
+            num_images=len(images),
+            num_cached=num_cached,
+            seconds=_estimate_seconds(throughput,
+                                      architecture,
+                                      num_experiments,
+                                      len(images),
+                                      num_cached)))
+    return pair_counts, scorer_plans
+
+
+def format_plan(pair_counts: List[PairCounts],
+                scorer_plans: List[ScorerPlan]) -> str:
+    """
+    Formats the result of `make_plan()` as a table per kind of count.
+
+    :param pair_counts: List[PairCounts]
+    :param scorer_plans: List[ScorerPlan]
+    :return: str
+    """
+    widths = [16, 16, 40, 12, 12]
+    lines = ['Pairs per category:',
+             _format_row(['data', 'params', 'category', 'calibration',
+                          'test'], widths)]
+    for counts in pair_counts:
+        for category in sorted({*counts.calibration, *counts.test}, key=str):
+            lines.append(_format_row([counts.data_config,
+                                      counts.params,
+                                      str(category),
+                                      counts.calibration.get(category, 0),
+                                      counts.test.get(category, 0)], widths))
+
+    widths = [24, 12, 12, 12, 12, 12]
+    lines += ['', 'Scorers:',
+              _format_row(['scorer', 'experiments', 'pairs', 'images',
+                           'cached', 'estimate'], widths)]
+    total = 0.
+    for plan in scorer_plans:
+        lines.append(_format_row([
+            plan.name,
+            plan.num_experiments,
+            plan.num_pairs,
+            plan.num_images,
+            'score file' if plan.num_cached is None else plan.num_cached,
+            _format_seconds(plan.seconds)], widths))
+        total = None if total is None or plan.seconds is None \
+            else total + plan.seconds
+    lines += ['', f'Estimated total: {_format_seconds(total)}']
+    if total is None:
+        lines.append(f'(Run some experiments to measure the throughput of '
+                     f'all architectures in {THROUGHPUT_FILE})')
+    return '\n'.join(lines)
+
+
+def load_throughput(path: str = THROUGHPUT_FILE) -> Dict[str, Any]:
+    """
+    Returns the measured throughput in `path`: the total number of calls and
+    seconds per span in `EMBED_SPANS` per architecture, and of the time
+    experiments spend on anything but scoring.
+
+    :param path: str
+    :return: Dict[str, Any]
+    """
+    if not os.path.exists(path):
+        return {'architectures': {}, 'overhead': {'calls': 0, 'seconds': 0.}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def record_throughput(profilers: Dict[int, Profiler],
+                      architectures: Dict[int, str],
+                      path: str = THROUGHPUT_FILE):
+    """
+    Adds the measurements of the `profilers` of the experiments to the
+    throughput in `path`. `architectures` holds the name of the architecture
+    of the scorer of each experiment.
+
+    :param profilers: Dict[int, Profiler]
+    :param architectures: Dict[int, str]
+    :param path: str
+    """
+    throughput = load_throughput(path)
+    for i, profiler in profilers.items():
+        stats = profiler.stats
+        spans = throughput['architectures'].setdefault(architectures[i], {})
+        for name in EMBED_SPANS:
+            if name in stats:
+                measured = spans.setdefault(name, {'calls': 0, 'seconds': 0.})
+                measured['calls'] += stats[name].calls
+                measured['seconds'] += stats[name].seconds
+        if 'experiment' in stats:
+            overhead = throughput['overhead']
+            overhead['calls'] += 1
+            overhead['seconds'] += stats['experiment'].seconds - (
+                stats['predict_proba'].seconds
+                if 'predict_proba' in stats else 0.)
+    tmp_path = get_tmp_path(path)
+    with open(tmp_path, 'w') as f:
+        json.dump(throughput, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _get_pairs(experiment: Experiment, pairs_from_file: bool) \
+        -> Tuple[Dict[Tuple, List[FacePair]], Dict[Tuple, List[FacePair]]]:
+    if pairs_from_file:
+        return experiment.get_calibration_and_test_pairs_from_file()
+    return experiment.make_calibration_and_test_pairs()
+
+
+def _get_model_name(architecture: Architecture, tag: Optional[str]) -> str:
+    # The same name as `str(EmbeddingModel)`, see `ExperimentalSetup`.
+    if isinstance(tag, str):
+        tag = Tag(tag)
+    if tag and not tag.version:
+        tag.version = architecture.get_latest_version(tag)
+    return f'{architecture.value}_{tag}' if tag else architecture.value
+
+
+def _estimate_seconds(throughput: Dict[str, Any],
+                      architecture: Architecture,
+                      num_experiments: int,
+                      num_images: int,
+                      num_cached: Optional[int]) -> Optional[float]:
+    overhead = throughput['overhead']
+    if not overhead['calls']:
+        return None
+    seconds = num_experiments * overhead['seconds'] / overhead['calls']
+    if num_cached is None:
+        return seconds
+
+    # Embeddings are computed once per image, whatever the number of
+    # experiments; each image is decoded, cached or not.
+    spans = throughput['architectures'].get(architecture.value, {})
+    num_calls = {'embed.decode': num_images,
+                 'embed.inference': num_images - num_cached,
+                 'embed.load': num_cached}
+    for name, calls in num_calls.items():
+        if not calls:
+            continue
+        if not spans.get(name, {}).get('calls'):
+            return None
+        seconds += calls * spans[name]['seconds'] / spans[name]['calls']
+    return seconds
+
+
+def _format_row(values: List[Any], widths: List[int]) -> str:
+    return ''.join(str(value).ljust(width)
+                   for value, width in zip(values, widths)).rstrip()
+
+
+def _format_seconds(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '?'
+    hours, remainder = divmod(int(seconds), 3600)
+    return f'{hours}:{remainder // 60:02d}:{remainder % 60:02d}'
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import importlib
+import multiprocessing
+import pickle
+import traceback
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import List, Optional, Tuple, Callable
+
+from lr_face.profiling import span
+
+# Which experiments make plots: none of them, those of the first repeat only,
+# or all of them.
+PLOTS_CHOICES = ['none', 'first', 'all']
+
+
+def render(plot_function: str, savefig: str, kwargs: dict):
+    """
+    Renders a single plot by calling the `plot_function` with that name in
+    `lr_face.evaluators` (or the fully qualified `module.function` name of a
+    function elsewhere) with `kwargs`, and saves it as `savefig`.
+
+    :param plot_function: str
+    :param savefig: str
+    :param kwargs: dict
+    """
+    module_name, _, function_name = plot_function.rpartition('.')
+    module = importlib.import_module(module_name or 'lr_face.evaluators')
+    getattr(module, function_name)(savefig=savefig, **kwargs)
+
+
+class PlotSink:
+    """
+    Receives the plots that are made during an experiment. This base class
+    renders each plot immediately; see `BackgroundPlotSink` for a sink that
+    renders them in other processes.
+    """
+
+    def submit(self, plot_function: str, savefig: str, **kwargs):
+        """
+        Renders the plot described by the name of a plot function in
+        `lr_face.evaluators` and the data to call it with.
+
+        :param plot_function: str
+        :param savefig: str
+        """
+        with span('plot'):
+            render(plot_function, savefig, kwargs)
+
+    def on_rendered(self, callback: Callable[[], None]):
+        """
+        Calls `callback` once all plots that were submitted since the previous
+        call have been rendered and saved, but not if any of them failed. This
+        sink renders plots right away (and raises if that fails), so the
+        callback is called immediately.
+
+        :param callback: Callable[[], None]
+        """
+        callback()
+
+    def close(self):
+        """
+        Waits until all submitted plots are rendered.
+        """
+        pass
+
+    def __enter__(self) -> PlotSink:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _use_agg_backend():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _render_in_background(plot_function: str,
+                          savefig: str,
+                          data: bytes) -> Optional[str]:
+    try:
+        render(plot_function, savefig, pickle.loads(data))
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+class BackgroundPlotSink(PlotSink):
+    """
+    Renders plots on a pool of `n_jobs` background processes with the
+    non-interactive Agg backend, so that an experiment can continue as soon
+    as it has handed over the data of its plots. Plots that fail to render
+    are reported when the sink is closed, and the callbacks of `on_rendered()`
+    are called then too.
+    """
+
+    def __init__(self, n_jobs: Optional[int] = None):
+        self.executor = ProcessPoolExecutor(
+            n_jobs,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_use_agg_backend)
+        self.futures: List[Tuple[str, Future]] = []
+        # The callbacks of `on_rendered()`, with the futures they wait for.
+        self.callbacks: List[Tuple[Callable[[], None], List[Future]]] = []
+        self._num_awaited = 0
+
+    def submit(self, plot_function: str, savefig: str, **kwargs):
+        # Only handing over the data is part of the experiment; the
+        # rendering itself happens in another process. The executor pickles
+        # its arguments later, on another thread, by which time the caller
+        # may have changed them (calibrators change on `transform()`, for
+        # example), so the data is pickled here already.
+        with span('plot.submit'):
+            data = pickle.dumps(kwargs, protocol=pickle.HIGHEST_PROTOCOL)
+            self.futures.append((savefig, self.executor.submit(
+                _render_in_background, plot_function, savefig, data)))
+
+    def on_rendered(self, callback: Callable[[], None]):
+        self.callbacks.append(
+            (callback, [future for _, future
+                        in self.futures[self._num_awaited:]]))
+        self._num_awaited = len(self.futures)
+
+    def close(self):
+        failed = set()
+        for savefig, future in self.futures:
+            try:
+                error = future.result()
+            except Exception:
+                # The worker process died while rendering.
+                error = traceback.format_exc()
+            if error:
+                failed.add(future)
+                print(f'Could not render {savefig}:\n{error}')
+        for callback, futures in self.callbacks:
+            if not failed.intersection(futures):
+                callback()
+        self.futures = []
+        self.callbacks = []
+        self._num_awaited = 0
+        self.executor.shutdown()
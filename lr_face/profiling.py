@@ -0,0 +1,160 @@
+"""
+Lightweight instrumentation of the stages of an experiment. Code marks a
+stage with `span(name)`, which records how long it takes and how much the
+peak memory use (RSS) of the process grows in the active `Profiler`::
+
+    with profile() as profiler:
+        with span('scores'):
+            ...
+    profiler.stats['scores'].seconds
+
+Spans do nothing when no profiler is active, and little more than reading a
+clock when one is, so they can also be used in code that is called often,
+such as `EmbeddingModel.embed()`. With `trace=True`, each span is also kept
+as an event, so the profile can be written as a Chrome trace (see
+`write_trace()`) and inspected with chrome://tracing or Perfetto.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Iterator, Iterable, Any
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+PROFILE_SUFFIX = '_experiments_profile.csv'
+TRACE_SUFFIX = '_trace.json'
+
+
+@dataclass
+class SpanStats:
+    calls: int = 0
+    seconds: float = 0.
+    # The largest increase of the peak RSS during a single call, in MB.
+    peak_rss_delta_mb: float = 0.
+
+
+class Profiler:
+    """
+    Collects the `SpanStats` per span name and, if `trace` is set, an event
+    per span. The `args` are added to each event.
+    """
+
+    def __init__(self, trace: bool = False, args: Optional[Dict] = None):
+        self.trace = trace
+        self.args = args or {}
+        self.stats: Dict[str, SpanStats] = {}
+        self.events: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        peak_rss = get_peak_rss()
+        timestamp = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            rss_delta = get_peak_rss() - peak_rss
+            stats = self.stats.setdefault(name, SpanStats())
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.peak_rss_delta_mb = max(stats.peak_rss_delta_mb, rss_delta)
+            if self.trace:
+                # A 'complete' event, with times in microseconds.
+                self.events.append({'name': name,
+                                    'cat': 'lr_face',
+                                    'ph': 'X',
+                                    'ts': timestamp * 1e6,
+                                    'dur': seconds * 1e6,
+                                    'pid': os.getpid(),
+                                    'tid': threading.get_ident(),
+                                    'args': self.args})
+
+
+_active: Optional[Profiler] = None
+
+
+@contextmanager
+def profile(trace: bool = False, **args) -> Iterator[Profiler]:
+    """
+    Makes a new `Profiler` the active one for the duration of the context.
+
+    :param trace: bool, whether to keep an event per span
+    :param args: added to each event, e.g. the index of the experiment
+    :return: Iterator[Profiler]
+    """
+    global _active
+    previous = _active
+    _active = Profiler(trace, args)
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Records the code in the context as a span `name` in the active
+    `Profiler`, if any.
+
+    :param name: str
+    """
+    if _active is None:
+        yield
+    else:
+        with _active.span(name):
+            yield
+
+
+def get_peak_rss() -> float:
+    """
+    Returns the peak RSS of this process so far in MB, or 0 on platforms
+    where it is not available.
+
+    :return: float
+    """
+    if resource is None:
+        return 0.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def write_profiles(profilers: Dict[int, Profiler], path: str):
+    """
+    Writes the stats of the `profilers` of each experiment index to a CSV
+    file with a row per experiment and span.
+
+    :param profilers: Dict[int, Profiler]
+    :param path: str
+    """
+    import pandas as pd
+
+    rows = [{'index': index, 'span': name, **asdict(stats)}
+            for index, profiler in sorted(profilers.items())
+            for name, stats in profiler.stats.items()]
+    columns = ['index', 'span', *SpanStats.__dataclass_fields__]
+    pd.DataFrame(rows, columns=columns).to_csv(path, index=False)
+
+
+def write_trace(profilers: Iterable[Profiler], path: str):
+    """
+    Writes the events of the `profilers` as a Chrome trace-event JSON file.
+
+    :param profilers: Iterable[Profiler]
+    :param path: str
+    """
+    events = [event for profiler in profilers for event in profiler.events]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import os
+import pickle
+import threading
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from lr_face.data import FaceImage, get_benchmark_images
+from lr_face.models import EmbeddingModel, Architecture, EMBEDDINGS_DIR
+from lr_face.utils import cache, md5, file_md5, get_file_key, get_tmp_path
+
+QUALITY_SCORES_DIR = 'quality_scores'
+TOP_K = 10
+# The similarity score of a pair in which no face was found in one of the
+# images: `ScorerModel` marks the distance as -1, so its similarity score in
+# column 1 of `ScorerModel.predict_proba()` is 1 - (-1) = 2.
+NO_FACE_SCORE = 2
+
+
+class QualityScorer:
+    """
+    Computes 'quality scores' for images: the average of the top `top_k`
+    similarity scores of an image against a fixed set of benchmark images of
+    different identities, binned to an integer between 0 and 10.
+
+    The benchmark images are embedded only once per instance, and whole
+    batches of query images are scored against them with a single matrix
+    operation. Computed quality scores are persisted to disk per
+    (image, benchmark set, model), so they only have to be computed once. An
+    image that is edited or replaced gets a new key (see `get_file_key()`).
+    Scoring is thread-safe.
+    """
+
+    def __init__(self,
+                 embedding_model: EmbeddingModel,
+                 benchmark_images: List[FaceImage],
+                 top_k: int = TOP_K,
+                 cache_dir: Optional[str] = QUALITY_SCORES_DIR,
+                 embeddings_dir: Optional[str] = EMBEDDINGS_DIR):
+        self.embedding_model = embedding_model
+        self.benchmark_images = benchmark_images
+        self.top_k = top_k
+        self.cache_dir = cache_dir
+        self.embeddings_dir = embeddings_dir
+        self._scores: Optional[Dict[str, float]] = None
+        self._lock = threading.Lock()
+
+    @property
+    @cache
+    def benchmark_id(self) -> str:
+        """
+        Returns an identifier of the benchmark set, which changes whenever one
+        of the benchmark images is replaced by another or its file changes.
+
+        :return: str
+        """
+        return get_benchmark_id(self.benchmark_images)
+
+    @property
+    def scorer_id(self) -> str:
+        """
+        Returns an identifier of the model (including its tag), the benchmark
+        set and `top_k`: everything but the image that a quality score
+        depends on.
+
+        :return: str
+        """
+        return _get_scorer_id(str(self.embedding_model),
+                              self.benchmark_id,
+                              self.top_k)
+
+    @property
+    def cache_path(self) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(
+            self.cache_dir,
+            str(self.embedding_model).replace(':', '-'),  # Windows
+            f'{self.benchmark_id}_top{self.top_k}.obj'
+        )
+
+    @property
+    def scores(self) -> Dict[str, float]:
+        """
+        Returns all quality scores computed so far, keyed by the
+        `get_file_key()` of the image. Scores that were persisted earlier are loaded the first
+        time this property is accessed.
+
+        :return: Dict[str, float]
+        """
+        if self._scores is None:
+            self._scores = {}
+            if self.cache_path and os.path.exists(self.cache_path):
+                with open(self.cache_path, 'rb') as f:
+                    self._scores = pickle.load(f)
+        return self._scores
+
+    @property
+    @cache
+    def benchmark_embeddings(self) -> np.ndarray:
+        """
+        Returns a 2D array of shape `(num_benchmark_images, embedding_size)`
+        with the embeddings of all benchmark images. Rows of images in which no
+        face could be found are filled with NaN.
+
+        :return: np.ndarray
+        """
+        return self._embed(self.benchmark_images)
+
+    def score(self, images: List[FaceImage]) -> np.ndarray:
+        """
+        Returns a 1D array with the quality score of each of the `images`.
+        Only images that have not been scored before are embedded and scored,
+        all at once, so score as many images per call as possible: every call
+        that scores new images also saves all scores.
+
+        :param images: List[FaceImage]
+        :return: np.ndarray
+        """
+        keys = [get_file_key(image.path) for image in images]
+        with self._lock:
+            missing = {key: image for key, image in zip(keys, images)
+                       if key not in self.scores}
+            if missing:
+                quality_scores = self._compute(list(missing.values()))
+                self.scores.update(
+                    zip(missing.keys(), quality_scores.tolist()))
+                self._save()
+            return np.array([self.scores[key] for key in keys])
+
+    def _compute(self, images: List[FaceImage]) -> np.ndarray:
+        # Similarity scores are computed the same way as in
+        # `ScorerModel.predict_proba()`: 1 - the euclidean distance between
+        # the embeddings, or `NO_FACE_SCORE` if no face was found in one of
+        # the images.
+        benchmark = self.benchmark_embeddings
+        query = self._embed(images, size=benchmark.shape[1])
+        squared_distances = np.sum(query ** 2, axis=1)[:, None] \
+            + np.sum(benchmark ** 2, axis=1)[None, :] \
+            - 2 * query @ benchmark.T
+        scores = 1 - np.sqrt(np.maximum(squared_distances, 0))
+        scores[np.isnan(scores)] = NO_FACE_SCORE
+
+        top_k = min(self.top_k, scores.shape[1])
+        top_scores = -np.partition(-scores, top_k - 1, axis=1)[:, :top_k]
+        return np.ceil(10 * np.mean(top_scores, axis=1))
+
+    def _embed(self,
+               images: List[FaceImage],
+               size: Optional[int] = None) -> np.ndarray:
+        embeddings = [self.embedding_model.embed(image, self.embeddings_dir)
+                      for image in images]
+        if size is None:
+            size = next((len(e) for e in embeddings if e is not None), 0)
+        return np.array([np.full(size, np.nan) if e is None else e
+                         for e in embeddings], dtype=float).reshape(-1, size)
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = get_tmp_path(self.cache_path)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.scores, f)
+        os.replace(tmp_path, self.cache_path)
+
+
+def get_benchmark_id(benchmark_images: List[FaceImage]) -> str:
+    """
+    Returns a hash of the paths and file contents of the `benchmark_images`.
+
+    :param benchmark_images: List[FaceImage]
+    :return: str
+    """
+    return md5('\n'.join(f'{image.path}|{file_md5(image.path)}'
+                         for image in benchmark_images))
+
+
+def _get_scorer_id(model: str, benchmark_id: str, top_k: int) -> str:
+    return md5(f'{model}|{benchmark_id}|top{top_k}')
+
+
+@cache
+def get_quality_scorer_id() -> str:
+    """
+    Returns the `scorer_id` of `get_quality_scorer()` without loading its
+    model, e.g. to tell whether persisted quality scores are still valid.
+
+    :return: str
+    """
+    return _get_scorer_id(Architecture.FACERECOGNITION.value,
+                          get_benchmark_id(get_benchmark_images()),
+                          TOP_K)
+
+
+@cache
+def get_quality_scorer() -> QualityScorer:
+    """
+    Returns the `QualityScorer` that is used for `FaceImage.quality_score`.
+    The same instance is returned on every call, so that the underlying model
+    is loaded and the benchmark set is embedded only once per process.
+
+    :return: QualityScorer
+    """
+    # TODO Open question: should we use the model we are calibrating?
+    embedding_model = Architecture.FACERECOGNITION.get_embedding_model()
+    return QualityScorer(embedding_model, get_benchmark_images())
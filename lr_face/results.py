@@ -0,0 +1,218 @@
+"""
+Results of experiments are written as soon as each experiment finishes, one
+row at a time, so that a sweep can be inspected while it is still running.
+
+All rows of a run share a stable schema: the configuration of the experiment,
+a fixed set of metric columns and an `extra` column with the remaining
+(variable) metrics, such as the fraction of valid calibration scores per
+category, as JSON. `read_results()` expands the `extra` column again.
+
+If pyarrow is available, each row is written as a separate Parquet file in
+the directory `output/<run name>_experiments_results.parquet/`. Each file is
+written atomically, so readers only ever see complete rows. Otherwise, rows
+are appended to `output/<run name>_experiments_results.partial.csv`.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from lr_face.utils import get_tmp_path
+
+RESULTS_DIR = 'output'
+RESULTS_SUFFIX = '_experiments_results'
+METRIC_COLUMNS = [
+    'cllr',
+    'auc',
+    'accuracy',
+    'cal_fraction_valid',
+    'test_fraction_valid',
+    'cllr_bootstrap_low',
+    'cllr_bootstrap_high',
+    'auc_bootstrap_low',
+    'auc_bootstrap_high',
+    'accuracy_bootstrap_low',
+    'accuracy_bootstrap_high',
+    'bootstrap_samples',
+    'cllr_ci_low',
+    'cllr_ci_high',
+    'auc_ci_low',
+    'auc_ci_high',
+    'accuracy_ci_low',
+    'accuracy_ci_high',
+]
+TEXT_COLUMNS = ['error', 'extra']
+
+
+def has_parquet() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_config_columns(experimental_setup) -> List[str]:
+    """
+    Returns the names of the configuration columns of the results of
+    `experimental_setup`, in a fixed order.
+
+    :param experimental_setup: ExperimentalSetup
+    :return: List[str]
+    """
+    return ['scorers',
+            'calibrators',
+            *sorted(experimental_setup.params_keys),
+            *sorted(experimental_setup.data_keys)]
+
+
+def get_config(experimental_setup, experiment) -> Dict[str, str]:
+    """
+    Returns the values of the configuration columns for `experiment`.
+
+    :param experimental_setup: ExperimentalSetup
+    :param experiment: Experiment
+    :return: Dict[str, str]
+    """
+    return {'scorers': str(experiment.scorer),
+            'calibrators': str(experiment.calibrator),
+            **{k: str(experiment.params.get(k))
+               for k in experimental_setup.params_keys},
+            **{k: str(experiment.data_config.get(k))
+               for k in experimental_setup.data_keys}}
+
+
+class ResultsWriter:
+    """
+    Writes the results of the experiments of a run as they come in. See the
+    module docstring for the format.
+    """
+
+    def __init__(self,
+                 name: str,
+                 config_columns: List[str],
+                 directory: str = RESULTS_DIR,
+                 use_parquet: Optional[bool] = None):
+        self.config_columns = config_columns
+        self.columns = ['index', *config_columns, *METRIC_COLUMNS,
+                        *TEXT_COLUMNS]
+        if use_parquet is None:
+            use_parquet = has_parquet()
+        self.use_parquet = use_parquet
+        extension = '.parquet' if use_parquet else '.partial.csv'
+        self.path = os.path.join(directory,
+                                 f'{name}{RESULTS_SUFFIX}{extension}')
+
+    def write(self, index: int, config: Dict[str, str], result: Dict[str, Any]):
+        """
+        Writes the `result` of the experiment with `index` and configuration
+        `config` as a single row.
+
+        :param index: int
+        :param config: Dict[str, str]
+        :param result: Dict[str, Any]
+        """
+        row = self.to_frame(index, config, result)
+        if self.use_parquet:
+            os.makedirs(self.path, exist_ok=True)
+            path = os.path.join(self.path, f'part-{index:06d}.parquet')
+            tmp_path = get_tmp_path(path)
+            row.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        else:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            write_header = not os.path.exists(self.path)
+            # Write the row in a single call, so readers don't see half rows.
+            text = row.to_csv(header=write_header, index=False)
+            with open(self.path, 'a') as f:
+                f.write(text)
+
+    def to_frame(self,
+                 index: int,
+                 config: Dict[str, str],
+                 result: Dict[str, Any]) -> pd.DataFrame:
+        extra = {k: _to_json_value(v) for k, v in result.items()
+                 if k not in METRIC_COLUMNS and k != 'error'}
+        row = {'index': index,
+               **{k: config.get(k) for k in self.config_columns},
+               **{k: float(result.get(k, np.nan)) for k in METRIC_COLUMNS},
+               'error': result.get('error', ''),
+               'extra': json.dumps(extra, sort_keys=True)}
+        return pd.DataFrame([row], columns=self.columns)
+
+
+def list_runs(directory: str = RESULTS_DIR) -> List[str]:
+    """
+    Returns the sorted names of all runs in `directory` that have (partial)
+    results.
+
+    :param directory: str
+    :return: List[str]
+    """
+    names = set()
+    for filename in os.listdir(directory):
+        for extension in ['.csv', '.parquet', '.partial.csv']:
+            if filename.endswith(RESULTS_SUFFIX + extension):
+                names.add(filename[:-len(RESULTS_SUFFIX + extension)])
+    return sorted(names)
+
+
+def get_results_version(name: str, directory: str = RESULTS_DIR) -> int:
+    """
+    Returns the latest modification time (in ns) of the results of the run
+    `name`, which changes whenever a row is written. Readers that cache the
+    results of a run can use it to notice new rows.
+
+    :param name: str
+    :param directory: str
+    :return: int
+    """
+    path = os.path.join(directory, name + RESULTS_SUFFIX)
+    paths = [path + '.csv', path + '.parquet', path + '.partial.csv']
+    if os.path.isdir(path + '.parquet'):
+        paths += [os.path.join(path + '.parquet', f)
+                  for f in os.listdir(path + '.parquet')]
+    return max([os.stat(p).st_mtime_ns for p in paths if os.path.exists(p)],
+               default=0)
+
+
+def read_results(name: str, directory: str = RESULTS_DIR) -> pd.DataFrame:
+    """
+    Reads the results of the run `name`. This works while the run is still
+    going: if it has not finished yet, the rows of the experiments that did
+    finish are returned.
+
+    :param name: str
+    :param directory: str
+    :return: pd.DataFrame
+    """
+    path = os.path.join(directory, name + RESULTS_SUFFIX)
+    if os.path.exists(path + '.csv'):
+        # The run finished, and wrote all results at once.
+        return pd.read_csv(path + '.csv', index_col=0)
+
+    if os.path.isdir(path + '.parquet'):
+        parts = sorted(f for f in os.listdir(path + '.parquet')
+                       if f.endswith('.parquet'))
+        df = pd.concat([pd.read_parquet(os.path.join(path + '.parquet', f))
+                        for f in parts], ignore_index=True)
+    else:
+        df = pd.read_csv(path + '.partial.csv', keep_default_na=False,
+                         na_values=[''])
+    df = df.drop_duplicates('index', keep='last') \
+        .sort_values('index') \
+        .reset_index(drop=True)
+    extra = pd.DataFrame([json.loads(e) if isinstance(e, str) and e else {}
+                          for e in df['extra']], index=df.index)
+    return pd.concat([df.drop(columns='extra'), extra], axis=1)
+
+
+def _to_json_value(value: Any) -> Any:
+    if isinstance(value, (np.floating, np.integer)):
+        return value.item()
+    return value
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+from abc import abstractmethod
+from typing import List, Dict, Tuple, Sequence, Callable
+
+import numpy as np
+
+from lr_face.data import FacePair
+from lr_face.utils import cache
+
+
+class ScoreProvider:
+    """
+    A source of similarity scores for pairs of images that does not compute
+    them from embeddings, e.g. scores computed by external software. A
+    `ScorerModel` with a `ScoreProvider` gets its scores from the provider.
+    """
+
+    @abstractmethod
+    def get_scores(self, pairs: List[FacePair]) -> np.ndarray:
+        """
+        Returns a 1D float array with the similarity score of each pair, or -1
+        for pairs without a (valid) score.
+
+        :param pairs: List[FacePair]
+        :return: np.ndarray
+        """
+        raise NotImplementedError
+
+
+class ScoreIndex:
+    """
+    An index of externally computed scores, mapping (unordered) pairs of image
+    paths to float32 scores. Each path is assigned an integer id, and each
+    pair of ids is hashed into a single int64 key, so that the scores of many
+    pairs can be looked up at once with a binary search.
+    """
+
+    def __init__(self,
+                 path_ids: Dict[str, int],
+                 keys: np.ndarray,
+                 scores: np.ndarray):
+        self.path_ids = path_ids
+        self.keys = keys
+        self.scores = scores
+
+    @classmethod
+    def from_files(cls, filenames: Sequence[str]) -> ScoreIndex:
+        """
+        Builds an index from one or more files with one `path;path;score`
+        line per pair. When a pair occurs more than once, the last score
+        wins.
+        """
+        path_ids = dict()
+        first, second, scores = [], [], []
+        for filename in filenames:
+            with open(filename, 'r') as f:
+                for line in f.read().splitlines():
+                    pair = line.split(';')
+                    if len(pair) != 3:
+                        print(f'some issue with results file: {pair}')
+                        if len(pair) < 2:
+                            continue
+                        score = -1
+                    else:
+                        score = float(pair[2])
+                    first.append(path_ids.setdefault(pair[0], len(path_ids)))
+                    second.append(path_ids.setdefault(pair[1], len(path_ids)))
+                    scores.append(score)
+
+        keys = cls._hash(np.array(first, dtype=np.int64),
+                         np.array(second, dtype=np.int64))
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        scores = np.array(scores, dtype=np.float32)[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        return cls(path_ids, keys[last], scores[last])
+
+    def lookup(self,
+               first_paths: Sequence[str],
+               second_paths: Sequence[str]) -> np.ndarray:
+        """
+        Returns the scores of the pairs `zip(first_paths, second_paths)` as a
+        float32 array. The order of the two paths in a pair does not matter.
+        Pairs that are not in the index get a score of -1.
+
+        :param first_paths: Sequence[str]
+        :param second_paths: Sequence[str]
+        :return: np.ndarray
+        """
+        first = np.array([self.path_ids.get(p, -1) for p in first_paths],
+                         dtype=np.int64)
+        second = np.array([self.path_ids.get(p, -1) for p in second_paths],
+                          dtype=np.int64)
+        keys = self._hash(first, second)
+        positions = np.minimum(np.searchsorted(self.keys, keys),
+                               max(len(self.keys) - 1, 0))
+        found = (first >= 0) & (second >= 0) & (len(self.keys) > 0)
+        found[found] = self.keys[positions[found]] == keys[found]
+
+        result = np.full(len(keys), -1, dtype=np.float32)
+        result[found] = self.scores[positions[found]]
+        # Like before, a score of exactly 0 is treated as a missing score.
+        result[result == 0] = -1
+        return result
+
+    @staticmethod
+    def _hash(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        # Order the ids in each pair, so that (a, b) and (b, a) get the same
+        # key, then combine them into a single int64.
+        low, high = np.minimum(first, second), np.maximum(first, second)
+        return (high << 32) + low
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+@cache
+def load_score_index(filenames: Tuple[str, ...]) -> ScoreIndex:
+    """
+    Returns the `ScoreIndex` for the given score files. The files are only
+    read once per process.
+
+    :param filenames: Tuple[str, ...]
+    :return: ScoreIndex
+    """
+    return ScoreIndex.from_files(filenames)
+
+
+class ScoreFileProvider(ScoreProvider):
+    """
+    Provides scores from one or more `path;path;score` files, e.g. the scores
+    that Facevacs computed for our calibration and test pairs. The files are
+    read on first use.
+    """
+
+    def __init__(self, filenames: Sequence[str]):
+        self.filenames = tuple(filenames)
+
+    def get_scores(self, pairs: List[FacePair]) -> np.ndarray:
+        return load_score_index(self.filenames).lookup(
+            [pair.first.path for pair in pairs],
+            [pair.second.path for pair in pairs])
+
+
+class ScoreCache:
+    """
+    Remembers the scores that each scorer computed for each pair of images.
+
+    An `ExperimentalSetup` runs every scorer once for each combination of
+    calibrator, data configuration and params, but the scores only depend on
+    the scorer and the pair. With a shared cache each scorer scores each pair
+    only once, and all other experiments reuse the result.
+    """
+
+    def __init__(self):
+        self._scores: Dict[Tuple[str, str, str], Tuple[float, float]] = dict()
+        self.num_computed = 0
+        self.num_reused = 0
+
+    def get_scores(self,
+                   scorer_id: str,
+                   pairs: List[FacePair],
+                   compute: Callable[[List[FacePair]], np.ndarray]) \
+            -> np.ndarray:
+        """
+        Returns the scores of `pairs` in the same `(num_pairs, 2)` format as
+        `ScorerModel.predict_proba()`. Only the pairs that have not been scored
+        by the scorer with `scorer_id` before are passed to `compute`.
+
+        :param scorer_id: str
+        :param pairs: List[FacePair]
+        :param compute: Callable[[List[FacePair]], np.ndarray]
+        :return: np.ndarray
+        """
+        keys = [(scorer_id, pair.first.path, pair.second.path)
+                for pair in pairs]
+        missing = dict()
+        for key, pair in zip(keys, pairs):
+            if key not in self._scores:
+                missing.setdefault(key, pair)
+        if missing:
+            computed = compute(list(missing.values()))
+            self._scores.update(zip(missing.keys(), map(tuple, computed)))
+        self.num_computed += len(missing)
+        self.num_reused += len(keys) - len(missing)
+        return np.array([self._scores[key] for key in keys],
+                        dtype=float).reshape(-1, 2)
+
+    def summary(self) -> str:
+        return summarize_score_counts(self.num_computed, self.num_reused)
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+
+def summarize_score_counts(num_computed: int, num_reused: int) -> str:
+    """
+    Describes how many pairs were scored and how many scores were reused
+    from a `ScoreCache`, possibly summed over the caches of several workers.
+
+    :param num_computed: int
+    :param num_reused: int
+    :return: str
+    """
+    total = num_computed + num_reused
+    return f'Scored {num_computed} pairs, avoided {num_reused}' \
+           f' of {total} score computations by reusing cached scores'
@@ -0,0 +1,370 @@
+"""
+An experiment is run as a chain of stages, each of which produces an
+artifact that is stored on disk:
+
+    pairs -> scores -> calibration -> evaluation -> plots
+
+The key of an artifact is a hash of what it is computed from, which for most
+stages is the content of the artifact of the previous stage:
+
+- pairs: the configuration of the data and the `calibration_filters`, the
+  inputs that assign the images of the data to categories (annotations,
+  image files and attribute versions, see `get_category_inputs_id()`), plus
+  the content of the pair lists if the pairs are read from file. Generated
+  pairs are random, so they are only reused within the same run (e.g. when
+  it is resumed), per repeat.
+- scores: the paths of all pairs, the size and modification time of every
+  image in them and the scorer, including its weights or score files.
+- calibration: the calibration scores and the calibrator.
+- evaluation: the calibration key (which determines the fitted calibrators),
+  the test scores and the confidence intervals that are asked for.
+- plots: the evaluation key and where the plots are saved.
+
+All keys also include `get_code_version()`, so a change to the code of
+`lr_face` (or to the version of a library it relies on) invalidates all
+artifacts. Experiments that share a prefix of the chain share its artifacts,
+also across runs: changing only the calibrators, for example, reuses the
+pairs and scores and only reruns calibration and evaluation.
+
+Since each key depends on the content of the previous artifact, the keys are
+derived stage by stage (see `get_pairs_key()` and on), and `explain()` can
+only tell which stages are cached as far as the artifacts of the earlier
+stages exist.
+"""
+
+from __future__ import annotations
+
+import glob
+import hashlib
+import os
+import pickle
+from dataclasses import dataclass, fields
+from importlib import metadata
+from typing import Any, Callable, Optional, List, Dict, Tuple
+
+import numpy as np
+
+from lr_face.attributes import get_category_inputs_id
+from lr_face.pair_lists import get_pair_list_path
+from lr_face.utils import cache, md5, file_md5, get_file_key, get_tmp_path
+
+ARTIFACTS_DIR = 'artifacts'
+STAGES = ['pairs', 'scores', 'calibration', 'evaluation', 'plots']
+# The libraries whose versions can change the artifacts.
+LIBRARIES = ['lir', 'numpy', 'scikit-learn', 'scipy']
+# The key of a stage whose previous stage has not been computed yet.
+UNKNOWN = '?'
+
+
+class ArtifactStore:
+    """
+    Stores the artifacts of the stages of experiments as pickles under
+    `directory/<stage>/<key>.obj`. If no directory is given, nothing is stored
+    and every stage is computed; the same goes for artifacts without a key.
+    """
+
+    def __init__(self, directory: Optional[str] = ARTIFACTS_DIR):
+        self.directory = directory
+
+    def get_or_compute(self,
+                       stage: str,
+                       key: Optional[str],
+                       compute: Callable[[], Any]) -> Any:
+        """
+        Returns the artifact of `stage` with `key`, computing and storing it
+        first if it does not exist yet.
+
+        :param stage: str
+        :param key: Optional[str]
+        :param compute: Callable[[], Any]
+        :return: Any
+        """
+        if self.has(stage, key):
+            return self.load(stage, key)
+        artifact = compute()
+        self.save(stage, key, artifact)
+        return artifact
+
+    def has(self, stage: str, key: Optional[str]) -> bool:
+        return bool(self.directory) and key is not None \
+            and os.path.exists(self._path(stage, key))
+
+    def load(self, stage: str, key: str) -> Any:
+        with open(self._path(stage, key), 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, stage: str, key: Optional[str], artifact: Any):
+        if not self.directory or key is None:
+            return
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = get_tmp_path(path)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(artifact, f)
+        os.replace(tmp_path, path)
+
+    def _path(self, stage: str, key: str) -> str:
+        return os.path.join(self.directory, stage, f'{key}.obj')
+
+
+@dataclass
+class StageKeys:
+    """
+    The artifact keys of all stages of a single experiment, as far as they
+    can be derived from the artifacts that exist (see `resolve_stage_keys()`).
+    Keys that depend on an artifact that does not exist yet are `UNKNOWN`.
+    `plots` is None for experiments that do not make plots, and `pairs` is
+    None for generated pairs outside of a run.
+    """
+    pairs: Optional[str]
+    scores: str
+    calibration: str
+    evaluation: str
+    plots: Optional[str]
+
+    def items(self):
+        return [(field.name, getattr(self, field.name))
+                for field in fields(self)]
+
+
+def get_pairs_key(experiment,
+                  pairs_from_file: bool,
+                  run_name: Optional[str]) -> Optional[str]:
+    """
+    Returns the key of the pairs of `experiment`, which are stored per
+    category, so the key covers all inputs to the categories of the images.
+    Pairs read from file are keyed by the content of the pair lists.
+    Generated pairs are random, so they are keyed by the name of the run and
+    the repeat, or not stored at all (None) without a `run_name`.
+
+    :param experiment: Experiment
+    :param pairs_from_file: bool
+    :param run_name: Optional[str]
+    :return: Optional[str]
+    """
+    filters = experiment.params['calibration_filters']
+    if pairs_from_file:
+        pair_inputs = [_hash_pair_list(f'{side}_pairs_{filters}.txt')
+                       for side in ['cal', 'test']]
+    elif run_name:
+        pair_inputs = [f'run={run_name}', f'repeat={experiment.repeat}']
+    else:
+        return None
+    images = [image
+              for side in ['calibration', 'test']
+              for dataset in experiment.data_config[side]
+              for image in dataset.images]
+    return md5(';'.join(['pairs', get_code_version(), experiment.data_id,
+                         str(filters), get_category_inputs_id(images, filters),
+                         *pair_inputs]))
+
+
+def get_scores_key(experiment,
+                   pair_paths: Dict[str, Dict[Tuple, List[Tuple[str, str]]]]) \
+        -> str:
+    """
+    Returns the key of the scores of the `pair_paths` of `experiment` (the
+    artifact of its pairs stage): a hash of all pairs, of the size and
+    modification time of each of their images and of the scorer.
+
+    :param experiment: Experiment
+    :param pair_paths: Dict[str, Dict[Tuple, List[Tuple[str, str]]]]
+    :return: str
+    """
+    pairs_hash = hashlib.md5()
+    paths = set()
+    for side, pairs_per_category in pair_paths.items():
+        for category, pairs in pairs_per_category.items():
+            pairs_hash.update(f'{side};{category}\n'.encode())
+            for first, second in pairs:
+                pairs_hash.update(f'{first};{second}\n'.encode())
+                paths.update((first, second))
+    images_hash = md5(';'.join(get_file_key(path) for path in sorted(paths)))
+    return md5(';'.join(['scores', get_code_version(), pairs_hash.hexdigest(),
+                         images_hash, get_scorer_id(experiment.scorer)]))
+
+
+def get_calibration_key(scores_key: str,
+                        scores: Dict[str, Dict[Tuple, np.ndarray]],
+                        calibrator) -> str:
+    """
+    Returns the key of the calibrators that are fitted on the calibration
+    `scores` (the artifact with `scores_key`, which also covers the labels of
+    the pairs), given the configuration of the `calibrator`.
+
+    :param scores_key: str
+    :param scores: Dict[str, Dict[Tuple, np.ndarray]]
+    :param calibrator: BaseEstimator
+    :return: str
+    """
+    return md5(';'.join(['calibration', scores_key,
+                         _hash_arrays(scores['calibration']),
+                         str(calibrator)]))
+
+
+def get_evaluation_key(calibration_key: str,
+                       scores: Dict[str, Dict[Tuple, np.ndarray]],
+                       bootstrap: int = 0,
+                       intervals: int = 0) -> str:
+    """
+    Returns the key of the evaluation of the test `scores` with the
+    calibrators with `calibration_key`. Fitting is deterministic, so the
+    calibration key determines the fitted calibrators (their pickles are not
+    stable enough to hash). With a positive number of `bootstrap` samples or
+    `intervals` replicates, the evaluation includes confidence intervals and
+    therefore gets a different key.
+
+    :param calibration_key: str
+    :param scores: Dict[str, Dict[Tuple, np.ndarray]]
+    :param bootstrap: int
+    :param intervals: int
+    :return: str
+    """
+    evaluation_inputs = ['evaluation', calibration_key,
+                         _hash_arrays(scores['test'])]
+    if bootstrap:
+        evaluation_inputs.append(f'bootstrap={bootstrap}')
+    if intervals:
+        evaluation_inputs.append(f'intervals={intervals}')
+    return md5(';'.join(evaluation_inputs))
+
+
+def get_plots_key(evaluation_key: str,
+                  make_plots_and_save_as: Optional[str]) -> Optional[str]:
+    """
+    Returns the key of the plots of the evaluation with `evaluation_key`, or
+    None if no plots are made.
+
+    :param evaluation_key: str
+    :param make_plots_and_save_as: Optional[str]
+    :return: Optional[str]
+    """
+    if not make_plots_and_save_as:
+        return None
+    return md5(';'.join(['plots', evaluation_key, make_plots_and_save_as]))
+
+
+def resolve_stage_keys(experiment,
+                       store: ArtifactStore,
+                       pairs_from_file: bool,
+                       run_name: Optional[str],
+                       make_plots_and_save_as: Optional[str],
+                       bootstrap: int = 0,
+                       intervals: int = 0) -> StageKeys:
+    """
+    Derives the keys of the stages of `experiment` from the artifacts in
+    `store`, as far as they exist; the keys of later stages are `UNKNOWN`.
+
+    :param experiment: Experiment
+    :param store: ArtifactStore
+    :param pairs_from_file: bool
+    :param run_name: Optional[str]
+    :param make_plots_and_save_as: Optional[str]
+    :param bootstrap: int
+    :param intervals: int
+    :return: StageKeys
+    """
+    pairs = get_pairs_key(experiment, pairs_from_file, run_name)
+    scores = calibration = evaluation = UNKNOWN
+    plots = UNKNOWN if make_plots_and_save_as else None
+    if store.has('pairs', pairs):
+        scores = get_scores_key(experiment, store.load('pairs', pairs))
+    if store.has('scores', scores):
+        scores_artifact = store.load('scores', scores)
+        calibration = get_calibration_key(scores, scores_artifact,
+                                          experiment.calibrator)
+        evaluation = get_evaluation_key(calibration, scores_artifact,
+                                        bootstrap, intervals)
+        plots = get_plots_key(evaluation, make_plots_and_save_as)
+    return StageKeys(pairs, scores, calibration, evaluation, plots)
+
+
+def explain(stage_keys: List[StageKeys],
+            store: ArtifactStore,
+            names: Optional[List[str]] = None) -> str:
+    """
+    Describes which stages of which experiments would run, given the
+    artifacts that are already in `store`. An artifact that is shared by
+    several experiments is only computed for the first of them, as far as
+    its key is known.
+
+    :param stage_keys: List[StageKeys], the keys of each experiment
+    :param store: ArtifactStore
+    :param names: Optional[List[str]], the name of each experiment
+    :return: str
+    """
+    seen = set()
+    lines = []
+    counts: Dict[str, List[int]] = {stage: [0, 0] for stage in STAGES}
+    for i, keys in enumerate(stage_keys):
+        statuses = []
+        for stage, key in keys.items():
+            if key is None and stage == 'plots':
+                statuses.append(f'{stage}: skip')
+                continue
+            cached = key not in [None, UNKNOWN] \
+                and ((stage, key) in seen or store.has(stage, key))
+            seen.add((stage, key))
+            counts[stage][cached] += 1
+            statuses.append(f'{stage}: {"cached" if cached else "RUN"}')
+        name = names[i] if names else i
+        lines.append(f'{name}: ' + ', '.join(statuses))
+    lines.append('')
+    for stage, (num_run, num_cached) in counts.items():
+        lines.append(f'{stage}: {num_run} to run, {num_cached} cached')
+    return '\n'.join(lines)
+
+
+@cache
+def get_code_version() -> str:
+    """
+    Returns a hash of the source code of `lr_face` and the versions of the
+    `LIBRARIES`, which changes whenever any of them does.
+
+    :return: str
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    inputs = [file_md5(path) for path
+              in sorted(glob.glob(os.path.join(package_dir, '*.py')))]
+    for library in LIBRARIES:
+        try:
+            inputs.append(f'{library}={metadata.version(library)}')
+        except metadata.PackageNotFoundError:
+            inputs.append(f'{library}=?')
+    return md5(';'.join(inputs))
+
+
+def get_scorer_id(scorer) -> str:
+    """
+    Returns a hash of the name and tag of `scorer` and of the size and
+    modification time of its weights or score files, if any.
+
+    :param scorer: ScorerModel
+    :return: str
+    """
+    inputs = [str(scorer)]
+    embedding_model = getattr(scorer, 'embedding_model', None)
+    if embedding_model is not None and embedding_model.tag:
+        inputs.append(get_file_key(
+            embedding_model.get_weights_path(embedding_model.tag)))
+    score_provider = getattr(scorer, 'score_provider', None)
+    for filename in getattr(score_provider, 'filenames', ()):
+        inputs.append(get_file_key(filename))
+    return md5(';'.join(inputs))
+
+
+def _hash_arrays(arrays: Dict[Tuple, np.ndarray]) -> str:
+    digest = hashlib.md5()
+    for category, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        digest.update(f'{category};{array.dtype}{array.shape}'.encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def _hash_pair_list(text_path: str) -> str:
+    # The text pair list is the source of the binary one, if it exists.
+    for path in [text_path, get_pair_list_path(text_path)]:
+        if os.path.exists(path):
+            return file_md5(path)
+    return 'missing'
@@ -1,6 +1,8 @@
 import argparse
+import hashlib
 import os
 import re
+import socket
 from csv import writer
 from functools import lru_cache
 from typing import Dict, List
@@ -8,9 +10,9 @@ from typing import Dict, List
 import cv2
 import numpy as np
 import pandas as pd
-import tensorflow as tf
 from pandas import DataFrame
-from tensorflow.keras.preprocessing import image
+
+from lr_face.plotting import PLOTS_CHOICES
 
 
 def write_output(df, experiment_name):
@@ -46,6 +48,56 @@ def parser_setup():
                         help='Select the parameter set(s) to be used. Codes can be found in \'params.py\',' +
                              'e.g.: SET1. Defaults to settings in \'current_set_up\'',
                         nargs='+')
+    parser.add_argument('--jobs', '-j',
+                        help='The number of processes to run the experiments on. '
+                             'Experiments with the same scorer share a process. Defaults to 1',
+                        type=int,
+                        default=1)
+    parser.add_argument('--resume',
+                        help='The name of an earlier run in \'output\' to resume. Experiments '
+                             'that already finished in that run are skipped')
+    parser.add_argument('--explain',
+                        help='Only show which stages of which experiments would run, and which '
+                             'can be taken from earlier runs',
+                        action='store_true')
+    parser.add_argument('--plots',
+                        help='Which experiments make plots: none, the first round only (default) '
+                             'or all. Plots are rendered in the background',
+                        choices=PLOTS_CHOICES,
+                        default='first')
+    parser.add_argument('--bootstrap',
+                        help='Instead of repeating the experiments TIMES times, score the pairs once and '
+                             'refit the calibrators on this many resamples of the scores, to get a '
+                             'confidence interval per metric',
+                        type=int,
+                        default=0)
+    parser.add_argument('--intervals',
+                        help='Add a confidence interval to the Cllr, AUC and accuracy of each '
+                             'experiment, from this many resamples of its test pairs (e.g. 1000)',
+                        type=int,
+                        default=0)
+    parser.add_argument('--intervals-jobs',
+                        help='The number of processes to compute the --intervals of each experiment '
+                             'on. Defaults to 1, since the experiments themselves may run in parallel',
+                        type=int,
+                        default=1)
+    parser.add_argument('--profile',
+                        help='Also write a Chrome trace of the stages of all experiments to '
+                             '\'output\'. The time and memory use per stage are always written',
+                        action='store_true')
+    parser.add_argument('--queue',
+                        help='A directory on a shared filesystem. Instead of performing the '
+                             'experiments, put them in a work queue in this directory and wait '
+                             'for workers to perform them')
+    parser.add_argument('--worker',
+                        help='Perform experiments from the work queue given by --queue until '
+                             'it is empty. Can be started on several machines at once',
+                        action='store_true')
+    parser.add_argument('--plan',
+                        help='Only show how many experiments, pairs per category and images per '
+                             'scorer the setup has, how many embeddings are cached and an estimate '
+                             'of how long it takes, without loading any model',
+                        action='store_true')
     return parser
 
 
@@ -104,9 +156,8 @@ def create_dataframe(experimental_setup, results: List[Dict]) -> pd.DataFrame:
         **{k: [e.data_config[k] for e in experimental_setup]
            for k in experimental_setup.data_keys}
     })
-    for i, result in enumerate(results):
-        for k, v in result.items():
-            df.loc[i, k] = v
+    # Add all metrics at once, rather than cell by cell.
+    df = pd.concat([df, pd.DataFrame(results, index=df.index)], axis=1)
 
     df['index'] = df.index
     return df
@@ -134,6 +185,8 @@ def get_facevacs_log_lrs() -> DataFrame:
 
 
 def resize_and_normalize(img, target_size):
+    from tensorflow.keras.preprocessing import image
+
     right_size_img = cv2.resize(img, target_size)
 
     img_pixels = image.img_to_array(right_size_img)
@@ -149,11 +202,65 @@ def fix_tensorflow_rtx():
     """
     A fix to make tensorflow-gpu work with RTX cards (or at least the 2700).
     """
+    import tensorflow as tf
+
     gpu_devices = tf.config.experimental.list_physical_devices('GPU')
     for device in gpu_devices:
         tf.config.experimental.set_memory_growth(device, True)
 
 
+def md5(text: str) -> str:
+    """
+    Returns the md5 hex digest of `text`, e.g. to derive file names for
+    things that are cached on disk.
+    """
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def file_md5(path: str) -> str:
+    """
+    Returns the md5 hex digest of the content of the file at `path`, or an
+    empty string if there is no such file.
+    """
+    if not os.path.isfile(path):
+        return ''
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_file_key(path: str) -> str:
+    """
+    Returns a hash of `path` and the size and modification time of the file
+    there (if it exists), which changes whenever the file is replaced or
+    edited, without reading it.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return md5(path)
+    return md5(f'{path}|{stat.st_size}|{stat.st_mtime_ns}')
+
+
+def get_worker_id() -> str:
+    """
+    Returns an id of this process that is unique across the machines that
+    share a filesystem.
+    """
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def get_tmp_path(path: str) -> str:
+    """
+    Returns the path of a temporary file to write `path` to before it is
+    atomically renamed, which no other process, on this machine or another,
+    uses at the same time.
+    """
+    return f'{path}.{get_worker_id()}.tmp'
+
+
 def cache(func):
     """
     A thin wrapper around `lru_cache` so we don't have to specify a `maxsize`.
@@ -166,16 +273,20 @@ def save_predicted_lrs(scorer,
                        test_pairs,
                        lr_predicted,
                        make_plots_and_save_as):
-    output_file = os.path.join(
-        os.path.dirname(make_plots_and_save_as),
-        'lr_results.csv')
-    experiment_id = os.path.split(make_plots_and_save_as)[-1]
+    write_predicted_lrs(
+        get_predicted_lrs(scorer, calibrator, test_pairs, lr_predicted),
+        make_plots_and_save_as)
 
-    # TODO: dataset toevoegen als dit leesbaar is
-    field_names = ['scorers', 'calibrators', 'experiment_id', 'pair_id',
-                   'logLR']
 
-    rows_to_write = []
+def get_predicted_lrs(scorer,
+                      calibrator,
+                      test_pairs,
+                      lr_predicted) -> List[List]:
+    """
+    Returns the rows of `lr_results.csv` (see `write_predicted_lrs()`) for the
+    ENFSI pairs among the `test_pairs`, without the experiment id.
+    """
+    rows = []
     for lr, pair in zip(lr_predicted, test_pairs):
         first, second = pair
         # only save for enfsi pairs
@@ -184,12 +295,29 @@ def save_predicted_lrs(scorer,
                 and first.meta['idx'] == second.meta['idx']:
             pair_id = f"enfsi_{first.meta['year']}_" \
                       f"{first.meta['idx']}"
-            rows_to_write.append([scorer,
-                                  calibrator,
-                                  experiment_id,
-                                  pair_id,
-                                  np.log10(lr)])
+            rows.append([str(scorer),
+                         str(calibrator),
+                         pair_id,
+                         np.log10(lr)])
+    return rows
+
+
+def write_predicted_lrs(rows: List[List], make_plots_and_save_as: str):
+    """
+    Appends the `rows` of `get_predicted_lrs()` to the `lr_results.csv` next
+    to `make_plots_and_save_as`, with the experiment id taken from it.
+    """
+    output_file = os.path.join(
+        os.path.dirname(make_plots_and_save_as),
+        'lr_results.csv')
+    experiment_id = os.path.split(make_plots_and_save_as)[-1]
+
+    # TODO: dataset toevoegen als dit leesbaar is
+    field_names = ['scorers', 'calibrators', 'experiment_id', 'pair_id',
+                   'logLR']
 
+    rows_to_write = [[scorer, calibrator, experiment_id, pair_id, log_lr]
+                     for scorer, calibrator, pair_id, log_lr in rows]
     if rows_to_write:
         if not os.path.exists(output_file):
             with open(output_file, 'w', newline='') as f:
@@ -226,8 +354,9 @@ def get_enfsi_lrs():
     }
 
     columns_df = ['Groundtruth', 'pictures', 'pair_id']
-    df_enfsi = pd.DataFrame(columns=columns_df)
-    columns_df.extend([n for n in range(1, 40 + 1)])
+    # The sheets are concatenated once at the end, rather than appended one
+    # by one.
+    dfs = []
 
     for year in ['2011', '2012', '2013', '2017']:
         df_temp = pd.read_excel(os.path.join('resources', 'enfsi',
@@ -247,8 +376,11 @@ def get_enfsi_lrs():
         df_temp['pair_id'] = df_temp.apply(
             lambda row: f'enfsi_{year}_{row.pictures}', axis=1)
 
-        df_enfsi = df_enfsi.append(df_temp)
+        dfs.append(df_temp)
 
+    df_enfsi = pd.concat(dfs)
+    df_enfsi = df_enfsi[columns_df + [c for c in df_enfsi.columns
+                                      if c not in columns_df]]
     return df_enfsi.replace('-', 0)
 
 
@@ -0,0 +1,255 @@
+"""
+A work queue on a (shared) filesystem, so that several processes, possibly
+on different machines, can work through the same set of tasks. The queue is
+a directory with three subdirectories:
+
+- `pending/`: a pickled task per file, `<index>.task`;
+- `claimed/`: tasks that a worker is performing, `<index>@<worker>.task`;
+- `results/`: the pickled result per task, `<index>.result`.
+
+A worker claims a task by renaming it from `pending/` to `claimed/`, which is
+atomic, so each task is claimed by one worker only. While it performs the
+task, the worker renews its claim by touching the file. A claim that has not
+been renewed for `lease_timeout` seconds, for example because its worker
+died, is moved back to `pending/` by `release_stale()`, so another worker
+can perform it. All ages are measured against the clock of the filesystem
+rather than that of the machine, since the clocks of different machines
+need not agree.
+
+Results are written atomically. A task whose worker only seemed dead may be
+performed twice; both then write the same result.
+"""
+
+from __future__ import annotations
+
+import os
+import pickle
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Optional, Dict, List, Callable, Collection, Iterator
+
+from lr_face.parallel import TaskFailure
+from lr_face.utils import get_worker_id, get_tmp_path
+
+# The number of seconds after which a claim that is not renewed is stale.
+LEASE_TIMEOUT = 300
+
+
+@dataclass
+class Claim:
+    index: int
+    task: Any
+    path: str
+
+
+class WorkQueue:
+    def __init__(self, directory: str, lease_timeout: float = LEASE_TIMEOUT):
+        self.directory = directory
+        self.lease_timeout = lease_timeout
+        for subdirectory in ['pending', 'claimed', 'results']:
+            os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+
+    def put(self, index: int, task: Any):
+        """
+        Adds the `task` with `index` to the queue. Any earlier result of a
+        task with the same index is removed.
+
+        :param index: int
+        :param task: Any
+        """
+        _remove(self._result_path(index))
+        _dump(task, self._pending_path(index))
+
+    def claim(self, worker_id: Optional[str] = None) -> Optional[Claim]:
+        """
+        Claims the pending task with the lowest index, or returns None if no
+        task is pending.
+
+        :param worker_id: Optional[str], defaults to the host name and pid
+        :return: Optional[Claim]
+        """
+        worker_id = worker_id or get_worker_id()
+        for index in self._list('pending', '.task'):
+            path = self._path('claimed', f'{index:06d}@{worker_id}.task')
+            try:
+                os.rename(self._pending_path(index), path)
+            except FileNotFoundError:
+                # Another worker was first.
+                continue
+            if os.path.exists(self._result_path(index)):
+                # A stale claim that was finished after it was released.
+                _remove(path)
+                continue
+            # The lease starts now, not when the task was put.
+            os.utime(path)
+            with open(path, 'rb') as f:
+                return Claim(index, pickle.load(f), path)
+        return None
+
+    def renew(self, claim: Claim) -> bool:
+        """
+        Renews the lease of the `claim`. Returns False if the claim was
+        released because it was stale.
+
+        :param claim: Claim
+        :return: bool
+        """
+        try:
+            os.utime(claim.path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def complete(self, claim: Claim, result: Any):
+        """
+        Writes the `result` of the task of the `claim` and removes the task
+        from the queue.
+
+        :param claim: Claim
+        :param result: Any
+        """
+        _dump(result, self._result_path(claim.index))
+        _remove(claim.path)
+        # In case the claim was released in the meantime.
+        _remove(self._pending_path(claim.index))
+
+    def release_stale(self) -> List[int]:
+        """
+        Moves all claims that were not renewed within the lease timeout back
+        to `pending/` and returns the indices of their tasks.
+
+        :return: List[int]
+        """
+        released = []
+        now = self._now()
+        claimed_dir = os.path.join(self.directory, 'claimed')
+        for filename in os.listdir(claimed_dir):
+            path = os.path.join(claimed_dir, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            # Renaming a file only updates its ctime.
+            if now - max(stat.st_mtime, stat.st_ctime) < self.lease_timeout:
+                continue
+            index = int(filename.split('@')[0])
+            try:
+                os.rename(path, self._pending_path(index))
+            except FileNotFoundError:
+                continue
+            released.append(index)
+        return released
+
+    def get_results(self, ignore: Collection[int] = ()) -> Dict[int, Any]:
+        """
+        Returns the results of all finished tasks, except those with an index
+        in `ignore`.
+
+        :param ignore: Collection[int]
+        :return: Dict[int, Any]
+        """
+        results = {}
+        for index in self._list('results', '.result'):
+            if index not in ignore:
+                with open(self._result_path(index), 'rb') as f:
+                    results[index] = pickle.load(f)
+        return results
+
+    def is_done(self) -> bool:
+        """
+        Returns whether no tasks are pending or claimed anymore.
+
+        :return: bool
+        """
+        return not any(self._list(subdirectory, '.task')
+                       for subdirectory in ['pending', 'claimed'])
+
+    def _now(self) -> float:
+        path = os.path.join(self.directory, '.clock')
+        with open(path, 'a'):
+            os.utime(path)
+        return os.stat(path).st_mtime
+
+    def _list(self, subdirectory: str, extension: str) -> List[int]:
+        return sorted(int(filename[:-len(extension)].split('@')[0])
+                      for filename in os.listdir(
+                          os.path.join(self.directory, subdirectory))
+                      if filename.endswith(extension))
+
+    def _pending_path(self, index: int) -> str:
+        return self._path('pending', f'{index:06d}.task')
+
+    def _result_path(self, index: int) -> str:
+        return self._path('results', f'{index:06d}.result')
+
+    def _path(self, subdirectory: str, filename: str) -> str:
+        return os.path.join(self.directory, subdirectory, filename)
+
+
+def work(queue: WorkQueue,
+         function: Callable[[Any], Any],
+         poll_interval: float = 5.,
+         worker_id: Optional[str] = None) -> int:
+    """
+    Performs `function(task)` for tasks from the `queue` until no tasks are
+    pending or claimed anymore, and returns the number of tasks performed.
+    While other workers still hold claims, this worker waits for them to
+    finish or go stale. A task that raises an exception gets a `TaskFailure`
+    as its result.
+
+    :param queue: WorkQueue
+    :param function: Callable[[Any], Any]
+    :param poll_interval: float, the number of seconds between polls
+    :param worker_id: Optional[str]
+    :return: int
+    """
+    num_performed = 0
+    while True:
+        queue.release_stale()
+        claim = queue.claim(worker_id)
+        if claim is None:
+            if queue.is_done():
+                return num_performed
+            time.sleep(poll_interval)
+            continue
+        with _keep_renewing(queue, claim):
+            try:
+                result = function(claim.task)
+            except Exception:
+                result = TaskFailure(claim.index, traceback.format_exc())
+        queue.complete(claim, result)
+        num_performed += 1
+
+
+@contextmanager
+def _keep_renewing(queue: WorkQueue, claim: Claim) -> Iterator[None]:
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(queue.lease_timeout / 4):
+            queue.renew(claim)
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _dump(obj: Any, path: str):
+    tmp_path = get_tmp_path(path)
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -6,15 +6,15 @@ from lir import (LogitCalibrator,
                  IsotonicCalibrator,
                  DummyCalibrator)
 
+from lr_face.calibrators import (BinnedKDECalibrator,
+                                 IncrementalKDECalibrator,
+                                 IncrementalLogitCalibrator)
 from lr_face.data import (TestDataset,
                           EnfsiDataset,
                           LfwDataset,
                           LfwDevDataset,
                           SCDataset, ForenFaceDataset)
 from lr_face.models import Architecture
-from lr_face.utils import fix_tensorflow_rtx
-
-fix_tensorflow_rtx()
 
 """How often to repeat all experiments"""
 TIMES = 1
@@ -134,6 +134,12 @@ CALIBRATORS = {
         'logit_normalized': NormalizedCalibrator(LogitCalibrator()),
         'KDE': KDECalibrator(),
         'elub_KDE': ELUBbounder(KDECalibrator()),
+        # The same KDE, evaluated on a grid, for large calibration sets.
+        'binned_KDE': BinnedKDECalibrator(),
+        # Calibrators that can be updated with new calibration scores later,
+        # see update_lr_system.py.
+        'incremental_logit': IncrementalLogitCalibrator(),
+        'incremental_KDE': IncrementalKDECalibrator(),
         'dummy': DummyCalibrator(),
         'fraction': FractionCalibrator(),
         'isotonic': IsotonicCalibrator(add_one=True)
@@ -1,47 +1,427 @@
 #!/usr/bin/env python3
 import os
-from typing import Dict, Optional
+import time
+from collections import Counter
+from typing import Dict, Optional, List, Tuple, Callable
 
 import confidence
 import numpy as np
 from lir import CalibratedScorer
+from sklearn.base import BaseEstimator
 from tqdm import tqdm
 
+from lr_face.bootstrap import ScoresAndLabels, bootstrap as bootstrap_metrics
+from lr_face.checkpoints import CheckpointStore, CHECKPOINTS_DIR
+from lr_face.data import FacePair, Dataset
 from lr_face.evaluators import evaluate
 from lr_face.experiments import ExperimentalSetup, Experiment
+from lr_face.lr_systems import (LR_SYSTEMS_DIR,
+                                fit_calibrators,
+                                save_lr_system,
+                                get_lr_system_path)
+from lr_face.pair_lists import get_images_by_path
+from lr_face.parallel import run_grouped, TaskFailure
+from lr_face.planning import make_plan, format_plan, record_throughput
+from lr_face.plotting import PlotSink, BackgroundPlotSink
+from lr_face.profiling import (Profiler,
+                               profile as profile_experiment,
+                               span,
+                               write_profiles,
+                               write_trace,
+                               PROFILE_SUFFIX,
+                               TRACE_SUFFIX)
+from lr_face.results import ResultsWriter, get_config_columns, get_config
+from lr_face.scores import summarize_score_counts
+from lr_face.stages import (ArtifactStore,
+                             get_pairs_key,
+                             get_scores_key,
+                             get_calibration_key,
+                             get_evaluation_key,
+                             get_plots_key,
+                             resolve_stage_keys,
+                             explain as explain_stages)
+from lr_face.work_queue import WorkQueue, work
 from lr_face.utils import (write_output,
                            parser_setup,
                            create_dataframe,
                            write_all_pairs_to_file,
-                           get_valid_scores)
+                           get_valid_scores,
+                           fix_tensorflow_rtx,
+                           write_predicted_lrs,
+                           cache)
 from params import TIMES, PAIRS_FROM_FILE
 
 
-def run(scorers, calibrators, data, params):
+def run(scorers, calibrators, data, params, jobs=1, resume=None, explain=False,
+        plots='first', bootstrap=0, intervals=0, intervals_jobs=1,
+        profile=False, queue=None, worker=False, plan=False):
+    # The bootstrap replaces repeating the experiments.
+    num_repeats = 1 if bootstrap else TIMES
+    if plan:
+        print(format_plan(*make_plan(scorers, calibrators, data, params,
+                                     num_repeats, PAIRS_FROM_FILE)))
+        return
+    if worker:
+        if not queue:
+            raise ValueError('A worker needs a --queue to take tasks from')
+        num_performed = work(WorkQueue(queue), _perform_experiment_in_worker)
+        print(f'The queue is empty; performed {num_performed} experiments')
+        return
+    if resume and not os.path.exists(os.path.join('output', resume)):
+        raise ValueError(f'Cannot resume {resume}: no such run in \'output\'')
     experimental_setup = ExperimentalSetup(
         scorer_names=scorers,
         calibrator_names=calibrators,
         data_config_names=data,
         param_names=params,
-        num_repeats=TIMES
+        num_repeats=num_repeats,
+        name=resume
     )
     output_dir = os.path.join('output', experimental_setup.name)
+    plot_paths = []
+    for experiment in experimental_setup:
+        # By default, make plots for the first round only.
+        make_plots_and_save_as = None
+        if plots == 'all' or (plots == 'first' and experiment.repeat == 0):
+            make_plots_and_save_as = os.path.join(output_dir, str(experiment))
+            if experiment.repeat:
+                make_plots_and_save_as += f' repeat {experiment.repeat}'
+        plot_paths.append(make_plots_and_save_as)
+    if explain:
+        store = ArtifactStore()
+        print(explain_stages(
+            [resolve_stage_keys(experiment, store, PAIRS_FROM_FILE,
+                                experimental_setup.name, plot_path, bootstrap,
+                                intervals)
+             for experiment, plot_path in zip(experimental_setup, plot_paths)],
+            store,
+            [str(experiment) for experiment in experimental_setup]))
+        return
+
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    results = []
+    lr_systems_dir = os.path.join(output_dir, LR_SYSTEMS_DIR)
+    experimental_setup.precompute_attributes()
     all_calibration_pairs = set()
     all_test_pairs = set()
-    for i, experiment in enumerate(tqdm(experimental_setup)):
-        # Make plots for the first round only.
-        make_plots_and_save_as = None
-        if i < len(experimental_setup) / TIMES:
-            make_plots_and_save_as = os.path.join(output_dir, str(experiment))
-        results.append(perform_experiment(experiment, make_plots_and_save_as, all_calibration_pairs, all_test_pairs,
-                                          pairs_from_file=PAIRS_FROM_FILE))
+
+    # Every result is checkpointed as soon as it is known, so that a run that
+    # is resumed only performs the experiments that did not finish.
+    checkpoints = CheckpointStore(os.path.join(output_dir, CHECKPOINTS_DIR))
+    results = [checkpoints.load(experiment.fingerprint)
+               for experiment in experimental_setup]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if resume:
+        print(f'Resuming {resume}: {len(results) - len(pending)} of '
+              f'{len(results)} experiments are already done')
+    # The timings and memory use of the stages of each experiment that is
+    # performed in this run (see `lr_face.profiling`).
+    profilers: Dict[int, Profiler] = {}
+    # How many pairs were scored and how many scores were reused, over all
+    # workers (see `lr_face.scores.ScoreCache`).
+    score_counts = Counter()
+
+    # Results are also written as soon as they are known, so they can be
+    # inspected while the run is going (see `lr_face.results`).
+    writer = ResultsWriter(experimental_setup.name,
+                           get_config_columns(experimental_setup))
+
+    def write_result(i: int, result: Dict[str, float]):
+        writer.write(i, get_config(experimental_setup,
+                                   experimental_setup.experiments[i]), result)
+
+    for i, result in enumerate(results):
+        if result is not None:
+            write_result(i, result)
+
+    if queue:
+        queued_results = run_queued(experimental_setup,
+                                    pending,
+                                    plot_paths,
+                                    all_calibration_pairs,
+                                    all_test_pairs,
+                                    (calibrators, data, params,
+                                     experimental_setup.num_repeats),
+                                    profilers,
+                                    score_counts,
+                                    checkpoints.directory,
+                                    lr_systems_dir,
+                                    bootstrap,
+                                    intervals,
+                                    profile,
+                                    queue,
+                                    on_result=write_result)
+        for i, result in zip(pending, queued_results):
+            results[i] = result
+    elif jobs > 1:
+        parallel_results = run_parallel(experimental_setup,
+                                        pending,
+                                        plot_paths,
+                                        all_calibration_pairs,
+                                        all_test_pairs,
+                                        (calibrators, data, params,
+                                         experimental_setup.num_repeats),
+                                        profilers,
+                                        score_counts,
+                                        checkpoints.directory,
+                                        lr_systems_dir,
+                                        bootstrap,
+                                        intervals,
+                                        profile,
+                                        jobs,
+                                        on_result=write_result)
+        for i, result in zip(pending, parallel_results):
+            results[i] = result
+    else:
+        # Only the processes that perform experiments load any network (see
+        # `lr_face.models.LazyEmbeddingModel`).
+        fix_tensorflow_rtx()
+        # Plots are rendered in the background while the experiments go on.
+        plot_sink = BackgroundPlotSink() if plots != 'none' else None
+        for i in tqdm(pending):
+            experiment = experimental_setup.experiments[i]
+            with profile_experiment(trace=profile, experiment=i) as profiler, \
+                    span('experiment'):
+                results[i] = perform_experiment(experiment, plot_paths[i], all_calibration_pairs, all_test_pairs,
+                                                pairs_from_file=PAIRS_FROM_FILE,
+                                                artifacts=ArtifactStore(),
+                                                save_lr_system_as=get_lr_system_path(
+                                                    lr_systems_dir, i),
+                                                plot_sink=plot_sink,
+                                                bootstrap=bootstrap,
+                                                intervals=intervals,
+                                                intervals_jobs=intervals_jobs,
+                                                run_name=experimental_setup.name)
+            profilers[i] = profiler
+            checkpoints.save(experiment.fingerprint, results[i])
+            write_result(i, results[i])
+        score_counts.update(
+            computed=experimental_setup.score_cache.num_computed,
+            reused=experimental_setup.score_cache.num_reused)
+        if plot_sink:
+            plot_sink.close()
+    print(summarize_score_counts(score_counts['computed'],
+                                 score_counts['reused']))
 
     write_all_pairs_to_file(all_calibration_pairs, all_test_pairs)
     df = create_dataframe(experimental_setup, results)
     write_output(df, experimental_setup.name)
+    write_profiles(profilers, os.path.join(
+        'output', experimental_setup.name + PROFILE_SUFFIX))
+    # Improve the estimates of `run.py --plan`.
+    record_throughput(profilers, {
+        i: experimental_setup.experiments[i].scorer.embedding_model.name
+        for i in profilers})
+    if profile:
+        trace_path = os.path.join('output',
+                                  experimental_setup.name + TRACE_SUFFIX)
+        write_trace(profilers.values(), trace_path)
+        print(f'Wrote a Chrome trace of the run to {trace_path}')
+
+
+def run_parallel(experimental_setup: ExperimentalSetup,
+                 indices: List[int],
+                 plot_paths: List[Optional[str]],
+                 all_calibration_pairs: set,
+                 all_test_pairs: set,
+                 config: Tuple,
+                 profilers: Dict[int, Profiler],
+                 score_counts: Counter,
+                 checkpoint_dir: str,
+                 lr_systems_dir: str,
+                 bootstrap: int,
+                 intervals: int,
+                 profile: bool,
+                 jobs: int,
+                 on_result: Optional[Callable[[int, Dict[str, float]], None]]
+                 = None) -> List[Dict[str, float]]:
+    """
+    Performs the experiments of `experimental_setup` at `indices` on a pool
+    of `jobs` processes and returns their results in the same order.
+    Experiments that share a scorer are grouped on the same worker, which
+    builds its own `ExperimentalSetup` for that scorer, so each network is
+    only loaded once per worker, and never by this process: the scorers of
+    `experimental_setup` only load their network when they embed an image.
+    Workers checkpoint each result in `checkpoint_dir`, save the LR system of
+    each experiment in `lr_systems_dir`, and return the `Profiler` of each
+    experiment, which is added to `profilers`, and how many pairs it scored
+    and how many scores it reused, which are added to `score_counts`.
+    Experiments that fail are reported and get an `error` result. `config` holds the calibrator, data and params names and the
+    number of repeats of the setup. `on_result` is called with the index and
+    result of each experiment as soon as it is known.
+    """
+    tasks = _make_tasks(experimental_setup, indices, plot_paths, config,
+                        checkpoint_dir, lr_systems_dir, bootstrap, intervals,
+                        profile)
+    results = {}
+
+    def collect(position: int, outcome):
+        i = indices[position]
+        results[i] = _collect_outcome(experimental_setup, i, outcome,
+                                      all_calibration_pairs, all_test_pairs,
+                                      profilers, score_counts)
+        if on_result:
+            on_result(i, results[i])
+
+    run_grouped(_perform_experiment_in_worker,
+                tasks,
+                [task[0] for task in tasks],
+                jobs,
+                callback=collect)
+    return [results[i] for i in indices]
+
+
+def run_queued(experimental_setup: ExperimentalSetup,
+               indices: List[int],
+               plot_paths: List[Optional[str]],
+               all_calibration_pairs: set,
+               all_test_pairs: set,
+               config: Tuple,
+               profilers: Dict[int, Profiler],
+               score_counts: Counter,
+               checkpoint_dir: str,
+               lr_systems_dir: str,
+               bootstrap: int,
+               intervals: int,
+               profile: bool,
+               queue_dir: str,
+               on_result: Optional[Callable[[int, Dict[str, float]], None]]
+               = None,
+               poll_interval: float = 5.) -> List[Dict[str, float]]:
+    """
+    Like `run_parallel()`, but puts the experiments in the work queue in
+    `queue_dir` (see `lr_face.work_queue`) and waits until workers, which
+    may run on other machines that share the filesystem, have performed
+    them. Workers are started with `run.py --worker --queue <queue_dir>`.
+    The queue entries only hold configuration names, so putting them in the
+    queue does not load any network either.
+    """
+    queue = WorkQueue(queue_dir)
+    for i, task in zip(indices, _make_tasks(experimental_setup, indices,
+                                            plot_paths, config, checkpoint_dir,
+                                            lr_systems_dir, bootstrap,
+                                            intervals, profile)):
+        queue.put(i, task)
+    print(f'Put {len(indices)} experiments in the queue at {queue_dir}, '
+          f'start workers with: run.py --worker --queue {queue_dir}')
+
+    results = {}
+    with tqdm(total=len(indices)) as progress:
+        while len(results) < len(indices):
+            # Workers release stale claims too, but there may be none left.
+            queue.release_stale()
+            for i, outcome in queue.get_results(ignore=results).items():
+                if i not in indices:
+                    continue
+                results[i] = _collect_outcome(experimental_setup, i, outcome,
+                                              all_calibration_pairs,
+                                              all_test_pairs, profilers,
+                                              score_counts)
+                if on_result:
+                    on_result(i, results[i])
+                progress.update()
+            if len(results) < len(indices):
+                time.sleep(poll_interval)
+    return [results[i] for i in indices]
+
+
+def _make_tasks(experimental_setup: ExperimentalSetup,
+                indices: List[int],
+                plot_paths: List[Optional[str]],
+                config: Tuple,
+                checkpoint_dir: str,
+                lr_systems_dir: str,
+                bootstrap: int,
+                intervals: int,
+                profile: bool) -> List[Tuple]:
+    scorer_names = [experimental_setup.get_scorer_name(experiment)
+                    for experiment in experimental_setup]
+    # The worker's setup only contains the experiments of a single scorer, in
+    # the same relative order as in the full setup.
+    counts = Counter()
+    local_indices = []
+    for name in scorer_names:
+        local_indices.append(counts[name])
+        counts[name] += 1
+    *config_names, num_repeats = config
+    return [(scorer_names[i], *map(_to_tuple, config_names), num_repeats,
+             local_indices[i], plot_paths[i],
+             get_lr_system_path(lr_systems_dir, i), checkpoint_dir,
+             experimental_setup.name, bootstrap, intervals, profile)
+            for i in indices]
+
+
+def _collect_outcome(experimental_setup: ExperimentalSetup,
+                     i: int,
+                     outcome,
+                     all_calibration_pairs: set,
+                     all_test_pairs: set,
+                     profilers: Dict[int, Profiler],
+                     score_counts: Counter) -> Dict[str, float]:
+    if isinstance(outcome, TaskFailure):
+        print(f'Experiment {i} ({experimental_setup.experiments[i]}) '
+              f'failed:\n{outcome}')
+        return {'error': outcome.traceback.strip().splitlines()[-1]}
+    result, calibration_pairs, test_pairs, profiler, counts = outcome
+    all_calibration_pairs.update(calibration_pairs)
+    all_test_pairs.update(test_pairs)
+    profilers[i] = profiler
+    score_counts.update(counts)
+    return result
+
+
+def _to_tuple(names: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+    return tuple(names) if names else None
+
+
+@cache
+def _get_worker_setup(scorer_name: str,
+                      calibrators: Optional[Tuple[str, ...]],
+                      data: Optional[Tuple[str, ...]],
+                      params: Optional[Tuple[str, ...]],
+                      num_repeats: int) -> ExperimentalSetup:
+    fix_tensorflow_rtx()
+    return ExperimentalSetup(
+        scorer_names=[scorer_name],
+        calibrator_names=calibrators,
+        data_config_names=data,
+        param_names=params,
+        num_repeats=num_repeats
+    )
+
+
+def _perform_experiment_in_worker(task: Tuple) \
+        -> Tuple[Dict[str, float], set, set, Profiler, Counter]:
+    *config, index, make_plots_and_save_as, save_lr_system_as, \
+        checkpoint_dir, run_name, bootstrap, intervals, profile = task
+    setup = _get_worker_setup(*config)
+    experiment = setup.experiments[index]
+    # The cache is shared by all experiments of this worker, so only the
+    # counts of this experiment are returned.
+    score_cache = setup.score_cache
+    num_computed, num_reused = score_cache.num_computed, score_cache.num_reused
+    all_calibration_pairs = set()
+    all_test_pairs = set()
+    with profile_experiment(trace=profile, experiment=index) as profiler, \
+            span('experiment'):
+        result = perform_experiment(experiment, make_plots_and_save_as,
+                                    all_calibration_pairs, all_test_pairs,
+                                    pairs_from_file=PAIRS_FROM_FILE,
+                                    artifacts=ArtifactStore(),
+                                    save_lr_system_as=save_lr_system_as,
+                                    # The workers already run in parallel.
+                                    bootstrap=bootstrap,
+                                    bootstrap_jobs=1,
+                                    calibration_jobs=1,
+                                    intervals=intervals,
+                                    intervals_jobs=1,
+                                    run_name=run_name)
+    CheckpointStore(checkpoint_dir).save(experiment.fingerprint, result)
+    score_counts = Counter(
+        computed=score_cache.num_computed - num_computed,
+        reused=score_cache.num_reused - num_reused)
+    return result, all_calibration_pairs, all_test_pairs, profiler, \
+        score_counts
 
 
 def perform_experiment(
@@ -49,49 +429,192 @@ def perform_experiment(
         make_plots_and_save_as: Optional[str],
         all_calibration_pairs: set,
         all_test_pairs: set,
-        pairs_from_file: bool = False
+        pairs_from_file: bool = False,
+        artifacts: Optional[ArtifactStore] = None,
+        save_lr_system_as: Optional[str] = None,
+        plot_sink: Optional[PlotSink] = None,
+        bootstrap: int = 0,
+        bootstrap_jobs: Optional[int] = None,
+        calibration_jobs: Optional[int] = None,
+        intervals: int = 0,
+        intervals_jobs: Optional[int] = 1,
+        run_name: Optional[str] = None
 ) -> Dict[str, float]:
     """
     Function to run a single experiment with pipeline:
-    - Fit model on train data
+    - Make calibration and test pairs per category
+    - Score all pairs
     - Fit calibrator on calibrator data
-    - Evaluate test set
+    - Evaluate test set (and make plots)
+    Each of these stages is skipped if its result is in `artifacts` already
+    (see `lr_face.stages`). The calibrators are fitted per category on
+    `calibration_jobs` threads, or restored if they were fitted on the same
+    scores before (see `lr_face.lr_systems`), and the resulting LR system is saved as
+    `save_lr_system_as`, if given. Plots are handed to the `plot_sink`, if
+    given.
+    If `bootstrap` is positive, the evaluation also includes confidence
+    intervals from refitting the calibrators on that many resamples of the
+    scores, on `bootstrap_jobs` processes (see `lr_face.bootstrap`). If
+    `intervals` is positive, the metrics also get confidence intervals from
+    that many resamples of the test pairs (see `lr_face.intervals`), on
+    `intervals_jobs` processes (None for all processors).
+    Pairs that are generated rather than read from file are only reused
+    within the run called `run_name`, and not stored at all without one.
     """
+    artifacts = artifacts or ArtifactStore(None)
+    plot_sink = plot_sink or PlotSink()
+
+    with span('pairs'):
+        pair_paths = artifacts.get_or_compute(
+            'pairs', get_pairs_key(experiment, pairs_from_file, run_name),
+            lambda: _make_pair_paths(experiment, pairs_from_file))
+    if not pairs_from_file:
+        for side, all_pairs in [('calibration', all_calibration_pairs),
+                                ('test', all_test_pairs)]:
+            for pairs in pair_paths[side].values():
+                all_pairs.update(pairs)
+
+    # The `FacePair`s are only needed by the stages that are not cached.
+    face_pairs = {}
+
+    def get_face_pairs(side: str) -> Dict[Tuple, List[FacePair]]:
+        if side not in face_pairs:
+            with span('face_pairs'):
+                face_pairs[side] = _to_face_pairs(
+                    pair_paths[side], experiment.data_config[side])
+        return face_pairs[side]
+
+    scores_key = get_scores_key(experiment, pair_paths)
+    with span('scores'):
+        scores = artifacts.get_or_compute('scores', scores_key, lambda: {
+            'calibration': experiment.scorer.predict_proba_per_category(
+                get_face_pairs('calibration')),
+            # Test pairs without a calibrated category are never evaluated.
+            'test': experiment.scorer.predict_proba_per_category(
+                {category: pairs
+                 for category, pairs in get_face_pairs('test').items()
+                 if category in pair_paths['calibration']})
+        })
+    calibration_key = get_calibration_key(scores_key, scores,
+                                          experiment.calibrator)
+    with span('calibration'):
+        calibrators, cal_fraction_valid = artifacts.get_or_compute(
+            'calibration', calibration_key,
+            lambda: _fit_calibrators(experiment,
+                                     get_face_pairs('calibration'),
+                                     scores['calibration'],
+                                     artifacts,
+                                     calibration_jobs))
+    if save_lr_system_as:
+        save_lr_system(save_lr_system_as, experiment.scorer, calibrators)
+
+    evaluation_key = get_evaluation_key(calibration_key, scores, bootstrap,
+                                        intervals)
+    plots_key = get_plots_key(evaluation_key, make_plots_and_save_as)
+    plots_done = not plots_key or artifacts.has('plots', plots_key)
+    if plots_done and artifacts.has('evaluation', evaluation_key):
+        result, predicted_lrs = artifacts.load('evaluation', evaluation_key)
+    else:
+        lr_systems = {category: CalibratedScorer(experiment.scorer, calibrator)
+                      for category, calibrator in calibrators.items()}
+        test_pairs_per_category = get_face_pairs('test')
+        predicted_lrs = []
+        with span('evaluation'):
+            result = evaluate(experiment=experiment,
+                              lr_systems=lr_systems,
+                              test_pairs_per_category=test_pairs_per_category,
+                              make_plots_and_save_as=None if plots_done else make_plots_and_save_as,
+                              cal_fraction_valid=cal_fraction_valid,
+                              test_scores_per_category=scores['test'],
+                              plot_sink=plot_sink,
+                              intervals=intervals,
+                              intervals_jobs=intervals_jobs,
+                              predicted_lrs=predicted_lrs)
+        if bootstrap:
+            with span('bootstrap'):
+                result.update(bootstrap_metrics(
+                    experiment.calibrator,
+                    _to_scores_and_labels(get_face_pairs('calibration'),
+                                          scores['calibration']),
+                    _to_scores_and_labels(test_pairs_per_category,
+                                          scores['test']),
+                    num_samples=bootstrap,
+                    n_jobs=bootstrap_jobs))
+        artifacts.save('evaluation', evaluation_key, (result, predicted_lrs))
+        if not plots_done:
+            # Only once the plots have actually been saved, so that plots
+            # that failed are made again next time.
+            plot_sink.on_rendered(lambda: artifacts.save(
+                'plots', plots_key, make_plots_and_save_as))
+    # The LRs of the ENFSI pairs are saved with the plots, whether the
+    # evaluation was cached or not.
+    if make_plots_and_save_as:
+        write_predicted_lrs(predicted_lrs, make_plots_and_save_as)
+    return result
+
+
+def _make_pair_paths(experiment: Experiment, pairs_from_file: bool) \
+        -> Dict[str, Dict[Tuple, List[Tuple[str, str]]]]:
     if pairs_from_file:
         calibration_pairs_per_category, test_pairs_per_category = \
             experiment.get_calibration_and_test_pairs_from_file()
     else:
         calibration_pairs_per_category, test_pairs_per_category = \
-            experiment.get_calibration_and_test_pairs(all_calibration_pairs, all_test_pairs)
-    lr_systems = {}
+            experiment.get_calibration_and_test_pairs(set(), set())
+    return {side: {category: [(pair.first.path, pair.second.path)
+                              for pair in pairs]
+                   for category, pairs in pairs_per_category.items()}
+            for side, pairs_per_category in [
+                ('calibration', calibration_pairs_per_category),
+                ('test', test_pairs_per_category)]}
+
+
+def _to_face_pairs(pair_paths: Dict[Tuple, List[Tuple[str, str]]],
+                   datasets: Tuple[Dataset, ...]) \
+        -> Dict[Tuple, List[FacePair]]:
+    images_by_path = get_images_by_path(datasets)
+    return {category: [FacePair(images_by_path[first], images_by_path[second])
+                       for first, second in paths]
+            for category, paths in pair_paths.items()}
+
+
+def _to_scores_and_labels(pairs_per_category: Dict[Tuple, List[FacePair]],
+                          scores_per_category: Dict[Tuple, np.ndarray]) \
+        -> ScoresAndLabels:
+    data = {}
+    for category, p in scores_per_category.items():
+        valid = p[:, 1] != -1
+        y = np.array([int(pair.same_identity)
+                      for pair in pairs_per_category[category]])
+        data[category] = (p[valid, 1], y[valid])
+    return data
+
+
+def _fit_calibrators(experiment: Experiment,
+                     calibration_pairs_per_category: Dict[Tuple, List[FacePair]],
+                     calibration_scores: Dict[Tuple, np.ndarray],
+                     artifacts: ArtifactStore,
+                     n_jobs: Optional[int] = 1) \
+        -> Tuple[Dict[Tuple, BaseEstimator], Dict[Tuple, float]]:
+    fit_data = {}
     cal_fraction_valid = {}
     for category, calibration_pairs in calibration_pairs_per_category.items():
-        lr_systems[category] = CalibratedScorer(experiment.scorer,
-                                                experiment.calibrator)
         # TODO currently, calibration could contain test images
-        if experiment.scorer.embedding_model.name == 'Facevacs':
-            p = np.array(experiment.get_scores_from_file('results_cal_pairs.txt',
-                                                         ((pair.first.path, pair.second.path) for pair in calibration_pairs)))
-        else:
-            p = lr_systems[category].scorer.predict_proba(calibration_pairs)
+        p = calibration_scores[category]
         assert len(p[0]) == 2
         # Remove invalid scores (-1) where no face was found on one of the images in the pair
         p_valid, calibration_pairs_valid = get_valid_scores(p[:, 1], calibration_pairs)
-        y_cal = [int(pair.same_identity) for pair in calibration_pairs_valid]
+        y_cal = np.array([int(pair.same_identity) for pair in calibration_pairs_valid])
         if 0 < np.sum(y_cal) < len(calibration_pairs_valid):
-            lr_systems[category].calibrator.fit(
-                X=p_valid,
-                y=y_cal
-            )
+            fit_data[category] = (p_valid, y_cal)
             cal_fraction_valid[category] = len(calibration_pairs_valid) / len(calibration_pairs)
-        else:
-            del lr_systems[category]
-
-    return evaluate(experiment=experiment,
-                    lr_systems=lr_systems,
-                    test_pairs_per_category=test_pairs_per_category,
-                    make_plots_and_save_as=make_plots_and_save_as,
-                    cal_fraction_valid=cal_fraction_valid)
+
+    # Each category gets its own copy of the calibrator, so fitting one
+    # category does not overwrite the fit of another. Calibrators that were
+    # fitted on the same scores before are restored instead.
+    calibrators = fit_calibrators(experiment.calibrator, fit_data, artifacts,
+                                  n_jobs)
+    return calibrators, cal_fraction_valid
 
 
 if __name__ == '__main__':
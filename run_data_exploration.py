@@ -16,6 +16,7 @@ import streamlit as st
 # -train_calibrate_same_data
 from lir import Xy_to_Xn, calculate_cllr
 
+from lr_face.results import list_runs, read_results, get_results_version
 from lr_face.utils import get_facevacs_log_lrs, get_enfsi_lrs
 
 research_question = 'train_calibrate_same_data'
@@ -37,8 +38,10 @@ def _max_width_():
 
 
 @st.cache
-def get_csv(csv):
-    return pd.read_csv(os.path.join('output', csv))
+def get_results(name, version):
+    # The `version` is only part of the cache key, so that rows that are
+    # written after the first read are shown too.
+    return read_results(name)
 
 
 @st.cache
@@ -49,9 +52,9 @@ def get_enfsi_lrs_cacheable():
 st.title('Data exploration for face comparison models')
 
 _max_width_()
-latest_exp_csv = sorted([f for f in (os.listdir('output')) if f.endswith(
-    'experiments_results.csv')])[-1]
-df_exp = deepcopy(get_csv(latest_exp_csv))
+# The latest run, which may still be going.
+latest_run = list_runs()[-1]
+df_exp = deepcopy(get_results(latest_run, get_results_version(latest_run)))
 df_exp
 set_calibrators = list(set(df_exp['calibrators']))
 set_scorers = list(set(df_exp['scorers']))
@@ -59,7 +62,7 @@ set_calibration_data = list(set(df_exp['calibration']))
 set_test_data = list(set(df_exp['test']))
 
 st.header('General information')
-st.markdown(f'latest csv: {latest_exp_csv}')
+st.markdown(f'latest run: {latest_run}')
 st.markdown(f'no of experiments: {len(df_exp)}')
 st.markdown(f'calibration data: {set_calibration_data}')
 st.markdown(f'test data: {set_test_data}')
@@ -104,7 +107,7 @@ if research_question == 'train_calibrate_same_data':
 
 st.header('Calibration and distribution plots')
 # get all images
-output_plots = latest_exp_csv[0:19]
+output_plots = latest_run
 list_plots = sorted([f for f in (os.listdir(f'./output/{output_plots}/')) if
                      f.endswith('.png')])
 
@@ -0,0 +1,87 @@
+import os
+from typing import List
+
+import pytest
+
+from lr_face.attributes import AttributeTable, ATTRIBUTE_VERSIONS, \
+    get_category_inputs_id
+from lr_face.data import DummyFaceImage, FaceImage, Yaw
+from tests.src.util import scratch_dir
+
+
+@pytest.fixture
+def dummy_images() -> List[FaceImage]:
+    ids = [1, 1, 1, 2, 2, 2, 3, 3, 4, 4, 5]
+    return [DummyFaceImage(path=f'dummy_{i}',
+                           identity=f'TEST-{idx}',
+                           yaw=Yaw.FRONTAL if i % 2 else Yaw.PROFILE)
+            for i, idx in enumerate(ids)]
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_attributes')
+
+
+def test_derived_properties():
+    table = AttributeTable(['yaw', 'resolution_bin', 'pitch'], cache_dir=None)
+    assert table.derived_properties == ['resolution_bin']
+
+
+def test_values_for_categories_match_image_attributes(dummy_images, scratch):
+    properties = ['yaw', 'resolution_bin']
+    table = AttributeTable(properties, cache_dir=scratch)
+    table.compute(dummy_images, n_jobs=2)
+    for image in dummy_images:
+        assert table.get_values_for_categories(image, properties) == \
+               tuple(getattr(image, prop) for prop in properties)
+
+
+def test_derived_properties_are_persisted(dummy_images, scratch):
+    AttributeTable(['resolution_bin'], cache_dir=scratch).compute(dummy_images)
+    assert os.path.exists(os.path.join(scratch, 'resolution_bin.obj'))
+
+    # A new table should only need a lookup, so even images that can no longer
+    # be read should get their value from disk.
+    table = AttributeTable(['resolution_bin'], cache_dir=scratch)
+    unreadable = [FaceImage(image.path, image.identity)
+                  for image in dummy_images]
+    assert [table.get(image, 'resolution_bin') for image in unreadable] == \
+           [image.resolution_bin for image in dummy_images]
+
+
+def test_edited_images_are_computed_again(dummy_images, scratch):
+    path = os.path.join(scratch, 'image.jpg')
+    with open(path, 'w') as f:
+        f.write('image')
+    image = DummyFaceImage(path=path, identity='TEST-1')
+    AttributeTable(['resolution_bin'], cache_dir=scratch).compute([image])
+    table = AttributeTable(['resolution_bin'], cache_dir=scratch,
+                           compute_missing=False)
+    assert table.get(image, 'resolution_bin') == image.resolution_bin
+
+    with open(path, 'w') as f:
+        f.write('another image')
+    table = AttributeTable(['resolution_bin'], cache_dir=scratch,
+                           compute_missing=False)
+    assert table.get(image, 'resolution_bin') is None
+
+
+def test_attributes_are_persisted_per_version(dummy_images, scratch,
+                                              monkeypatch):
+    monkeypatch.setitem(ATTRIBUTE_VERSIONS, 'resolution_bin', lambda: 'a')
+    AttributeTable(['resolution_bin'], cache_dir=scratch).compute(dummy_images)
+    assert os.path.exists(os.path.join(scratch, 'resolution_bin_a.obj'))
+
+    monkeypatch.setitem(ATTRIBUTE_VERSIONS, 'resolution_bin', lambda: 'b')
+    table = AttributeTable(['resolution_bin'], cache_dir=scratch,
+                           compute_missing=False)
+    assert table.get(dummy_images[0], 'resolution_bin') is None
+
+
+def test_category_inputs_id(dummy_images):
+    inputs_id = get_category_inputs_id(dummy_images, ['yaw'])
+    assert get_category_inputs_id(dummy_images[::-1], ['yaw']) == inputs_id
+    assert get_category_inputs_id(dummy_images, ['pitch']) != inputs_id
+    dummy_images[0].yaw = Yaw.HALF_TURNED
+    assert get_category_inputs_id(dummy_images, ['yaw']) != inputs_id
@@ -0,0 +1,35 @@
+import numpy as np
+from sklearn.base import BaseEstimator
+
+from lr_face.bootstrap import confidence_intervals, fit_and_evaluate, \
+    BOOTSTRAP_METRICS
+
+
+class MeanCalibrator(BaseEstimator):
+    def fit(self, X, y):
+        self.mean_ = np.mean(X)
+        return self
+
+    def transform(self, X):
+        return np.exp(X - self.mean_)
+
+
+def test_confidence_intervals():
+    samples = [{'cllr': c, 'auc': 1 - c, 'accuracy': np.nan}
+               for c in np.linspace(0, 1, 101)]
+    intervals = confidence_intervals(samples, alpha=.1)
+    assert np.isclose(intervals['cllr_bootstrap_low'], .05)
+    assert np.isclose(intervals['cllr_bootstrap_high'], .95)
+    assert np.isclose(intervals['auc_bootstrap_low'], .05)
+    assert np.isnan(intervals['accuracy_bootstrap_low'])
+    assert np.isnan(intervals['accuracy_bootstrap_high'])
+
+
+def test_fit_and_evaluate_skips_categories_with_one_class():
+    one_class = (np.array([.1, .2, .3]), np.array([0, 0, 0]))
+    metrics = fit_and_evaluate(MeanCalibrator(),
+                               {('a',): one_class},
+                               {('a',): one_class})
+    assert list(metrics) == BOOTSTRAP_METRICS
+    assert all(np.isnan(value) for value in metrics.values())
+
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from lir import KDECalibrator, LogitCalibrator
+from sklearn.base import clone
+
+from lr_face.calibrators import BinnedKDECalibrator, \
+    IncrementalKDECalibrator, IncrementalLogitCalibrator
+
+
+@pytest.fixture
+def calibration_data():
+    rng = np.random.default_rng(0)
+    y = (rng.random(2000) < .3).astype(int)
+    X = np.clip(rng.normal(.35 + .3 * y, .15), 0, 1)
+    return X, y
+
+
+@pytest.mark.parametrize('bandwidth', [None, .05, (None, .1)])
+def test_binned_kde_calibrator_matches_kde_calibrator(calibration_data,
+                                                      bandwidth):
+    X, y = calibration_data
+    scores = np.linspace(-.2, 1.2, 1001)
+    exact = KDECalibrator(bandwidth).fit(X, y)
+    binned = BinnedKDECalibrator(bandwidth).fit(X, y)
+    expected = np.log10(exact.transform(scores.copy()))
+    assert np.allclose(np.log10(binned.transform(scores)), expected,
+                       atol=1e-2)
+    assert np.allclose(binned.p0, exact.p0, rtol=1e-2)
+    assert np.allclose(binned.p1, exact.p1, rtol=1e-2)
+
+
+def test_binned_kde_calibrator_tails(calibration_data):
+    X, y = calibration_data
+    # Beyond the grid, and where the FFT would not be accurate.
+    scores = np.array([-1., -.4, 1.5, 2.])
+    exact = KDECalibrator().fit(X, y).transform(scores.copy())
+    binned = BinnedKDECalibrator().fit(X, y).transform(scores)
+    assert np.allclose(np.log10(binned), np.log10(exact), atol=.1)
+
+
+def test_binned_kde_calibrator_can_be_cloned(calibration_data):
+    calibrator = BinnedKDECalibrator(bandwidth=.05, grid_size=512)
+    fitted = calibrator.fit(*calibration_data)
+    copy = clone(fitted)
+    assert copy.get_params() == {'bandwidth': .05, 'grid_size': 512}
+    assert not hasattr(copy, 'grid_')
+
+
+@pytest.mark.parametrize('calibrator', [IncrementalKDECalibrator(),
+                                        IncrementalLogitCalibrator()])
+def test_partial_fit_matches_fit(calibration_data, calibrator):
+    X, y = calibration_data
+    # The later scores extend the grid on both sides.
+    order = np.argsort(np.abs(X - .5))
+    X, y = X[order], y[order]
+    fitted = clone(calibrator).fit(X, y)
+    updated = clone(calibrator).fit(X[:200], y[:200])
+    for start in range(200, len(X), 600):
+        updated.partial_fit(X[start:start + 600], y[start:start + 600])
+    scores = np.linspace(-.2, 1.2, 101)
+    assert np.allclose(np.log10(updated.transform(scores)),
+                       np.log10(fitted.transform(scores)), atol=1e-3)
+
+
+def test_incremental_kde_calibrator_matches_kde_calibrator(calibration_data):
+    X, y = calibration_data
+    scores = np.linspace(-.2, 1.2, 101)
+    exact = KDECalibrator().fit(X, y).transform(scores.copy())
+    incremental = IncrementalKDECalibrator().fit(X, y).transform(scores)
+    assert np.allclose(np.log10(incremental), np.log10(exact), atol=1e-2)
+
+
+def test_incremental_logit_calibrator_matches_logit_calibrator(
+        calibration_data):
+    X, y = calibration_data
+    scores = np.linspace(-.2, 1.2, 101)
+    exact = LogitCalibrator().fit(X, y).transform(scores.copy())
+    incremental = IncrementalLogitCalibrator().fit(X, y).transform(scores)
+    assert np.allclose(np.log10(incremental), np.log10(exact), atol=1e-3)
+
+
+def test_incremental_calibrators_need_both_labels(calibration_data):
+    X, y = calibration_data
+    with pytest.raises(ValueError):
+        IncrementalKDECalibrator().fit(X[y == 1], y[y == 1])
+    # Later updates may have scores of one label only.
+    calibrator = IncrementalLogitCalibrator().fit(X, y)
+    calibrator.partial_fit(X[y == 1], y[y == 1])
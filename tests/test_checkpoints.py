@@ -0,0 +1,64 @@
+import os
+from dataclasses import replace
+
+import pytest
+from lir import LogitCalibrator, KDECalibrator
+
+from lr_face.checkpoints import CheckpointStore
+from lr_face.data import TestDataset, ForenFaceDataset
+from lr_face.experiments import Experiment
+from tests.src.util import scratch_dir
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_checkpoints')
+
+
+@pytest.fixture
+def experiment() -> Experiment:
+    return Experiment(data_config={'calibration': (TestDataset(),),
+                                   'test': (TestDataset(),)},
+                      scorer='DummyScorer',
+                      calibrator=LogitCalibrator(),
+                      params={'calibration_filters': ['yaw']})
+
+
+def test_checkpoint_round_trip(scratch):
+    store = CheckpointStore(os.path.join(scratch, 'checkpoints'))
+    assert store.load('abc') is None
+    assert 'abc' not in store
+    store.save('abc', {'cllr': 0.5, 'auc': 0.9})
+    assert 'abc' in store
+    assert store.load('abc') == {'cllr': 0.5, 'auc': 0.9}
+    assert os.listdir(store.directory) == ['abc.obj']
+
+
+def test_fingerprint_is_stable(experiment):
+    same = Experiment(data_config={'calibration': (TestDataset(),),
+                                   'test': (TestDataset(),)},
+                      scorer='DummyScorer',
+                      calibrator=LogitCalibrator(),
+                      params={'calibration_filters': ['yaw']})
+    assert experiment.fingerprint == same.fingerprint
+
+
+def test_fingerprint_depends_on_configuration(experiment):
+    others = [replace(experiment, repeat=1),
+              replace(experiment, calibrator=KDECalibrator()),
+              replace(experiment, params={'calibration_filters': []}),
+              replace(experiment, scorer='OtherScorer')]
+    fingerprints = {experiment.fingerprint,
+                    *(other.fingerprint for other in others)}
+    assert len(fingerprints) == len(others) + 1
+
+
+def test_fingerprint_depends_on_dataset_arguments(experiment):
+    fingerprints = {
+        replace(experiment, data_config={'calibration': (dataset,),
+                                         'test': (TestDataset(),)}
+                ).fingerprint
+        for dataset in [ForenFaceDataset(),
+                        ForenFaceDataset(max_num_images=10),
+                        ForenFaceDataset(max_num_images=20)]}
+    assert len(fingerprints) == 3
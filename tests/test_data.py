@@ -1,6 +1,7 @@
 import os
+from collections import Counter
 from functools import wraps
-from typing import List
+from typing import List, Tuple
 
 import cv2
 import numpy as np
@@ -13,8 +14,13 @@ from lr_face.data import (FaceImage,
                           EnfsiDataset,
                           ForenFaceDataset,
                           LfwDataset,
+                          IndexedPairs,
                           make_pairs,
+                          make_pairs_from_two_lists,
                           make_triplets,
+                          iter_pairs,
+                          iter_pairs_from_two_lists,
+                          iter_triplets,
                           to_array,
                           split_by_identity)
 from tests.conftest import skip_on_github
@@ -288,6 +294,68 @@ def test_forenface_dataset_has_correct_num_images(forenface):
     assert len(forenface.images) == 2476
 
 
+#################################
+# `make_pairs_from_two_lists()` #
+#################################
+
+@pytest.fixture
+def two_lists() -> Tuple[List[FaceImage], List[FaceImage]]:
+    ids = [1, 1, 1, 2, 2, 2, 3, 3, 4, 4, 5]
+    images = [DummyFaceImage(f'{i}.jpg', f'TEST-{idx}')
+              for i, idx in enumerate(ids)]
+    return images[:7], images[4:]
+
+
+def test_make_pairs_from_two_lists_positive_pairs(two_lists):
+    first, second = two_lists
+    pairs = make_pairs_from_two_lists(first, second)
+    positives = [(a.path, b.path) for a, b in pairs if a.identity == b.identity]
+    expected = [(a.path, b.path) for a in first for b in second
+                if a.identity == b.identity and a.path != b.path]
+    assert sorted(positives) == sorted(expected)
+
+
+def test_make_pairs_from_two_lists_negative_pairs(two_lists):
+    first, second = two_lists
+    pairs = make_pairs_from_two_lists(first, second)
+    positives = [p for p in pairs if p.same_identity]
+    negatives = [p for p in pairs if not p.same_identity]
+    assert len(negatives) == len(positives)
+    assert [p.first for p in negatives] == [p.first for p in positives]
+    assert all(p.second in second for p in negatives)
+
+
+def test_make_pairs_from_two_lists_negative_identities_are_uniform(two_lists):
+    first, second = two_lists
+    pairs = make_pairs_from_two_lists(first[4:5] * 3000, second, seed=1)
+    negative_ids = [b.identity for a, b in pairs if a.identity != b.identity]
+    # Identity `TEST-2` of the first image has 3 other identities to choose
+    # from in the second list, each of which should be chosen about equally
+    # often.
+    counts = Counter(negative_ids)
+    assert sorted(counts) == ['TEST-3', 'TEST-4', 'TEST-5']
+    assert all(abs(count / len(negative_ids) - 1 / 3) < .05
+               for count in counts.values())
+
+
+def test_make_pairs_from_two_lists_with_seed(two_lists):
+    first, second = two_lists
+    assert make_pairs_from_two_lists(first, second, seed=42) == \
+           make_pairs_from_two_lists(first, second, seed=42)
+
+
+def test_make_pairs_from_two_lists_fixed_n(two_lists):
+    first, second = two_lists
+    assert len(make_pairs_from_two_lists(first, second, n=5)) == 5
+
+
+def test_make_pairs_from_two_lists_single_identity(two_lists):
+    first, second = two_lists
+    pairs = make_pairs_from_two_lists(first[:3], first[:3])
+    assert len(pairs) == 6
+    assert all(p.same_identity for p in pairs)
+
+
 #####################
 # `make_triplets()` #
 #####################
@@ -309,6 +377,86 @@ def test_make_triplets_six_pairs_per_identity():
     assert len(triplets) == 60
 
 
+##################
+# `IndexedPairs` #
+##################
+
+def test_indexed_pairs_from_pairs(dummy_pairs):
+    indexed_pairs = IndexedPairs.from_pairs(dummy_pairs)
+    assert indexed_pairs.first.dtype == indexed_pairs.second.dtype == np.int32
+    assert len(indexed_pairs) == len(dummy_pairs)
+    assert indexed_pairs.to_pairs() == dummy_pairs
+    assert list(indexed_pairs.same_identity) == \
+           [pair.same_identity for pair in dummy_pairs]
+
+
+def test_indexed_pairs_getitem(dummy_pairs):
+    indexed_pairs = IndexedPairs.from_pairs(dummy_pairs)
+    assert indexed_pairs[3] == dummy_pairs[3]
+    positives = indexed_pairs[indexed_pairs.same_identity]
+    assert positives.images is indexed_pairs.images
+    assert positives.to_pairs() == [p for p in dummy_pairs if p.same_identity]
+    assert all(positives.same_identity)
+
+
+##################
+# `iter_pairs()` #
+##################
+
+def test_iter_pairs_chunks_have_bounded_size(dummy_images):
+    chunks = list(iter_pairs(dummy_images, same=False, chunk_size=10))
+    assert all(len(chunk) <= 10 for chunk in chunks)
+    assert sum(len(chunk) for chunk in chunks) == 94
+
+
+def test_iter_pairs_negative_only_no_n(dummy_images):
+    pairs = [p for chunk in iter_pairs(dummy_images, same=False, chunk_size=7)
+             for p in chunk]
+    expected = make_pairs(dummy_images, same=False)
+    assert not any(pair.same_identity for pair in pairs)
+    assert sorted((a.path, b.path) for a, b in pairs) == \
+           sorted((a.path, b.path) for a, b in expected)
+
+
+def test_iter_pairs_negative_only_fixed_n(dummy_images):
+    chunks = list(iter_pairs(dummy_images, same=False, n=47, chunk_size=10))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 10, 10, 7]
+    assert not any(chunk.same_identity.any() for chunk in chunks)
+
+
+def test_iter_pairs_positive_only_no_n(dummy_images):
+    pairs = [p for chunk in iter_pairs(dummy_images, same=True) for p in chunk]
+    assert pairs == make_pairs(dummy_images, same=True)
+
+
+def test_iter_pairs_positive_and_negative(dummy_images):
+    chunks = list(iter_pairs(dummy_images, same=None, chunk_size=5))
+    same_identity = np.concatenate([c.same_identity for c in chunks])
+    assert np.sum(same_identity) == np.sum(~same_identity) == 8
+
+
+def test_iter_pairs_positive_and_negative_fixed_n(dummy_images):
+    chunks = list(iter_pairs(dummy_images, same=None, n=7))
+    assert sum(len(chunk) for chunk in chunks) == 7
+
+
+def test_iter_pairs_from_two_lists(dummy_images):
+    images = [DummyFaceImage(f'{i}.jpg', x.identity)
+              for i, x in enumerate(dummy_images)]
+    first, second = images[:6], images[3:]
+    pairs = [p for chunk in iter_pairs_from_two_lists(first, second, chunk_size=3)
+             for p in chunk]
+    positives = [p for p in pairs if p.same_identity]
+    negatives = [p for p in pairs if not p.same_identity]
+    assert len(positives) == len(negatives) == 6
+    assert all(p.first in first and p.second in second for p in pairs)
+
+
+def test_iter_triplets(dummy_images):
+    chunks = list(iter_triplets(dummy_images, chunk_size=3))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 2]
+
+
 ################
 # `to_array()` #
 ################
@@ -0,0 +1,57 @@
+import numpy as np
+
+from lr_face.ecdf import EmpiricalCDF, tippett_curve, lr_distributions, \
+    MAX_LOG_LR
+
+
+def test_empirical_cdf():
+    cdf = EmpiricalCDF(np.array([3., 1., 2., 2.]))
+    assert np.allclose(cdf(np.array([0, 1, 2, 2.5, 3])),
+                       [0, .25, .75, .75, 1])
+    assert np.allclose(cdf.exceedance(np.array([2])), [.25])
+    assert np.isnan(EmpiricalCDF(np.array([]))(np.array([1.]))).all()
+
+
+def test_tippett_curve_matches_counting():
+    rng = np.random.default_rng(0)
+    log_lrs = rng.normal(size=1000)
+    y = rng.integers(0, 2, size=1000)
+    curve = tippett_curve(log_lrs, y, num=100)
+
+    x = np.linspace(np.min(log_lrs), np.max(log_lrs), 100)
+    lr_0, lr_1 = log_lrs[y == 0], log_lrs[y == 1]
+    assert np.allclose(curve.log_lrs, x)
+    assert np.allclose(curve.h2_percentages,
+                       sum(i > x for i in lr_0) / len(lr_0) * 100)
+    assert np.allclose(curve.h1_percentages,
+                       sum(i > x for i in lr_1) / len(lr_1) * 100)
+
+
+def test_lr_distributions_are_densities():
+    log_lrs = np.array([-2., -1., -1., 0., 1., 2., 2., 3.])
+    y = np.array([0, 0, 0, 0, 1, 1, 1, 1])
+    distributions = lr_distributions(log_lrs, y, bins=4)
+    for histogram in [distributions.h1, distributions.h2]:
+        assert len(histogram.edges) == 5
+        assert np.isclose(np.sum(histogram.densities
+                                 * np.diff(histogram.edges)), 1)
+    assert distributions.h1.edges[0] == 1
+    assert distributions.h2.edges[-1] == 0
+
+
+def test_curves_of_lrs_of_zero_and_infinity():
+    with np.errstate(divide='ignore'):
+        log_lrs = np.log10(np.array([0., .1, 1., 10., np.inf, np.nan]))
+    y = np.array([0, 0, 0, 1, 1, 1])
+    curve = tippett_curve(log_lrs, y, num=10)
+    assert np.isfinite(curve.log_lrs).all()
+    assert curve.log_lrs[0] == -MAX_LOG_LR
+    assert curve.log_lrs[-1] == MAX_LOG_LR
+    # The LR of 0 is the smallest of H2, the infinite LR the largest of H1.
+    assert np.isclose(curve.h2_percentages[0], 200 / 3)
+    assert curve.h1_percentages[-1] == 0
+    distributions = lr_distributions(log_lrs, y, bins=4)
+    assert distributions.h2.edges[0] == -MAX_LOG_LR
+    assert distributions.h1.edges[-1] == MAX_LOG_LR
+    assert np.isclose(np.sum(distributions.h1.densities
+                             * np.diff(distributions.h1.edges)), 1)
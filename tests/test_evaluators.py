@@ -0,0 +1,192 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from lir import CalibratedScorer, KDECalibrator, LogitCalibrator
+
+from lr_face.data import DummyFaceImage, FacePair, Yaw, Pitch
+from lr_face.evaluators import (evaluate,
+                                calculate_metrics_dict,
+                                make_pair_table,
+                                plot_lr_distributions,
+                                plot_performance_as_function_of_resolution,
+                                plot_performance_as_function_of_yaw,
+                                plot_tippett)
+from lr_face.plotting import PlotSink
+from lr_face.utils import get_valid_scores
+from tests.src.util import scratch_dir
+
+
+class RecordingPlotSink(PlotSink):
+    """
+    Keeps the arguments of the submitted plots instead of rendering them.
+    """
+
+    def __init__(self):
+        self.plots = {}
+
+    def submit(self, plot_function: str, savefig: str, **kwargs):
+        self.plots.setdefault(plot_function, []).append(kwargs)
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_evaluators')
+
+
+@pytest.fixture
+def categories():
+    """
+    Returns the test pairs, test scores (some of which are invalid) and LR
+    systems per category, plus a category without an LR system.
+    """
+    rng = np.random.default_rng(0)
+    images = [DummyFaceImage(f'image_{i}.jpg', f'ID-{i % 4}')
+              for i in range(16)]
+    all_pairs = [FacePair(images[i], images[j])
+                 for i in range(16) for j in range(i + 1, 16)]
+    test_pairs, test_scores, lr_systems = {}, {}, {}
+    for i, calibrator in enumerate([KDECalibrator(), LogitCalibrator(),
+                                    KDECalibrator()]):
+        category = ((f'category_{i}',),)
+        test_pairs[category] = all_pairs[30 * i:30 * (i + 1)]
+        scores = rng.random(30)
+        scores[rng.random(30) < .2] = -1
+        test_scores[category] = np.stack([1 - scores, scores], axis=1)
+        calibration_scores = rng.random(100)
+        calibrator.fit(calibration_scores,
+                       (calibration_scores > .5).astype(int))
+        lr_systems[category] = CalibratedScorer('DummyScorer', calibrator)
+    test_pairs[(('uncalibrated',),)] = all_pairs[90:100]
+    return test_pairs, test_scores, lr_systems
+
+
+def evaluate_per_category(lr_systems, test_pairs_per_category,
+                          test_scores_per_category):
+    """
+    The loop that `evaluate()` used to run, which appended the valid scores
+    and LRs of each category in turn.
+    """
+    number_of_scores = 0
+    scores = np.array([])
+    lr_predicted = np.array([])
+    y_test = []
+    for category, pairs in test_pairs_per_category.items():
+        if category not in lr_systems:
+            continue
+        category_scores = test_scores_per_category[category]
+        category_scores_valid, pairs_valid = get_valid_scores(
+            category_scores[:, 1], pairs)
+        scores = np.append(scores, category_scores_valid)
+        number_of_scores += len(category_scores)
+        lr_predicted = np.append(
+            lr_predicted,
+            lr_systems[category].calibrator.transform(category_scores_valid))
+        y_test += [int(pair.same_identity) for pair in pairs_valid]
+    lr_predicted = np.nan_to_num(lr_predicted, posinf=10e5)
+    return number_of_scores, scores, np.array(y_test), lr_predicted
+
+
+def test_evaluate_matches_per_category_loop(categories, scratch):
+    test_pairs, test_scores, lr_systems = categories
+    cal_fraction_valid = {category: 1. for category in lr_systems}
+    plot_sink = RecordingPlotSink()
+    results = evaluate(None,
+                       lr_systems,
+                       test_pairs,
+                       os.path.join(scratch, 'experiment'),
+                       cal_fraction_valid,
+                       test_scores,
+                       plot_sink=plot_sink)
+
+    number_of_scores, scores, y_test, lr_predicted = evaluate_per_category(
+        lr_systems, test_pairs, test_scores)
+    pair_table = plot_sink.plots['plot_tippett'][0]['pairs']
+    assert np.array_equal(pair_table['score'], scores)
+    assert np.array_equal(pair_table['y'], y_test)
+    assert np.array_equal(pair_table['lr'], lr_predicted)
+    assert results == calculate_metrics_dict(number_of_scores,
+                                             scores,
+                                             y_test,
+                                             lr_predicted,
+                                             cal_fraction_valid,
+                                             label='')
+    # The table that is saved with the plots is the same too.
+    saved_table = pd.read_csv(os.path.join(scratch, 'experiment pairs.csv'))
+    assert np.allclose(saved_table['lr'], lr_predicted)
+
+
+@pytest.fixture
+def pair_table() -> pd.DataFrame:
+    first = DummyFaceImage('first.jpg', 'A', yaw=Yaw.FRONTAL,
+                           pitch=Pitch.HALF_UP)
+    second = DummyFaceImage('second.jpg', 'A', yaw=Yaw.PROFILE)
+    third = DummyFaceImage('third.jpg', 'B', yaw=Yaw.HALF_TURNED,
+                           pitch=Pitch.FRONTAL)
+    pairs = [FacePair(first, second),
+             FacePair(first, third),
+             FacePair(second, third)]
+    return make_pair_table(pairs,
+                           [1, 0, 0],
+                           np.array([.9, .2, .4]),
+                           np.array([100., .1, 1.]),
+                           [(('a',),), (('b',),), (('b',),)])
+
+
+def test_make_pair_table(pair_table):
+    assert list(pair_table.columns) == [
+        'pair_id', 'first_path', 'second_path', 'category', 'y', 'score',
+        'lr', 'log_lr', 'yaw_first', 'yaw_second', 'pitch_first',
+        'pitch_second', 'pixels_first', 'pixels_second']
+    assert list(pair_table['pair_id']) == [0, 1, 2]
+    assert list(pair_table['first_path']) == \
+           ['first.jpg', 'first.jpg', 'second.jpg']
+    assert list(pair_table['second_path']) == \
+           ['second.jpg', 'third.jpg', 'third.jpg']
+    assert list(pair_table['category']) == \
+           [str((('a',),)), str((('b',),)), str((('b',),))]
+    assert list(pair_table['y']) == [1, 0, 0]
+    assert list(pair_table['score']) == [.9, .2, .4]
+    assert list(pair_table['lr']) == [100., .1, 1.]
+    assert np.allclose(pair_table['log_lr'], [2, -1, 0])
+    # Annotations are stored by their value, and are missing if the image
+    # is not annotated.
+    assert list(pair_table['yaw_first']) == \
+           ['straight', 'straight', 'sideways']
+    assert list(pair_table['yaw_second']) == \
+           ['sideways', 'slightly_turned', 'slightly_turned']
+    assert list(pair_table['pitch_first'][:2]) == \
+           ['slightly_upwards', 'slightly_upwards']
+    assert pd.isna(pair_table['pitch_first'][2])
+    assert pd.isna(pair_table['pitch_second'][0])
+    assert list(pair_table['pitch_second'][1:]) == ['straight', 'straight']
+    # Dummy images are 100 x 100 pixels.
+    assert list(pair_table['pixels_first']) == [10000] * 3
+    assert list(pair_table['pixels_second']) == [10000] * 3
+
+
+def test_make_pair_table_without_pairs():
+    pair_table = make_pair_table([], [], np.array([]), np.array([]), [])
+    assert len(pair_table) == 0
+    assert 'log_lr' in pair_table.columns
+
+
+@pytest.mark.parametrize('plot', [plot_lr_distributions,
+                                  plot_performance_as_function_of_resolution,
+                                  plot_performance_as_function_of_yaw,
+                                  plot_tippett])
+def test_plots_of_pair_table(plot, pair_table, scratch):
+    savefig = os.path.join(scratch, f'{plot.__name__}.png')
+    plot(pair_table, savefig=savefig)
+    assert os.path.getsize(savefig) > 0
+
+
+@pytest.mark.parametrize('plot', [plot_lr_distributions, plot_tippett])
+def test_plots_of_lrs_of_zero(plot, pair_table, scratch):
+    pair_table['lr'] = [100., 0., 1.]
+    with np.errstate(divide='ignore'):
+        pair_table['log_lr'] = np.log10(pair_table['lr'])
+    savefig = os.path.join(scratch, f'{plot.__name__}.png')
+    plot(pair_table, savefig=savefig)
+    assert os.path.getsize(savefig) > 0
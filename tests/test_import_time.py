@@ -0,0 +1,55 @@
+import subprocess
+import sys
+from typing import Dict
+
+import pytest
+
+from tests.src.util import get_project_path
+
+# The maximum number of seconds importing a module may take. Importing these
+# modules should not load any models, read any datasets or initialise any
+# devices, so the budget is mostly spent on importing numpy, sklearn etc.
+IMPORT_TIME_BUDGET = 5.
+
+# Modules that are expensive to import and should only be imported once they
+# are actually needed.
+HEAVY_MODULES = ['tensorflow', 'face_recognition', 'dlib']
+
+
+def import_times(module: str) -> Dict[str, float]:
+    """
+    Imports `module` in a fresh interpreter with `python -X importtime` and
+    returns the cumulative import time in seconds of every module that was
+    imported along the way.
+
+    :param module: str
+    :return: Dict[str, float]
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=get_project_path(''),
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 10 ** 6
+    return times
+
+
+@pytest.mark.parametrize('module', ['params', 'lr_face.experiments'])
+def test_import_time_within_budget(module):
+    times = import_times(module)
+    assert times[module] < IMPORT_TIME_BUDGET
+
+
+@pytest.mark.parametrize('module', ['params', 'lr_face.experiments'])
+def test_import_does_not_load_heavy_modules(module):
+    times = import_times(module)
+    for heavy_module in HEAVY_MODULES:
+        assert heavy_module not in times
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from sklearn.metrics import roc_auc_score, accuracy_score
+
+from lr_face import intervals
+from lr_face.intervals import confidence_intervals, replicate_metrics, \
+    resample_counts
+
+
+@pytest.fixture
+def test_data():
+    rng = np.random.default_rng(0)
+    y = (rng.random(200) < .4).astype(int)
+    # Rounded, so that some scores are tied.
+    scores = np.round(np.clip(rng.normal(.4 + .3 * y, .2), 0, 1), 2)
+    lrs = np.exp(rng.normal(2 * y - 1, 1))
+    return scores, lrs, y
+
+
+def test_resample_counts():
+    counts = resample_counts(5, 10, np.random.default_rng(0))
+    assert counts.shape == (5, 10)
+    assert np.all(counts.sum(axis=1) == 10)
+
+
+def test_replicate_metrics_match_metrics_of_resampled_pairs(test_data):
+    scores, lrs, y = test_data
+    rng = np.random.default_rng(1)
+    h1, h2 = np.flatnonzero(y == 1), np.flatnonzero(y == 0)
+    counts_h1 = resample_counts(3, len(h1), rng)
+    counts_h2 = resample_counts(3, len(h2), rng)
+    metrics = replicate_metrics(scores, lrs, y, counts_h1, counts_h2)
+    for i in range(3):
+        resampled = np.concatenate([np.repeat(h1, counts_h1[i]),
+                                    np.repeat(h2, counts_h2[i])])
+        s, lr, label = scores[resampled], lrs[resampled], y[resampled]
+        cllr = (np.mean(np.log2(1 + 1 / lr[label == 1]))
+                + np.mean(np.log2(1 + lr[label == 0]))) / 2
+        assert np.isclose(metrics['cllr'][i], cllr)
+        assert np.isclose(metrics['auc'][i], roc_auc_score(label, s))
+        assert np.isclose(metrics['accuracy'][i],
+                          accuracy_score(label, s > .5))
+
+
+def test_confidence_intervals_do_not_depend_on_jobs(test_data, monkeypatch):
+    # Several blocks of replicates.
+    monkeypatch.setattr(intervals, 'MAX_BLOCK_SIZE', 200 * 30)
+    serial = confidence_intervals(*test_data, num_replicates=100)
+    parallel = confidence_intervals(*test_data, num_replicates=100, n_jobs=2)
+    assert serial == parallel
+    for metric in intervals.INTERVAL_METRICS:
+        assert serial[f'{metric}_ci_low'] <= serial[f'{metric}_ci_high']
+
+
+def test_confidence_intervals_of_one_class_are_nan(test_data):
+    scores, lrs, y = test_data
+    result = confidence_intervals(scores, lrs, np.ones_like(y), 10)
+    assert len(result) == 2 * len(intervals.INTERVAL_METRICS)
+    assert all(np.isnan(value) for value in result.values())
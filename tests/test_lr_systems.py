@@ -0,0 +1,109 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from lir import LogitCalibrator, KDECalibrator
+
+from lr_face.calibrators import IncrementalLogitCalibrator
+from lr_face.lr_systems import fit_calibrator, fit_calibrators, \
+    get_calibrator_key, save_lr_system, load_lr_system, update_lr_system
+from lr_face.profiling import profile
+from lr_face.stages import ArtifactStore
+from lr_face.versioning import Tag
+from tests.src.util import scratch_dir
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_lr_systems')
+
+
+@pytest.fixture
+def calibration_data():
+    X = np.linspace(0, 1, 20)
+    y = (X > .4).astype(int)
+    return X, y
+
+
+def test_get_calibrator_key(calibration_data):
+    X, y = calibration_data
+    key = get_calibrator_key(LogitCalibrator(), ('a',), X, y)
+    assert key == get_calibrator_key(LogitCalibrator(), ('a',), X.copy(), y)
+    assert key != get_calibrator_key(LogitCalibrator(), ('b',), X, y)
+    assert key != get_calibrator_key(KDECalibrator(), ('a',), X, y)
+    assert key != get_calibrator_key(LogitCalibrator(), ('a',), X, 1 - y)
+    # The same values, but of another type.
+    assert key != get_calibrator_key(LogitCalibrator(), ('a',),
+                                     X.astype(np.float32), y)
+
+
+def test_fit_calibrator_restores_fitted_calibrator(scratch, calibration_data):
+    store = ArtifactStore(scratch)
+    calibrator = LogitCalibrator()
+    fitted = fit_calibrator(calibrator, ('a',), *calibration_data, store)
+    # The calibrator itself is left untouched.
+    assert not hasattr(calibrator, '_logit')
+    assert len(os.listdir(os.path.join(scratch, 'fitted_calibrators'))) == 1
+    restored = fit_calibrator(calibrator, ('a',), *calibration_data, store)
+    assert restored is not fitted
+    X = np.array([.2, .5, .8])
+    assert np.allclose(restored.transform(X), fitted.transform(X))
+
+
+def test_fit_calibrators_does_not_depend_on_jobs(calibration_data):
+    X, y = calibration_data
+    data = {(str(i),): (X + i / 10, y) for i in range(8)}
+    with profile() as profiler:
+        serial = fit_calibrators(KDECalibrator(), data)
+    parallel = fit_calibrators(KDECalibrator(), data, n_jobs=4)
+    assert list(serial) == list(parallel) == list(data)
+    for category, calibrator in serial.items():
+        assert np.array_equal(calibrator.transform(X),
+                              parallel[category].transform(X))
+    assert all(profiler.stats[f'calibration.fit {category}'].calls == 1
+               for category in data)
+
+
+def test_save_and_load_lr_system(scratch, calibration_data):
+    scorer = SimpleNamespace(
+        embedding_model=SimpleNamespace(name='facenet', tag=Tag('tag', 1)))
+    calibrators = {('a',): fit_calibrator(LogitCalibrator(), ('a',),
+                                          *calibration_data)}
+    path = os.path.join(scratch, 'lr_systems', '0.obj')
+    save_lr_system(path, scorer, calibrators)
+    lr_systems = load_lr_system(path, scorer)
+    assert list(lr_systems) == [('a',)]
+    assert lr_systems[('a',)].scorer is scorer
+    X = np.array([.2, .5, .8])
+    assert np.allclose(lr_systems[('a',)].calibrator.transform(X),
+                       calibrators[('a',)].transform(X))
+
+
+def test_update_lr_system(scratch, calibration_data):
+    X, y = calibration_data
+    scorer = SimpleNamespace(
+        embedding_model=SimpleNamespace(name='facenet', tag=None))
+    category = (('a',), ('b',))
+    path = os.path.join(scratch, 'lr_systems', '0.obj')
+    save_lr_system(path, scorer, {
+        category: IncrementalLogitCalibrator().fit(X[::2], y[::2])})
+    output_path = os.path.join(scratch, 'lr_systems', '1.obj')
+    update_lr_system(path, {str(category): (X[1::2], y[1::2])}, output_path)
+    updated = load_lr_system(output_path, scorer)[category].calibrator
+    expected = IncrementalLogitCalibrator().fit(X, y)
+    scores = np.array([.2, .5, .8])
+    assert np.allclose(updated.transform(scores), expected.transform(scores))
+
+
+def test_update_lr_system_needs_incremental_calibrators(scratch,
+                                                         calibration_data):
+    scorer = SimpleNamespace(
+        embedding_model=SimpleNamespace(name='facenet', tag=None))
+    path = os.path.join(scratch, 'lr_systems', '0.obj')
+    save_lr_system(path, scorer, {('a',): fit_calibrator(
+        LogitCalibrator(), ('a',), *calibration_data)})
+    with pytest.raises(ValueError):
+        update_lr_system(path, {str(('a',)): calibration_data})
+    with pytest.raises(ValueError):
+        update_lr_system(path, {str(('b',)): calibration_data})
@@ -0,0 +1,107 @@
+import os
+from typing import List
+
+import numpy as np
+import pytest
+
+from lr_face.data import DummyFaceImage, FaceImage, FacePair, make_pairs
+from lr_face.pair_lists import (PairList,
+                                load_pair_list,
+                                convert_text_pair_list,
+                                get_pair_list_path,
+                                is_converted)
+from tests.src.util import scratch_dir
+
+
+@pytest.fixture
+def dummy_images() -> List[FaceImage]:
+    ids = [1, 1, 1, 2, 2, 2, 3, 3, 4, 4, 5]
+    return [DummyFaceImage(path=f'{i}.jpg', identity=f'TEST-{idx}')
+            for i, idx in enumerate(ids)]
+
+
+@pytest.fixture
+def dummy_pairs(dummy_images) -> List[FacePair]:
+    return make_pairs(dummy_images)
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_pair_lists')
+
+
+def as_paths(pairs):
+    return [(first.path, second.path) for first, second in pairs]
+
+
+def test_save_and_load_pair_list(dummy_images, dummy_pairs, scratch):
+    path = os.path.join(scratch, 'pairs.pairs')
+    PairList.from_pairs(dummy_pairs).save(path)
+    pair_list = load_pair_list(path)
+    assert isinstance(pair_list.first, np.memmap)
+    assert len(pair_list) == len(dummy_pairs)
+    assert list(pair_list.same_identity) == \
+           [pair.same_identity for pair in dummy_pairs]
+
+    images_by_path = {image.path: image for image in dummy_images}
+    pairs = pair_list.to_indexed_pairs(images_by_path)
+    assert as_paths(pairs) == as_paths(dummy_pairs)
+
+
+def test_empty_pair_list(scratch):
+    path = os.path.join(scratch, 'empty.pairs')
+    PairList.from_pairs([]).save(path)
+    assert len(load_pair_list(path)) == 0
+
+
+def test_pair_list_is_loaded_once(dummy_pairs, scratch):
+    path = os.path.join(scratch, 'pairs.pairs')
+    PairList.from_pairs(dummy_pairs).save(path)
+    assert load_pair_list(path) is load_pair_list(path)
+
+    # Once the file is modified it should be loaded again.
+    PairList.from_pairs(dummy_pairs[:3]).save(path)
+    os.utime(path, (0, 0))
+    assert len(load_pair_list(path)) == 3
+
+
+def test_pairs_with_unknown_images_are_left_out(dummy_images,
+                                                dummy_pairs,
+                                                scratch):
+    path = os.path.join(scratch, 'pairs.pairs')
+    PairList.from_pairs(dummy_pairs).save(path)
+    images_by_path = {image.path: image for image in dummy_images[1:]}
+    pairs = load_pair_list(path).to_indexed_pairs(images_by_path)
+    assert as_paths(pairs) == [pair for pair in as_paths(dummy_pairs)
+                               if dummy_images[0].path not in pair]
+
+
+def test_convert_text_pair_list(dummy_images, dummy_pairs, scratch):
+    text_path = os.path.join(scratch, 'cal_pairs_[].txt')
+    with open(text_path, 'w') as f:
+        for pair in dummy_pairs:
+            f.write(pair.first.path + ';' + pair.second.path + '\n')
+
+    images_by_path = {image.path: image for image in dummy_images}
+    path = convert_text_pair_list(text_path, images_by_path)
+    assert path == get_pair_list_path(text_path)
+    pairs = load_pair_list(path).to_indexed_pairs(images_by_path)
+    assert as_paths(pairs) == as_paths(dummy_pairs)
+    assert list(pairs.same_identity) == \
+           [pair.same_identity for pair in dummy_pairs]
+
+
+def test_is_converted(dummy_images, dummy_pairs, scratch):
+    text_path = os.path.join(scratch, 'cal_pairs_[].txt')
+    with open(text_path, 'w') as f:
+        for pair in dummy_pairs:
+            f.write(pair.first.path + ';' + pair.second.path + '\n')
+    assert not is_converted(text_path)
+    convert_text_pair_list(text_path,
+                           {image.path: image for image in dummy_images})
+    assert is_converted(text_path)
+
+    # Editing the text file makes the binary pair list stale.
+    mtime = os.path.getmtime(get_pair_list_path(text_path))
+    os.utime(text_path, (mtime + 1, mtime + 1))
+    assert not is_converted(text_path)
@@ -0,0 +1,70 @@
+import os
+from typing import Tuple
+
+from lr_face.parallel import make_chunks, run_grouped, TaskFailure
+
+
+def square(task: int) -> int:
+    if task < 0:
+        raise ValueError(f'Negative task: {task}')
+    return task ** 2
+
+
+def get_pid(task: str) -> Tuple[str, int]:
+    return task, os.getpid()
+
+
+def exit_on_zero(task: int) -> int:
+    if task == 0:
+        os._exit(1)
+    return task
+
+
+def test_make_chunks_only_contains_a_single_group():
+    groups = ['a', 'b', 'a', 'c', 'b', 'a']
+    chunks = make_chunks(groups, n_jobs=3)
+    assert sorted(i for chunk in chunks for i in chunk) == list(range(6))
+    assert chunks == [[0, 2, 5], [1, 4], [3]]
+
+
+def test_make_chunks_splits_groups_to_fill_jobs():
+    chunks = make_chunks(['a'] * 5, n_jobs=2)
+    assert chunks == [[0, 1, 2], [3, 4]]
+
+
+def test_run_grouped_keeps_order():
+    tasks = list(range(10))
+    groups = [task % 3 for task in tasks]
+    assert run_grouped(square, tasks, groups, n_jobs=3) == \
+           [task ** 2 for task in tasks]
+
+
+def test_run_grouped_runs_groups_in_a_single_worker():
+    tasks = ['a', 'b', 'a', 'b', 'a']
+    results = run_grouped(get_pid, tasks, tasks, n_jobs=2)
+    assert len({pid for task, pid in results if task == 'a'}) == 1
+    assert len({pid for task, pid in results if task == 'b'}) == 1
+
+
+def test_run_grouped_reports_failures_per_task():
+    tasks = [1, -2, 3]
+    results = run_grouped(square, tasks, [0, 0, 0], n_jobs=1)
+    assert results[0] == 1 and results[2] == 9
+    assert isinstance(results[1], TaskFailure)
+    assert results[1].index == 1
+    assert 'Negative task: -2' in str(results[1])
+
+
+def test_run_grouped_reports_crashed_workers():
+    results = run_grouped(exit_on_zero, [0, 1], ['crash', 'crash'], n_jobs=1)
+    assert all(isinstance(result, TaskFailure) for result in results)
+
+
+def test_run_grouped_calls_callback_per_task():
+    tasks = [1, -1, 2]
+    received = {}
+    run_grouped(square, tasks, ['a'] * 3, n_jobs=2,
+                callback=lambda i, result: received.setdefault(i, result))
+    assert received[0] == 1
+    assert isinstance(received[1], TaskFailure)
+    assert received[2] == 4
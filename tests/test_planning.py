@@ -0,0 +1,78 @@
+import os
+from typing import List
+
+import pytest
+
+import params
+from lr_face.data import Dataset, DummyFaceImage, FaceImage, FacePair
+from lr_face.models import get_embedding_path
+from lr_face.planning import make_plan, format_plan, record_throughput, \
+    load_throughput
+from lr_face.profiling import profile, span
+from tests.src.util import scratch_dir
+
+
+class PlanDataset(Dataset):
+    @property
+    def images(self) -> List[FaceImage]:
+        return [DummyFaceImage(path=f'plan_{i}', identity=f'TEST-{i % 3}')
+                for i in range(9)]
+
+    @property
+    def pairs(self) -> List[FacePair]:
+        images = self.images
+        return [FacePair(images[0], images[3]), FacePair(images[0], images[1])]
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_planning')
+
+
+@pytest.fixture()
+def data_config(monkeypatch) -> str:
+    monkeypatch.setitem(params.DATA['all'], 'plan', {
+        'calibration': (PlanDataset(),),
+        'test': (PlanDataset(),)})
+    return 'plan'
+
+
+def test_make_plan_counts_pairs_and_cached_embeddings(scratch, data_config):
+    images = PlanDataset().images
+    path = get_embedding_path('Dummy', images[0], scratch)
+    os.makedirs(os.path.dirname(path))
+    open(path, 'w').close()
+
+    pair_counts, (plan,) = make_plan(
+        ['dummy'], ['logit', 'KDE'], [data_config], ['scenario_1'],
+        num_repeats=2,
+        pairs_from_file=False,
+        throughput_file=os.path.join(scratch, 'throughput.json'),
+        embeddings_dir=scratch)
+    assert pair_counts[0].test == {((), ()): 2}
+    assert sum(pair_counts[0].calibration.values()) > 0
+    assert plan.num_experiments == 4
+    assert plan.num_images == 9
+    assert plan.num_cached == 1
+    # Nothing has been measured yet.
+    assert plan.seconds is None
+    assert 'Estimated total: ?' in format_plan(pair_counts, [plan])
+
+
+def test_estimate_uses_recorded_throughput(scratch, data_config):
+    throughput_file = os.path.join(scratch, 'throughput.json')
+    with profile() as profiler, span('experiment'):
+        for name in ['embed.decode', 'embed.inference', 'embed.load']:
+            with span(name):
+                pass
+    record_throughput({0: profiler}, {0: 'Dummy'}, throughput_file)
+    record_throughput({0: profiler}, {0: 'Dummy'}, throughput_file)
+    throughput = load_throughput(throughput_file)
+    assert throughput['overhead']['calls'] == 2
+    assert throughput['architectures']['Dummy']['embed.load']['calls'] == 2
+
+    _, (plan,) = make_plan(['dummy'], ['logit'], [data_config],
+                           ['scenario_1'], 1, False,
+                           throughput_file=throughput_file,
+                           embeddings_dir=scratch)
+    assert plan.seconds is not None
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from lr_face.plotting import PlotSink, BackgroundPlotSink
+from tests.src.util import scratch_dir
+
+
+def write_plot(text: str, savefig: str):
+    with open(savefig, 'w') as f:
+        f.write(text)
+
+
+def write_values(values: list, savefig: str):
+    with open(savefig, 'w') as f:
+        f.write(','.join(map(str, values)))
+
+
+def fail_plot(savefig: str):
+    raise ValueError(f'Cannot plot {os.path.basename(savefig)}')
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_plotting')
+
+
+def test_plot_sink_renders_immediately(scratch):
+    savefig = os.path.join(scratch, 'plot.txt')
+    PlotSink().submit('tests.test_plotting.write_plot', savefig, text='x')
+    assert os.path.exists(savefig)
+
+
+def test_background_plot_sink_renders_all_plots(scratch):
+    paths = [os.path.join(scratch, f'plot_{i}.txt') for i in range(5)]
+    with BackgroundPlotSink(n_jobs=2) as sink:
+        for i, path in enumerate(paths):
+            sink.submit('tests.test_plotting.write_plot', path, text=str(i))
+    for i, path in enumerate(paths):
+        with open(path) as f:
+            assert f.read() == str(i)
+
+
+def test_background_plot_sink_reports_failures(scratch, capsys):
+    savefig = os.path.join(scratch, 'plot.txt')
+    with BackgroundPlotSink(n_jobs=1) as sink:
+        sink.submit('tests.test_plotting.fail_plot', savefig)
+        sink.submit('tests.test_plotting.write_plot', savefig, text='x')
+    assert 'Cannot plot plot.txt' in capsys.readouterr().out
+    assert os.path.exists(savefig)
+
+
+def test_on_rendered_waits_for_successful_plots(scratch):
+    rendered = []
+    with BackgroundPlotSink(n_jobs=1) as sink:
+        sink.submit('tests.test_plotting.write_plot',
+                    os.path.join(scratch, 'first.txt'), text='x')
+        sink.on_rendered(lambda: rendered.append('first'))
+        sink.submit('tests.test_plotting.fail_plot',
+                    os.path.join(scratch, 'second.txt'))
+        sink.on_rendered(lambda: rendered.append('second'))
+        assert rendered == []
+    assert rendered == ['first']
+
+
+def test_background_plot_sink_renders_data_as_submitted(scratch):
+    paths = [os.path.join(scratch, f'plot_{i}.txt') for i in range(20)]
+    values = []
+    with BackgroundPlotSink(n_jobs=2) as sink:
+        for i, path in enumerate(paths):
+            values.append(i)
+            sink.submit('tests.test_plotting.write_values', path,
+                        values=values)
+        values.clear()
+    for i, path in enumerate(paths):
+        with open(path) as f:
+            assert f.read() == ','.join(map(str, range(i + 1)))
@@ -0,0 +1,57 @@
+import json
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from lr_face.profiling import profile, span, write_profiles, write_trace
+from tests.src.util import scratch_dir
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_profiling')
+
+
+def test_span_without_profiler_does_nothing():
+    with span('stage'):
+        pass
+
+
+def test_profile_records_nested_spans():
+    with profile() as profiler:
+        with span('outer'):
+            for _ in range(3):
+                with span('inner'):
+                    time.sleep(.01)
+    assert profiler.stats['inner'].calls == 3
+    assert profiler.stats['outer'].calls == 1
+    assert profiler.stats['outer'].seconds >= \
+           profiler.stats['inner'].seconds >= .03
+    assert profiler.events == []
+
+    # Spans outside the context are no longer recorded.
+    with span('outer'):
+        pass
+    assert profiler.stats['outer'].calls == 1
+
+
+def test_write_profiles_and_trace(scratch):
+    profilers = {}
+    for i in range(2):
+        with profile(trace=True, experiment=i) as profilers[i]:
+            with span('scores'):
+                pass
+    profile_path = os.path.join(scratch, 'profile.csv')
+    write_profiles(profilers, profile_path)
+    df = pd.read_csv(profile_path)
+    assert list(df['index']) == [0, 1]
+    assert list(df['span']) == ['scores', 'scores']
+
+    trace_path = os.path.join(scratch, 'trace.json')
+    write_trace(profilers.values(), trace_path)
+    with open(trace_path) as f:
+        events = json.load(f)['traceEvents']
+    assert [event['args']['experiment'] for event in events] == [0, 1]
+    assert all(event['ph'] == 'X' for event in events)
@@ -0,0 +1,160 @@
+import os
+from itertools import count
+from typing import List
+
+import numpy as np
+import pytest
+
+from lr_face.data import DummyFaceImage, FaceImage, FacePair
+from lr_face.models import EmbeddingModel, ScorerModel
+from lr_face.quality import QualityScorer, get_benchmark_id
+from tests.src.util import scratch_dir
+
+
+class FlattenModel:
+    """
+    A minimal stand-in for a Keras model that uses the flattened pixels of an
+    image as its embedding and counts how many images it has embedded.
+    """
+
+    def __init__(self):
+        self.num_predictions = 0
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        self.num_predictions += len(x)
+        return x.reshape(len(x), -1)
+
+
+class FacelessEmbeddingModel(EmbeddingModel):
+    """
+    An `EmbeddingModel` that finds no face in images whose path starts with
+    'faceless'.
+    """
+
+    def embed(self, image: FaceImage, cache_dir=None):
+        if image.path.startswith('faceless'):
+            return None
+        return super().embed(image, cache_dir)
+
+
+MODEL_IDS = count()
+
+
+@pytest.fixture
+def embedding_model() -> EmbeddingModel:
+    # `EmbeddingModel.embed()` is cached by model name, so each test gets a
+    # model with a unique name to make sure nothing is shared between tests.
+    return EmbeddingModel(FlattenModel(),
+                          tag=None,
+                          resolution=(4, 4),
+                          model_dir='',
+                          name=f'flatten_{next(MODEL_IDS)}')
+
+
+@pytest.fixture
+def benchmark_images() -> List[FaceImage]:
+    return [DummyFaceImage(path=f'benchmark_{i}', identity=f'BENCHMARK-{i}')
+            for i in range(20)]
+
+
+@pytest.fixture
+def query_images() -> List[FaceImage]:
+    return [DummyFaceImage(path=f'query_{i}', identity=f'QUERY-{i}')
+            for i in range(5)]
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_quality')
+
+
+def test_quality_scores_match_pairwise_scores(embedding_model,
+                                              benchmark_images,
+                                              query_images,
+                                              scratch,
+                                              monkeypatch):
+    # `ScorerModel` caches embeddings in the working directory.
+    monkeypatch.chdir(scratch)
+    quality_scorer = QualityScorer(embedding_model,
+                                   benchmark_images,
+                                   cache_dir=scratch,
+                                   embeddings_dir=None)
+    quality_scores = quality_scorer.score(query_images)
+
+    scorer = ScorerModel(embedding_model)
+    for image, quality_score in zip(query_images, quality_scores):
+        scores = scorer.predict_proba(
+            [FacePair(image, benchmark) for benchmark in benchmark_images])
+        expected = np.ceil(
+            10 * np.mean(sorted(scores[:, 1], reverse=True)[:10]))
+        assert quality_score == expected
+
+
+def test_benchmark_images_are_embedded_once(embedding_model,
+                                            benchmark_images,
+                                            query_images,
+                                            scratch):
+    quality_scorer = QualityScorer(embedding_model,
+                                   benchmark_images,
+                                   cache_dir=scratch,
+                                   embeddings_dir=None)
+    quality_scorer.score(query_images[:2])
+    quality_scorer.score(query_images[2:])
+    assert embedding_model.model.num_predictions == \
+        len(benchmark_images) + len(query_images)
+
+
+def test_quality_scores_are_persisted(embedding_model,
+                                      benchmark_images,
+                                      query_images,
+                                      scratch):
+    quality_scores = QualityScorer(embedding_model,
+                                   benchmark_images,
+                                   cache_dir=scratch,
+                                   embeddings_dir=None).score(query_images)
+    num_predictions = embedding_model.model.num_predictions
+
+    # A new instance should load the scores from disk instead of embedding
+    # any of the images again.
+    reloaded = QualityScorer(embedding_model,
+                             benchmark_images,
+                             cache_dir=scratch,
+                             embeddings_dir=None).score(query_images)
+    assert np.all(quality_scores == reloaded)
+    assert embedding_model.model.num_predictions == num_predictions
+
+
+def test_quality_scores_without_face_match_pairwise_scores(benchmark_images,
+                                                           scratch,
+                                                           monkeypatch):
+    monkeypatch.chdir(scratch)
+    embedding_model = FacelessEmbeddingModel(FlattenModel(),
+                                             tag=None,
+                                             resolution=(4, 4),
+                                             model_dir='',
+                                             name=f'flatten_{next(MODEL_IDS)}')
+    image = DummyFaceImage(path='faceless_query', identity='QUERY-0')
+    quality_score = QualityScorer(embedding_model,
+                                  benchmark_images,
+                                  cache_dir=None,
+                                  embeddings_dir=None).score([image])[0]
+    scores = ScorerModel(embedding_model).predict_proba(
+        [FacePair(image, benchmark) for benchmark in benchmark_images])
+    assert quality_score == np.ceil(10 * np.mean(scores[:10, 1])) == 20
+
+
+def test_benchmark_id_depends_on_paths_and_content(scratch):
+    paths = [os.path.join(scratch, name) for name in ['a', 'b', 'ab']]
+    for path in paths:
+        with open(path, 'w') as f:
+            f.write('image')
+    images = [DummyFaceImage(path=path, identity='BENCHMARK')
+              for path in paths]
+    benchmark_id = get_benchmark_id(images[:2])
+    # Paths are not simply concatenated.
+    assert benchmark_id != get_benchmark_id(
+        [DummyFaceImage(path=paths[0][:-1], identity='BENCHMARK'),
+         DummyFaceImage(path=paths[0][-1] + paths[1], identity='BENCHMARK')])
+    with open(paths[1], 'w') as f:
+        f.write('another image')
+    assert get_benchmark_id(images[:2]) != benchmark_id
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pytest
+
+from lr_face.intervals import confidence_intervals
+from lr_face.results import (ResultsWriter,
+                              METRIC_COLUMNS,
+                              read_results,
+                              list_runs,
+                              get_results_version)
+from tests.src.util import scratch_dir
+
+CONFIG_COLUMNS = ['scorers', 'calibrators', 'data']
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_results')
+
+
+def make_writer(scratch: str) -> ResultsWriter:
+    return ResultsWriter('run', CONFIG_COLUMNS, scratch, use_parquet=False)
+
+
+def make_config(i: int):
+    return {'scorers': 'Dummy', 'calibrators': 'logit', 'data': f'data_{i}'}
+
+
+def test_read_results_while_writing(scratch):
+    writer = make_writer(scratch)
+    writer.write(1, make_config(1), {'cllr': .5, 'auc': .9})
+    df = read_results('run', scratch)
+    assert len(df) == 1
+    assert df.loc[0, 'cllr'] == .5
+    assert np.isnan(df.loc[0, 'accuracy'])
+
+    writer.write(0, make_config(0), {'error': 'ValueError: failed'})
+    df = read_results('run', scratch)
+    assert list(df['index']) == [0, 1]
+    assert df.loc[0, 'error'] == 'ValueError: failed'
+    assert list_runs(scratch) == ['run']
+
+
+def test_read_results_keeps_last_row_per_experiment(scratch):
+    writer = make_writer(scratch)
+    writer.write(0, make_config(0), {'cllr': .5})
+    writer.write(0, make_config(0), {'cllr': .25})
+    df = read_results('run', scratch)
+    assert list(df['cllr']) == [.25]
+
+
+def test_read_results_expands_extra_metrics(scratch):
+    writer = make_writer(scratch)
+    writer.write(0, make_config(0), {'cllr': .5,
+                                     'cal_fraction_valid_a': np.float32(1)})
+    writer.write(1, make_config(1), {'cllr': .5})
+    df = read_results('run', scratch)
+    assert df.loc[0, 'cal_fraction_valid_a'] == 1
+    assert np.isnan(df.loc[1, 'cal_fraction_valid_a'])
+
+    # All rows have the same columns, whatever the metrics.
+    with open(writer.path) as f:
+        lines = f.read().splitlines()
+    assert len({line.count(',') for line in lines}) == 1
+    assert os.path.basename(writer.path) == \
+           'run_experiments_results.partial.csv'
+
+
+@pytest.mark.parametrize('use_parquet', [False, True])
+def test_results_version_changes_with_each_row(scratch, use_parquet):
+    if use_parquet:
+        pytest.importorskip('pyarrow')
+    writer = ResultsWriter('run', CONFIG_COLUMNS, scratch,
+                           use_parquet=use_parquet)
+    assert get_results_version('run', scratch) == 0
+    writer.write(0, make_config(0), {'cllr': .5})
+    # Pretend the first row was written a minute ago.
+    past = get_results_version('run', scratch) - 60 * 10 ** 9
+    for root, dirs, files in os.walk(scratch):
+        for name in dirs + files:
+            os.utime(os.path.join(root, name), ns=(past, past))
+    assert get_results_version('run', scratch) == past
+    writer.write(1, make_config(1), {'cllr': .5})
+    assert get_results_version('run', scratch) > past
+
+
+def test_confidence_intervals_are_metric_columns(scratch):
+    y = np.array([0, 1, 0, 1])
+    result = confidence_intervals(np.array([.1, .9, .3, .7]),
+                                  np.array([.5, 4., 1., 2.]), y, 10)
+    assert set(result) <= set(METRIC_COLUMNS)
+    writer = make_writer(scratch)
+    writer.write(0, make_config(0), {'cllr': .5, **result})
+    with open(writer.path) as f:
+        header = f.readline()
+    assert 'cllr_ci_low' in header.split(',')
+    df = read_results('run', scratch)
+    assert df.loc[0, 'cllr_ci_low'] == pytest.approx(result['cllr_ci_low'])
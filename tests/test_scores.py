@@ -0,0 +1,103 @@
+import os
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+import pytest
+
+from lr_face.data import DummyFaceImage, FacePair
+from lr_face.models import ScorerModel
+from lr_face.scores import ScoreIndex, ScoreFileProvider, ScoreCache, \
+    ScoreProvider
+from tests.src.util import scratch_dir
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_scores')
+
+
+@pytest.fixture
+def score_file(scratch) -> str:
+    path = os.path.join(scratch, 'results.txt')
+    with open(path, 'w') as f:
+        f.write('a.jpg;b.jpg;0.5\n'
+                'c.jpg;a.jpg;0.25\n'
+                'b.jpg;c.jpg\n'
+                'c.jpg;d.jpg;0\n')
+    return path
+
+
+class CountingProvider(ScoreProvider):
+    def __init__(self, provider: ScoreProvider):
+        self.provider = provider
+        self.num_scored = 0
+
+    def get_scores(self, pairs: List[FacePair]) -> np.ndarray:
+        self.num_scored += len(pairs)
+        return self.provider.get_scores(pairs)
+
+
+def make_pairs(paths: List[str]) -> List[FacePair]:
+    images = {path: DummyFaceImage(path, 'TEST') for path in set(paths)}
+    return [FacePair(images[a], images[b])
+            for a, b in zip(paths[::2], paths[1::2])]
+
+
+def test_lookup_is_symmetric(score_file):
+    index = ScoreIndex.from_files([score_file])
+    scores = index.lookup(['a.jpg', 'b.jpg', 'a.jpg'],
+                          ['b.jpg', 'a.jpg', 'c.jpg'])
+    assert scores.dtype == np.float32
+    assert scores.tolist() == [0.5, 0.5, 0.25]
+
+
+def test_lookup_of_missing_and_invalid_scores(score_file):
+    index = ScoreIndex.from_files([score_file])
+    scores = index.lookup(['b.jpg', 'c.jpg', 'a.jpg', 'x.jpg'],
+                          ['c.jpg', 'd.jpg', 'd.jpg', 'a.jpg'])
+    assert scores.tolist() == [-1, -1, -1, -1]
+
+
+def test_later_files_take_precedence(score_file, scratch):
+    other = os.path.join(scratch, 'other.txt')
+    with open(other, 'w') as f:
+        f.write('b.jpg;a.jpg;0.75\n')
+    index = ScoreIndex.from_files([score_file, other])
+    assert index.lookup(['a.jpg'], ['b.jpg']).tolist() == [0.75]
+    assert len(index) == 4
+
+
+def test_scorer_model_with_score_provider(score_file):
+    scorer = ScorerModel(None, ScoreFileProvider([score_file]))
+    pairs = make_pairs(['a.jpg', 'b.jpg', 'a.jpg', 'c.jpg', 'a.jpg', 'd.jpg'])
+    p = scorer.predict_proba(pairs)
+    assert p.shape == (3, 2)
+    assert p[:, 1].tolist() == [0.5, 0.25, -1]
+    assert scorer.predict_proba([]).shape == (0, 2)
+
+
+def test_score_cache_scores_each_pair_once(score_file):
+    provider = CountingProvider(ScoreFileProvider([score_file]))
+    cache = ScoreCache()
+    scorer = ScorerModel(SimpleNamespace(name='Test', tag=None),
+                         provider,
+                         cache)
+    pairs = make_pairs(['a.jpg', 'b.jpg', 'a.jpg', 'c.jpg', 'a.jpg', 'd.jpg'])
+
+    expected = ScorerModel(None, provider).predict_proba(pairs)
+    provider.num_scored = 0
+    assert np.array_equal(scorer.predict_proba(pairs), expected)
+    assert np.array_equal(scorer.predict_proba(pairs[1:] + pairs[:1]),
+                          np.concatenate([expected[1:], expected[:1]]))
+    assert provider.num_scored == 3
+    assert (cache.num_computed, cache.num_reused) == (3, 3)
+
+
+def test_score_cache_separates_scorers(score_file):
+    cache = ScoreCache()
+    pairs = make_pairs(['a.jpg', 'b.jpg'])
+    cache.get_scores('first', pairs, lambda x: np.array([[0.5, 0.5]]))
+    scores = cache.get_scores('second', pairs, lambda x: np.array([[1, 0]]))
+    assert scores.tolist() == [[1, 0]]
+    assert len(cache) == 2
@@ -0,0 +1,260 @@
+import os
+from dataclasses import replace
+
+import numpy as np
+import pytest
+from lir import LogitCalibrator, KDECalibrator
+
+from lr_face import attributes
+from lr_face.data import TestDataset, Dataset, DummyFaceImage, Yaw
+from lr_face.experiments import Experiment
+from lr_face.models import Architecture
+from lr_face.stages import (ArtifactStore,
+                            get_pairs_key,
+                            get_scores_key,
+                            get_calibration_key,
+                            get_evaluation_key,
+                            get_plots_key,
+                            resolve_stage_keys,
+                            explain)
+from tests.src.util import scratch_dir
+
+
+class AnnotatedDataset(Dataset):
+    """
+    A dataset of `num_images` images of which the first has yaw `yaw`.
+    Unlike other datasets, its images are not cached, so that tests can
+    change them.
+    """
+
+    def __init__(self, num_images: int = 4, directory: str = ''):
+        self.num_images = num_images
+        self.directory = directory
+        self.yaw = Yaw.FRONTAL
+
+    @property
+    def images(self):
+        return [DummyFaceImage(os.path.join(self.directory, f'{i}.jpg'),
+                               f'ID-{i % 2}',
+                               yaw=self.yaw if i == 0 else Yaw.FRONTAL)
+                for i in range(self.num_images)]
+
+
+def with_dataset(experiment: Experiment, dataset: Dataset) -> Experiment:
+    return replace(experiment, data_config={'calibration': (dataset,),
+                                            'test': (TestDataset(),)})
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_stages')
+
+
+@pytest.fixture
+def experiment() -> Experiment:
+    return Experiment(data_config={'calibration': (TestDataset(),),
+                                   'test': (TestDataset(),)},
+                      scorer='DummyScorer',
+                      calibrator=LogitCalibrator(),
+                      params={'calibration_filters': ['yaw']})
+
+
+@pytest.fixture
+def pair_paths():
+    return {'calibration': {('yaw',): [('a.jpg', 'b.jpg')]},
+            'test': {('yaw',): [('c.jpg', 'd.jpg')]}}
+
+
+@pytest.fixture
+def scores():
+    return {'calibration': {('yaw',): np.array([.1, .9])},
+            'test': {('yaw',): np.array([.2, .8])}}
+
+
+def test_get_or_compute_computes_once(scratch):
+    store = ArtifactStore(scratch)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'cllr': 0.5}
+
+    assert store.get_or_compute('evaluation', 'abc', compute) == {'cllr': 0.5}
+    assert store.get_or_compute('evaluation', 'abc', compute) == {'cllr': 0.5}
+    assert len(calls) == 1
+    assert ArtifactStore(scratch).has('evaluation', 'abc')
+    assert not ArtifactStore(scratch).has('scores', 'abc')
+
+
+def test_store_without_directory_always_computes():
+    store = ArtifactStore(None)
+    assert store.get_or_compute('scores', 'abc', lambda: 1) == 1
+    assert store.get_or_compute('scores', 'abc', lambda: 2) == 2
+    assert not store.has('scores', 'abc')
+
+
+def test_store_without_key_always_computes(scratch):
+    store = ArtifactStore(scratch)
+    assert store.get_or_compute('pairs', None, lambda: 1) == 1
+    assert store.get_or_compute('pairs', None, lambda: 2) == 2
+    assert not store.has('pairs', None)
+
+
+def test_changing_calibrator_only_changes_later_stages(experiment,
+                                                       pair_paths,
+                                                       scores):
+    other = replace(experiment, calibrator=KDECalibrator())
+    assert get_pairs_key(experiment, False, 'run') \
+        == get_pairs_key(other, False, 'run')
+    scores_key = get_scores_key(experiment, pair_paths)
+    assert scores_key == get_scores_key(other, pair_paths)
+    calibration_key = get_calibration_key(scores_key, scores,
+                                          experiment.calibrator)
+    other_calibration_key = get_calibration_key(scores_key, scores,
+                                                other.calibrator)
+    assert calibration_key != other_calibration_key
+    assert get_evaluation_key(calibration_key, scores) \
+        != get_evaluation_key(other_calibration_key, scores)
+
+
+def test_changing_scorer_keeps_pairs(experiment, pair_paths):
+    other = replace(experiment, scorer='OtherScorer')
+    assert get_pairs_key(experiment, False, 'run') \
+        == get_pairs_key(other, False, 'run')
+    assert get_scores_key(experiment, pair_paths) \
+        != get_scores_key(other, pair_paths)
+
+
+def test_generated_pairs_are_scoped_to_run(experiment):
+    assert get_pairs_key(experiment, False, None) is None
+    keys = {get_pairs_key(experiment, False, 'run'),
+            get_pairs_key(experiment, False, 'other run'),
+            get_pairs_key(replace(experiment, repeat=1), False, 'run')}
+    assert len(keys) == 3
+
+
+def test_scores_depend_on_pairs_and_images(experiment, pair_paths, scratch):
+    image = os.path.join(scratch, 'a.jpg')
+    with open(image, 'wb') as f:
+        f.write(b'face')
+    pair_paths['calibration'][('yaw',)] = [(image, 'b.jpg')]
+    key = get_scores_key(experiment, pair_paths)
+    assert key == get_scores_key(experiment, pair_paths)
+    with open(image, 'wb') as f:
+        f.write(b'another face')
+    assert get_scores_key(experiment, pair_paths) != key
+    pair_paths['test'][('yaw',)].append(('c.jpg', 'e.jpg'))
+    assert get_scores_key(experiment, pair_paths) != key
+
+
+def test_later_stages_depend_on_scores(experiment, scores):
+    calibration_key = get_calibration_key('scores', scores,
+                                          experiment.calibrator)
+    evaluation_key = get_evaluation_key(calibration_key, scores)
+    changed = {'calibration': {('yaw',): np.array([.1, .7])},
+               'test': scores['test']}
+    assert get_calibration_key('scores', changed, experiment.calibrator) \
+        != calibration_key
+    changed = {'calibration': scores['calibration'],
+               'test': {('yaw',): np.array([.2, .7])}}
+    assert get_evaluation_key(calibration_key, changed) != evaluation_key
+    assert get_evaluation_key(calibration_key, scores, intervals=10) \
+        != evaluation_key
+    assert get_plots_key(evaluation_key, None) is None
+
+
+def test_explain(experiment, pair_paths, scratch):
+    store = ArtifactStore(scratch)
+    store.save('pairs', get_pairs_key(experiment, False, 'run'), pair_paths)
+    first = resolve_stage_keys(experiment, store, False, 'run', 'plot')
+    second = resolve_stage_keys(
+        replace(experiment, calibrator=KDECalibrator()), store, False, 'run',
+        None)
+    explanation = explain([first, second], store, ['first', 'second'])
+    lines = explanation.splitlines()
+    assert lines[0] == 'first: pairs: cached, scores: RUN, ' \
+                       'calibration: RUN, evaluation: RUN, plots: RUN'
+    assert lines[1] == 'second: pairs: cached, scores: cached, ' \
+                       'calibration: RUN, evaluation: RUN, plots: skip'
+    assert 'scores: 1 to run, 1 cached' in lines
+
+
+def test_explain_does_not_load_models(experiment, pair_paths, scratch,
+                                      monkeypatch):
+    def get_model(architecture):
+        raise AssertionError(f'{architecture} was loaded')
+
+    monkeypatch.setattr(Architecture, 'get_model', get_model)
+    experiments = [replace(experiment, scorer=architecture.get_scorer_model())
+                   for architecture in [Architecture.DUMMY,
+                                        Architecture.FACEVACS]]
+    store = ArtifactStore(scratch)
+    store.save('pairs', get_pairs_key(experiment, False, 'run'), pair_paths)
+    keys = [resolve_stage_keys(experiment, store, False, 'run', None)
+            for experiment in experiments]
+    assert keys[0].scores != keys[1].scores
+    explanation = explain(keys, store, ['dummy', 'facevacs'])
+    assert 'scores: 2 to run, 0 cached' in explanation.splitlines()
+
+
+def test_resolve_stage_keys_follows_artifacts(experiment, pair_paths, scores,
+                                              scratch):
+    store = ArtifactStore(scratch)
+    pairs_key = get_pairs_key(experiment, False, 'run')
+    store.save('pairs', pairs_key, pair_paths)
+    scores_key = get_scores_key(experiment, pair_paths)
+    store.save('scores', scores_key, scores)
+    keys = resolve_stage_keys(experiment, store, False, 'run', 'plot')
+    calibration_key = get_calibration_key(scores_key, scores,
+                                          experiment.calibrator)
+    evaluation_key = get_evaluation_key(calibration_key, scores)
+    assert keys.pairs == pairs_key
+    assert keys.scores == scores_key
+    assert keys.calibration == calibration_key
+    assert keys.evaluation == evaluation_key
+    assert keys.plots == get_plots_key(evaluation_key, 'plot')
+
+
+def test_pairs_depend_on_dataset_arguments(experiment):
+    keys = [get_pairs_key(with_dataset(experiment, dataset), False, 'run')
+            for dataset in [AnnotatedDataset(), AnnotatedDataset(5)]]
+    assert keys[0] != keys[1]
+
+
+@pytest.mark.parametrize('pairs_from_file', [False, True])
+def test_pairs_depend_on_annotations(experiment, pairs_from_file):
+    dataset = AnnotatedDataset()
+    experiment = with_dataset(experiment, dataset)
+    key = get_pairs_key(experiment, pairs_from_file, 'run')
+    assert get_pairs_key(experiment, pairs_from_file, 'run') == key
+    dataset.yaw = Yaw.PROFILE
+    assert get_pairs_key(experiment, pairs_from_file, 'run') != key
+
+
+def test_pairs_depend_on_attribute_versions(experiment, monkeypatch):
+    experiment = with_dataset(
+        replace(experiment, params={'calibration_filters': ['quality_score']}),
+        AnnotatedDataset())
+    monkeypatch.setitem(attributes.ATTRIBUTE_VERSIONS, 'quality_score',
+                        lambda: 'first')
+    key = get_pairs_key(experiment, True, None)
+    monkeypatch.setitem(attributes.ATTRIBUTE_VERSIONS, 'quality_score',
+                        lambda: 'second')
+    assert get_pairs_key(experiment, True, None) != key
+
+
+def test_pairs_depend_on_images_of_derived_attributes(experiment, scratch):
+    dataset = AnnotatedDataset(directory=scratch)
+    for image in dataset.images:
+        with open(image.path, 'wb') as f:
+            f.write(b'face')
+    by_yaw = with_dataset(experiment, dataset)
+    by_resolution = with_dataset(
+        replace(experiment, params={'calibration_filters': ['resolution_bin']}),
+        dataset)
+    keys = [get_pairs_key(e, True, None) for e in [by_yaw, by_resolution]]
+    with open(dataset.images[0].path, 'wb') as f:
+        f.write(b'another face')
+    # Only the derived attribute depends on the image file itself.
+    assert get_pairs_key(by_yaw, True, None) == keys[0]
+    assert get_pairs_key(by_resolution, True, None) != keys[1]
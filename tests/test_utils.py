@@ -1,7 +1,9 @@
+import os
+import socket
 from collections import defaultdict
 from typing import Tuple, Dict
 
-from lr_face.utils import cache
+from lr_face.utils import cache, get_tmp_path
 
 
 def test_cache():
@@ -129,3 +131,9 @@ def test_cache_with_class_methods():
     assert instance3.counter[(2, 3)] == 0
     instance3.multiply(2, 3)
     assert instance3.counter[(2, 3)] == 0
+
+
+def test_tmp_path_is_unique_per_machine_and_process():
+    tmp_path = get_tmp_path(os.path.join('output', 'results.obj'))
+    assert tmp_path.startswith(os.path.join('output', 'results.obj.'))
+    assert f'{socket.gethostname()}-{os.getpid()}' in tmp_path
@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from lr_face.parallel import TaskFailure
+from lr_face.work_queue import WorkQueue, work
+from tests.src.util import scratch_dir
+
+
+def square_slowly(task: int) -> int:
+    if task < 0:
+        raise ValueError(f'Negative task: {task}')
+    time.sleep(.01)
+    return task ** 2
+
+
+def start_worker(directory: str):
+    work(WorkQueue(directory), square_slowly, poll_interval=.01)
+
+
+@pytest.fixture()
+def scratch():
+    yield from scratch_dir('scratch/test_work_queue')
+
+
+def test_workers_perform_each_task_once(scratch):
+    queue = WorkQueue(scratch)
+    for i in range(40):
+        queue.put(i, i)
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=start_worker, args=(scratch,))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+    assert queue.is_done()
+    assert queue.get_results() == {i: i ** 2 for i in range(40)}
+
+
+def test_claims_are_exclusive(scratch):
+    queue = WorkQueue(scratch)
+    queue.put(0, 'task')
+    claim = queue.claim('a')
+    assert claim.task == 'task'
+    assert queue.claim('b') is None
+    assert not queue.is_done()
+    queue.complete(claim, 'result')
+    assert queue.is_done()
+    assert queue.get_results() == {0: 'result'}
+    assert queue.get_results(ignore=[0]) == {}
+
+
+def test_stale_claims_are_released(scratch):
+    queue = WorkQueue(scratch, lease_timeout=.2)
+    queue.put(0, 3)
+    claim = queue.claim('dead')
+    assert queue.release_stale() == []
+    time.sleep(.5)
+    assert queue.release_stale() == [0]
+    assert not queue.renew(claim)
+
+    # Another worker takes over the task.
+    assert work(queue, square_slowly, worker_id='alive') == 1
+    assert queue.get_results() == {0: 9}
+
+
+def test_failing_task_gets_task_failure(scratch):
+    queue = WorkQueue(scratch)
+    queue.put(0, -1)
+    queue.put(1, 2)
+    assert work(queue, square_slowly) == 2
+    results = queue.get_results()
+    assert isinstance(results[0], TaskFailure)
+    assert 'Negative task: -1' in str(results[0])
+    assert results[1] == 4
+    assert not os.listdir(os.path.join(scratch, 'claimed'))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Updates the calibrators of an LR system saved by `run.py` (in
+`output/<run>/lr_systems/<index>.obj`) with the scores of new calibration
+pairs, without rescoring the pairs they were fitted on before. This needs an
+incremental calibrator, such as 'incremental_logit' or 'incremental_KDE'.
+
+The new scores are read from CSV files with a row per pair and (at least)
+the columns `category`, `y` (1 for pairs of the same identity, 0 otherwise)
+and `score`, like the pair tables saved by the evaluation. Invalid scores
+(-1, where no face was found on one of the images) are skipped.
+"""
+import argparse
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from lr_face.lr_systems import update_lr_system
+
+
+def read_scores(paths: List[str]) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Returns the valid scores and labels per category in the CSV files at
+    `paths`.
+
+    :param paths: List[str]
+    :return: Dict[str, Tuple[np.ndarray, np.ndarray]]
+    """
+    table = pd.concat([pd.read_csv(path, usecols=['category', 'y', 'score'])
+                       for path in paths])
+    table = table[table['score'] != -1]
+    return {category: (rows['score'].to_numpy(dtype=float),
+                       rows['y'].to_numpy(dtype=int))
+            for category, rows in table.groupby('category', sort=False)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('lr_system', help='path of the LR system to update')
+    parser.add_argument('scores', nargs='+',
+                        help='CSV files with the scores of the new pairs')
+    parser.add_argument('--output', '-o', default=None,
+                        help='where to save the updated LR system, instead '
+                             'of overwriting it')
+    args = parser.parse_args()
+
+    data = read_scores(args.scores)
+    update_lr_system(args.lr_system, data, args.output)
+    for category, (X, y) in data.items():
+        print(f'{category}: added {np.sum(y == 1)} same-identity and '
+              f'{np.sum(y == 0)} different-identity pairs')
+    print(f'Saved the updated LR system to {args.output or args.lr_system}')